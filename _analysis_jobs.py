@@ -0,0 +1,82 @@
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+WORKERS = 2  # Analyses running at once; the rest wait in the queue
+JOB_RETENTION = 3600  # Seconds a finished job can still be polled
+
+# AI analyses run in the background for the web app's /analyze_stock. submit() returns at
+# once with a job the page polls through get(); a ticker and risk tolerance already queued or
+# running get that job back instead of a second OpenAI call. run(ticker, risk_tolerance) does the
+# work and returns the analysis text.
+class AnalysisJobs:
+    def __init__(self, run, workers=WORKERS, retention=JOB_RETENTION):
+        self.run = run
+        self.retention = retention
+        self._jobs = {}  # job id -> job
+        self._active = {}  # (ticker, risk_tolerance) -> id of its queued or running job
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='analysis')
+        self._stats = {'submitted': 0, 'deduplicated': 0, 'completed': 0, 'failed': 0}
+
+    def submit(self, ticker, risk_tolerance):
+        with self._lock:
+            self._prune()
+            job_id = self._active.get((ticker, risk_tolerance))
+            if job_id is not None:
+                self._stats['deduplicated'] += 1
+                return dict(self._jobs[job_id])
+            job = {
+                "job_id": uuid.uuid4().hex,
+                "ticker": ticker,
+                "risk_tolerance": risk_tolerance,
+                "status": "queued",
+                "submitted": time.time(),
+                "finished": None,
+                "timestamp": None,
+                "analysis": None
+            }
+            self._jobs[job["job_id"]] = job
+            self._active[(ticker, risk_tolerance)] = job["job_id"]
+            self._stats['submitted'] += 1
+            self._executor.submit(self._run, job["job_id"])
+            return dict(job)
+
+    # The job as it is now, None for unknown or expired ids
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _run(self, job_id):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["status"] = "running"
+            ticker, risk_tolerance = job["ticker"], job["risk_tolerance"]
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            analysis = self.run(ticker, risk_tolerance)
+            status = "done"
+        except Exception as e:
+            print(f"Error analyzing {ticker}: {e}")
+            analysis = str(e)
+            status = "error"
+        with self._lock:
+            job.update({"status": status, "analysis": analysis, "timestamp": timestamp, "finished": time.time()})
+            self._active.pop((ticker, risk_tolerance), None)
+            self._stats['completed' if status == "done" else 'failed'] += 1
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items() if job["finished"] and job["finished"] < cutoff]:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            statuses = [job["status"] for job in self._jobs.values()]
+        stats['queued'] = statuses.count("queued")
+        stats['running'] = statuses.count("running")
+        return stats
@@ -0,0 +1,126 @@
+import os
+import json
+import math
+import time
+import hashlib
+import numpy as np
+import pandas as pd
+import _app_constants
+
+# The data of an AI analysis (app.fetch_stock_data) condensed for the prompt: tables become
+# {"columns": [...], "rows": [[...]]} of their latest rows without empty columns, numbers keep
+# SIGNIFICANT_DIGITS, and lists and texts are cut short. The detail goes down a level at a
+# time (fewer news items, older statement periods and shorter texts), then whole sections
+# are left out in DROP_ORDER, until the payload fits PROMPT_TOKEN_BUDGET. The sections left
+# out are listed under "omitted".
+PROMPT_TOKEN_BUDGET = 6000
+CHARS_PER_TOKEN = 4  # Estimate for JSON of English text and numbers
+SIGNIFICANT_DIGITS = 4
+# Table rows (statement periods), list items (news) and text characters kept per level
+DETAIL_LEVELS = [
+    {'rows': 5, 'items': 10, 'text': 400},
+    {'rows': 4, 'items': 6, 'text': 200},
+    {'rows': 2, 'items': 4, 'text': 120},
+    {'rows': 1, 'items': 3, 'text': 80}
+]
+# Lowest priority first; sections missing here go after them, CORE_SECTIONS are always kept
+DROP_ORDER = ('news', 'recommendations', 'earnings', 'cashflow', 'balance_sheet', 'income_statement',
+              'summary_profile', 'analyst_ratings', 'summary_detail')
+CORE_SECTIONS = ('current_price', 'moving_averages', 'financials')
+DROPPED_COLUMNS = ('symbol', 'link', 'currencyCode')
+# Reports by the hash of their payload and risk tolerance, in DATA_PATH
+REPORTS_DIRECTORY = 'Analysis_Reports'
+REPORT_RETENTION_DAYS = 30
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def condense_number(value):
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    value = float(value)
+    if not math.isfinite(value):
+        return None
+    if value == 0 or value.is_integer() and abs(value) < 10 ** SIGNIFICANT_DIGITS:
+        return int(value)
+    return float(f"{value:.{SIGNIFICANT_DIGITS}g}")
+
+def condense_table(table, level):
+    table = table.reset_index()
+    table = table.drop(columns=[column for column in DROPPED_COLUMNS if column in table.columns])
+    table = table.dropna(axis=1, how='all')
+    if 'asOfDate' in table.columns:
+        table = table.sort_values('asOfDate', kind='stable')
+    table = table.tail(level['rows'])
+    return {
+        "columns": [str(column) for column in table.columns],
+        "rows": [[condense(value, level) for value in row] for row in table.itertuples(index=False)]
+    }
+
+def condense(value, level):
+    if isinstance(value, pd.DataFrame):
+        return condense_table(value, level)
+    if isinstance(value, pd.Series):
+        return condense(value.to_dict(), level)
+    if isinstance(value, dict):
+        condensed = {str(key): condense(item, level) for key, item in value.items()}
+        return {key: item for key, item in condensed.items() if item not in (None, {}, [], '')}
+    if isinstance(value, (list, tuple)):
+        return [condense(item, level) for item in value[:level['items']]]
+    if isinstance(value, (int, float, np.number, np.bool_)):
+        return condense_number(value)
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, (pd.Timestamp, np.datetime64)) or hasattr(value, 'isoformat'):
+        return str(value)[:19]
+    text = ' '.join(str(value).split())
+    return text if len(text) <= level['text'] else text[:level['text']] + '...'
+
+# Compact JSON text of the analysis data, at most budget tokens by estimate_tokens. Raises
+# ValueError only when CORE_SECTIONS alone do not fit.
+def build_payload(stock_data, budget=PROMPT_TOKEN_BUDGET):
+    for level in DETAIL_LEVELS:
+        payload = condense(stock_data, level)
+        text = json.dumps(payload, separators=(',', ':'))
+        if estimate_tokens(text) <= budget:
+            return text
+    optional = [section for section in DROP_ORDER if section in payload]
+    optional += sorted(section for section in payload if section not in optional and section not in CORE_SECTIONS)
+    omitted = []
+    for section in optional:
+        payload.pop(section)
+        omitted.append(section)
+        payload['omitted'] = omitted
+        text = json.dumps(payload, separators=(',', ':'))
+        if estimate_tokens(text) <= budget:
+            print(f"Analysis payload left out {', '.join(omitted)} to fit the budget of {budget} tokens")
+            return text
+    print(f"Analysis payload of {estimate_tokens(text)} tokens is over the budget of {budget}")
+    raise ValueError(f"Analysis data does not fit in {budget} prompt tokens")
+
+def report_key(ticker, risk_tolerance, payload):
+    return hashlib.sha256(f"{ticker}\n{risk_tolerance}\n{payload}".encode('utf-8')).hexdigest()
+
+def get_report_path(key):
+    return os.path.join(_app_constants.DATA_PATH, REPORTS_DIRECTORY, f"{key}.txt")
+
+# The report written for the same payload and risk tolerance, None when there is none
+def read_report(key):
+    try:
+        with open(get_report_path(key), 'r') as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+def write_report(key, report):
+    path = get_report_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        file.write(report)
+    # Old reports will not be asked for again, their news has changed
+    cutoff = time.time() - REPORT_RETENTION_DAYS * 86400
+    for entry in os.scandir(os.path.dirname(path)):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
@@ -1,6 +1,12 @@
 from datetime import time
 
 DATA_PATH = 'stock_data'
+# 'sqlite' keeps the stock_data documents in DATABASE_FILE, 'json' in one file per document
+STORAGE_BACKEND = 'sqlite'
+DATABASE_FILE = 'stock_data.db'
+SCORE_INDEX_FILE = 'score_index.jsonl'  # Score index of the 'json' backend
+TIMINGS_FILE = 'timings.jsonl'  # Stage timing spans of the data pipeline, see _timing
+BAR_DATA_PATH = 'bar_data'
 SCHWAB_CSV_PATH = '../'
 # Define market hours
 MARKET_OPEN = time(9, 30)
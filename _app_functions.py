@@ -3,118 +3,43 @@ import os
 import json
 import feedparser
 import _app_constants
+import _data_store
+import _quote_cache
+import _market_calendar
+import math
 import time
-import pytz
 import _app_constants
 from datetime import datetime, timedelta
-import pandas as pd
 import _app_constants
 
-def calculate_trade_duration(start, end, min_time=0):
-    # ENSURE START AND END ARE LOCALIZED TO EASTERN TIME (EST)
-    eastern = pytz.timezone('US/Eastern')
-    if start.tzinfo is None:
-        start = eastern.localize(start)
-    else:
-        start = start.astimezone(eastern)
-    
-    if end.tzinfo is None:
-        end = eastern.localize(end)
-    else:
-        end = end.astimezone(eastern)
-
-    # If start and end are on the same day
-    if start.date() == end.date():
-        duration = (min(end, end.replace(hour=_app_constants.MARKET_CLOSE.hour, minute=_app_constants.MARKET_CLOSE.minute)) - 
-                    max(start, start.replace(hour=_app_constants.MARKET_OPEN.hour, minute=_app_constants.MARKET_OPEN.minute))).total_seconds()
-        return max(duration, min_time)
-    
-    # Calculate duration for the first day
-    first_day_duration = (start.replace(hour=_app_constants.MARKET_CLOSE.hour, minute=_app_constants.MARKET_CLOSE.minute) - 
-                          max(start, start.replace(hour=_app_constants.MARKET_OPEN.hour, minute=_app_constants.MARKET_OPEN.minute))).total_seconds()
-    
-    # Calculate duration for the last day
-    last_day_duration = (min(end, end.replace(hour=_app_constants.MARKET_CLOSE.hour, minute=_app_constants.MARKET_CLOSE.minute)) - 
-                         end.replace(hour=_app_constants.MARKET_OPEN.hour, minute=_app_constants.MARKET_OPEN.minute)).total_seconds()
-    
-    # Calculate full business days in between
-    business_days = pd.bdate_range(start=start + timedelta(days=1), end=end - timedelta(days=1)).size
-    
-    # Calculate total duration
-    total_duration = first_day_duration + last_day_duration + (business_days * (_app_constants.MARKET_CLOSE.hour - _app_constants.MARKET_OPEN.hour) * 3600)
-    return max(total_duration, min_time)
-
 def calculate_trade_metrics(ticker):
     # Load JSON data
-    file_path = os.path.join(_app_constants.DATA_PATH, f'{ticker}_Chart_1Mo_5Mi.json')
-    # Check if the file exists
-    if not os.path.exists(file_path):
-        return {
-            "shortest_trade_duration": 0,
-            "average_trade_duration": 0,
-            "longest_trade_duration": 0,
-            "shortest_trade_interval": 0,
-            "average_trade_interval": 0,
-            "longest_trade_interval": 0
-        }
-
-    # Load JSON data
-    with open(file_path, 'r') as file:
-        data = json.load(file)
+    data = _data_store.read_document(ticker, 'Chart_1Mo_5Mi')
+    # Check if the document exists
+    if data is None:
+        return _market_calendar.trade_metrics([])
 
     trades = data.get(ticker, {}).get("trades", [])
     
-    file_path = os.path.join(_app_constants.DATA_PATH, f'{ticker}_Chart_6Mo_1Hr.json')
-    if os.path.exists(file_path):
-        with open(file_path, 'r') as file:
-            data = json.load(file)
+    data = _data_store.read_document(ticker, 'Chart_6Mo_1Hr')
+    if data is not None:
         trades = data.get(ticker, {}).get("trades", [])
-
-    # Convert trade timestamps to pandas DataFrame
-    trades_df = pd.DataFrame(trades)
-    trades_df['buy_timestamp'] = pd.to_datetime(trades_df['buy_timestamp'], utc=True).dt.tz_convert('US/Eastern')
-    trades_df['sell_timestamp'] = pd.to_datetime(trades_df['sell_timestamp'], utc=True).dt.tz_convert('US/Eastern')
-
-    # GET THE CURRENT TIMESTAMP AND CONVERT IT TO THE CORRECT TIMEZONE
-    current_timestamp = pd.Timestamp.now(tz='UTC').tz_convert('UTC-04:00')  # ADDED THIS LINE
-
-    # SET SELL_TIMESTAMP TO NOW FOR TRADES MISSING SELL_TIMESTAMP
-    trades_df['sell_timestamp'].fillna(current_timestamp, inplace=True)  # MODIFIED THIS LINE
-
-    # Calculate trade durations in market hours
-    trades_df['trade_duration'] = trades_df.apply(lambda row: calculate_trade_duration(row['buy_timestamp'], row['sell_timestamp'], 86400), axis=1)
-
-    # Calculate intervals between trades
-    if len(trades) > 1:
-        trades_df = trades_df.sort_values(by='buy_timestamp')
-        trades_df['previous_sell_timestamp'] = trades_df['sell_timestamp'].shift(1)
-        trades_df = trades_df.dropna(subset=['previous_sell_timestamp'])
-        trades_df['trade_interval'] = trades_df.apply(lambda row: calculate_trade_duration(row['previous_sell_timestamp'], row['buy_timestamp']), axis=1)
-
-    # Calculate metrics
-    if not trades_df.empty:
-        shortest_trade_duration = trades_df['trade_duration'].min()
-        average_trade_duration = trades_df['trade_duration'].mean()
-        longest_trade_duration = trades_df['trade_duration'].max()
-        if len(trades) > 1:
-            shortest_trade_interval = trades_df['trade_interval'].min()
-            average_trade_interval = trades_df['trade_interval'].mean()
-            longest_trade_interval = trades_df['trade_interval'].max()
-        else:
-            shortest_trade_interval = average_trade_interval = longest_trade_interval = 0
-
-    else:
-        shortest_trade_duration = average_trade_duration = longest_trade_duration = 0
-        shortest_trade_interval = average_trade_interval = longest_trade_interval = 0
-
-    return {
-        "shortest_trade_duration": shortest_trade_duration,
-        "average_trade_duration": average_trade_duration,
-        "longest_trade_duration": longest_trade_duration,
-        "shortest_trade_interval": shortest_trade_interval,
-        "average_trade_interval": average_trade_interval,
-        "longest_trade_interval": longest_trade_interval
-    }
+    return _market_calendar.trade_metrics(trades)
+
+# The trade metrics analyze_chart stored with the chart, or calculate_trade_metrics for
+# charts written without them. memo (a dict kept for one request) saves recalculating
+# them for symbols with several orders.
+def get_trade_metrics(ticker, memo=None):
+    if memo is not None and ticker in memo:
+        return memo[ticker]
+    trade_metrics = None
+    if _data_store.get_updated(ticker, 'Chart_6Mo_1Hr') is None:
+        trade_metrics = _data_store.read_field(ticker, 'Chart_1Mo_5Mi', 'trade_metrics')
+    if trade_metrics is None:
+        trade_metrics = calculate_trade_metrics(ticker)
+    if memo is not None:
+        memo[ticker] = trade_metrics
+    return trade_metrics
 
 def fetch_news_from_rss(ticker):
     rss_url = f"https://finance.yahoo.com/rss/headline?s={ticker}"
@@ -132,18 +57,15 @@ def fetch_news_from_rss(ticker):
     return news_items
 
 def ai_trade_status(ticker, default = True):
-    details_file = os.path.join(_app_constants.DATA_PATH, f"{ticker}_Details.json")
+    details = _data_store.read_totals(ticker, 'Details')
     analysis_file = os.path.join(_app_constants.DATA_PATH, f"{ticker}_Analysis.json")
 
     # Check if details file exists
-    if (not os.path.exists(details_file) and os.path.exists(analysis_file) and (datetime.now() - datetime.fromtimestamp(os.path.getmtime(analysis_file))).days > 30) or not os.path.exists(analysis_file):
+    if (details is None and os.path.exists(analysis_file) and (datetime.now() - datetime.fromtimestamp(os.path.getmtime(analysis_file))).days > 30) or not os.path.exists(analysis_file):
         return default  # Proceed with trade since we lack information
 
-    # Load the details file and get the latest earnings date
-    with open(details_file, 'r') as f:
-        details_data = json.load(f)
-
-    earnings_dates = details_data[ticker]['totals'].get('calendarEvents', {}).get('earnings', {}).get('earningsDate', [])
+    # Get the latest earnings date from the details
+    earnings_dates = (details or {}).get('calendarEvents', {}).get('earnings', {}).get('earningsDate', [])
 
     if not earnings_dates:
         latest_earnings_date = datetime.now() + timedelta(days=60)
@@ -158,6 +80,7 @@ def ai_trade_status(ticker, default = True):
         return default  # Proceed with trade since the analysis file is outdated
 
     # Load the analysis file and check for the phrase 'Don't Trade'
+    _data_store.count_read('ai_trade_status', 'Analysis')
     with open(analysis_file, 'r') as f:
         analysis_data = f.read()
 
@@ -211,28 +134,17 @@ def load_history(history_file):
     return {}
 
 def calculate_estimated_completion_time(trade_metrics, listed_date):
-    # CONVERT LISTED_DATE FROM EPOCH TO DATETIME WITH TIMEZONE INFORMATION
-    listed_date = pd.to_datetime(listed_date, unit='s').tz_localize('UTC')
-    
     # Get the longest trade duration in seconds
     longest_trade_duration = trade_metrics['average_trade_duration']
     
     # Convert the longest trade duration from seconds to business hours and round up to the nearest hour
-    total_business_hours = longest_trade_duration / 3600
-    total_business_hours = int(total_business_hours) if total_business_hours.is_integer() else int(total_business_hours) + 1
+    total_business_hours = math.ceil(longest_trade_duration / 3600)
     
-    # Define custom business hours
-    business_hours = pd.offsets.CustomBusinessHour(start=_app_constants.MARKET_OPEN.strftime('%H:%M'), 
-                                                   end=_app_constants.MARKET_CLOSE.strftime('%H:%M'))
-    
-    # Calculate the estimated completion date by adding business hours to the listed date
-    estimated_completion_date = listed_date + (business_hours * total_business_hours)
-    # ENSURE TIMEZONE CONSISTENCY
-    estimated_completion_date = estimated_completion_date.tz_convert(listed_date.tzinfo)
+    # Calculate the estimated completion date by adding market hours to the listed date
+    estimated_completion_date = _market_calendar.add_market_hours(float(listed_date), total_business_hours)
     
     # Calculate the remaining duration from now until the estimated completion date
-    current_epoch_time = pd.Timestamp.now().timestamp()
-    remaining_duration = estimated_completion_date.timestamp() - current_epoch_time
+    remaining_duration = float(estimated_completion_date) - time.time()
     
     # Convert the remaining duration to a timedelta object
     remaining_timedelta = timedelta(seconds=remaining_duration)
@@ -254,39 +166,6 @@ def save_history(history,history_file):
     with open(history_file, "w") as file:
         json.dump(history, file)
 
+# (mark, age in seconds) of symbol from the quote cache shared with app.py
 def get_current_mark(symbol,lookup = True):
-    global price_cache
-    # Check if the price is cached and still valid
-    if symbol in price_cache:
-        cached_price, timestamp = price_cache[symbol]
-        age_seconds = time.time() - timestamp
-        if age_seconds < CACHE_DURATION or not lookup:
-            return cached_price, age_seconds
-    try:
-        # Fetch the current price from Yahoo Finance
-        stock = yf.Ticker(symbol)
-        try:
-            current_price = stock.history(period='1d',interval='1m',prepost=True)['Close'].iloc[-1]
-        except:
-            current_price = stock.history(period='1d',prepost=True)['Close'].iloc[-1]
-
-        # Check if the new price is the same as the cached price
-        if symbol in price_cache and price_cache[symbol][0] == current_price:
-            cached_price, timestamp = price_cache[symbol]
-            age_seconds = time.time() - timestamp
-            price_cache[symbol] = (current_price, time.time() + CACHE_DURATION)
-            return cached_price, CACHE_DURATION 
-
-        # Cache the price if different
-        price_cache[symbol] = (current_price, time.time())
-        return current_price, 0
-
-    except Exception as e:
-        # If there is an error, return the cached price with the age
-        if symbol in price_cache:
-            cached_price, timestamp = price_cache[symbol]
-            age_seconds = time.time() - timestamp
-            return cached_price, age_seconds
-        else:
-            # If no cached price exists, raise the exception
-            raise e
\ No newline at end of file
+    return _quote_cache.quote_cache.get_mark(symbol, lookup=lookup)
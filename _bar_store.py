@@ -0,0 +1,136 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+import _app_constants
+
+# One memory-mapped .npy file of OHLCV bars per ticker and interval
+BAR_DTYPE = np.dtype([
+    ('time', 'i8'),  # Bar start, nanoseconds since the epoch (UTC)
+    ('open', 'f8'),
+    ('high', 'f8'),
+    ('low', 'f8'),
+    ('close', 'f8'),
+    ('volume', 'i8')
+])
+BAR_TIMEZONE = 'America/New_York'
+INTRADAY_RETENTION_DAYS = 60  # Yahoo only serves 60 days of intraday bars anyway
+REFRESH_MINUTES = 5  # Bars stored less than this many minutes ago are used without fetching
+
+PERIOD_OFFSETS = {
+    '1d': pd.DateOffset(days=1),
+    '5d': pd.DateOffset(days=5),
+    '1mo': pd.DateOffset(months=1),
+    '3mo': pd.DateOffset(months=3),
+    '6mo': pd.DateOffset(months=6),
+    '1y': pd.DateOffset(years=1),
+    '2y': pd.DateOffset(years=2),
+    '5y': pd.DateOffset(years=5),
+    '10y': pd.DateOffset(years=10)
+}
+
+def is_intraday(interval):
+    return (interval.endswith('m') and not interval.endswith('mo')) or interval.endswith('h')
+
+def get_store_path(ticker, interval):
+    directory = os.path.join(os.path.dirname(__file__), _app_constants.BAR_DATA_PATH)
+    return os.path.join(directory, f"{ticker}_{interval}.npy")
+
+def read_bars(ticker, interval):
+    path = get_store_path(ticker, interval)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode='r')
+
+# Write to a temporary file and swap it in, readers holding the old memory map keep their copy
+def write_bars(ticker, interval, bars):
+    path = get_store_path(ticker, interval)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as file:
+        np.save(file, bars)
+    os.replace(temp_path, path)
+
+def frame_to_bars(data):
+    if data is None or data.empty:
+        return np.zeros(0, dtype=BAR_DTYPE)
+    index = data.index
+    if index.tz is None:
+        index = index.tz_localize(BAR_TIMEZONE)
+    bars = np.zeros(len(data), dtype=BAR_DTYPE)
+    bars['time'] = index.tz_convert('UTC').as_unit('ns').asi8
+    for column in ['Open', 'High', 'Low', 'Close']:
+        bars[column.lower()] = data[column].to_numpy(dtype=np.float64)
+    bars['volume'] = data['Volume'].fillna(0).to_numpy(dtype=np.int64)
+    return bars
+
+def bars_to_frame(bars):
+    index = pd.DatetimeIndex(pd.to_datetime(np.asarray(bars['time']), utc=True)).tz_convert(BAR_TIMEZONE)
+    return pd.DataFrame({
+        'Open': np.asarray(bars['open']),
+        'High': np.asarray(bars['high']),
+        'Low': np.asarray(bars['low']),
+        'Close': np.asarray(bars['close']),
+        'Volume': np.asarray(bars['volume'])
+    }, index=index)
+
+# Restrict a frame to a Yahoo style period ('1mo', '1y', 'max', ...) ending now
+def slice_period(data, period):
+    if period in PERIOD_OFFSETS:
+        return data[data.index >= pd.Timestamp.now(tz=BAR_TIMEZONE) - PERIOD_OFFSETS[period]]
+    if period == 'ytd':
+        return data[data.index.year == pd.Timestamp.now(tz=BAR_TIMEZONE).year]
+    return data
+
+# Append newly fetched bars to the stored ones. The fetch starts at the second to last
+# stored bar: the last one may have been partial and is replaced, the one before it must
+# come back unchanged, otherwise the history was adjusted (split, dividend) or the bars
+# have shifted, and the caller has to fetch everything again. Returns None in that case,
+# also when the fetch does not contain that bar at all.
+def merge_bars(stored, fetched):
+    if len(fetched) == 0:
+        return stored
+    if len(stored) > 1:
+        overlap = np.flatnonzero(fetched['time'] == stored['time'][-2])
+        if len(overlap) == 0:
+            return None
+        previous = stored[-2]
+        current = fetched[overlap[0]]
+        for column in ['open', 'high', 'low', 'close']:
+            if not np.isclose(previous[column], current[column], rtol=1e-6, equal_nan=True):
+                return None
+    kept = stored[stored['time'] < fetched['time'][0]]
+    return np.concatenate([kept, fetched])
+
+# Bars of ticker/interval as a DataFrame, served from the store and topped up with fetch.
+# fetch(start) returns a DataFrame of bars from start onwards, or the full history when
+# start is None.
+def load_bars(ticker, interval, fetch, refresh_minutes=REFRESH_MINUTES):
+    path = get_store_path(ticker, interval)
+    stored = read_bars(ticker, interval)
+    if stored is not None and len(stored) and (time.time() - os.path.getmtime(path)) / 60 < refresh_minutes:
+        return bars_to_frame(stored)
+
+    bars = None
+    fetched = np.zeros(0, dtype=BAR_DTYPE)
+    if stored is not None and len(stored) > 1:
+        start = pd.Timestamp(int(stored['time'][-2]), tz='UTC').tz_convert(BAR_TIMEZONE)
+        fetched = frame_to_bars(fetch(start))
+        bars = merge_bars(stored, fetched)
+    if bars is None:
+        fetched = frame_to_bars(fetch(None))
+        bars = fetched
+        if len(bars) == 0 and stored is not None:
+            bars = np.asarray(stored)
+
+    if is_intraday(interval) and len(bars):
+        cutoff = pd.Timestamp.now(tz='UTC') - pd.Timedelta(days=INTRADAY_RETENTION_DAYS)
+        bars = bars[bars['time'] >= cutoff.value]
+    # The store's mtime says when the source was last checked: a failed or empty fetch
+    # leaves it alone so the next call tries again, an unchanged one only touches it
+    if stored is None or bars.tobytes() != np.asarray(stored).tobytes():
+        if len(bars):
+            write_bars(ticker, interval, bars)
+    elif len(fetched):
+        os.utime(path)
+    return bars_to_frame(bars)
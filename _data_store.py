@@ -0,0 +1,421 @@
+import os
+import json
+import fcntl
+import time
+import sqlite3
+import argparse
+import threading
+import _app_constants
+
+# Documents are {ticker: {"triggers": [...], "trades": [...], "totals": {...}}} stored per ticker
+# and kind (Chart_1Mo_5Mi, Overall_Trend, Details, SEC_Info), either as one JSON file each in
+# stock_data/ or as rows of one SQLite database selected by _app_constants.STORAGE_BACKEND
+MISSING_AGE = 9999999999  # Same age _file_functions.get_file_age_in_minutes gives missing files
+MIRROR_JSON = False  # With the sqlite backend, also write every document to its JSON file
+# Kinds whose totals are also kept in the score index, so ranking reads them in one go
+SCORE_KINDS = ('Overall_Trend', 'Chart_1Mo_5Mi')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    ticker TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    document TEXT NOT NULL,
+    totals TEXT NOT NULL,
+    score REAL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (ticker, kind)
+);
+CREATE INDEX IF NOT EXISTS documents_kind ON documents (kind, score);
+CREATE INDEX IF NOT EXISTS documents_updated ON documents (updated);
+CREATE TABLE IF NOT EXISTS scores (
+    kind TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    totals TEXT NOT NULL,
+    PRIMARY KEY (kind, ticker)
+) WITHOUT ROWID;
+"""
+DATABASE_VERSION = 1  # PRAGMA user_version of a database that has been set up, see _sqlite_initialize
+
+_local = threading.local()
+# Reads per (function, kind) in this process, reported by the web app's /metrics
+read_counts = {}
+_read_counts_lock = threading.Lock()
+
+def get_data_directory():
+    return os.path.join(os.path.dirname(__file__), _app_constants.DATA_PATH)
+
+def get_database_path():
+    return os.path.join(get_data_directory(), _app_constants.DATABASE_FILE)
+
+def get_score_index_path():
+    return os.path.join(os.path.dirname(__file__), _app_constants.SCORE_INDEX_FILE)
+
+# "AAPL_Chart_1Mo_5Mi" or "AAPL_Chart_1Mo_5Mi.json" -> ("AAPL", "Chart_1Mo_5Mi")
+def split_name(name):
+    if name.endswith('.json'):
+        name = name[:-len('.json')]
+    ticker, _, kind = name.partition('_')
+    return ticker, kind
+
+def get_totals(ticker, document):
+    return document.get(ticker, {}).get('totals', {})
+
+# JSON backend, the original stock_data/{ticker}_{kind}.json layout
+
+def get_json_path(ticker, kind, directory=None):
+    name = f"{ticker}_{kind}" if kind else ticker
+    return os.path.join(directory or get_data_directory(), f"{name}.json")
+
+def _json_read(ticker, kind):
+    path = get_json_path(ticker, kind)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as file:
+        return json.load(file)
+
+def _json_write(ticker, kind, document, directory=None):
+    path = get_json_path(ticker, kind, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(document, file, indent=4)
+        return file.tell()
+
+def _json_updated(ticker, kind):
+    path = get_json_path(ticker, kind)
+    if not os.path.exists(path):
+        return None
+    return os.path.getmtime(path)
+
+def _json_files(directory=None, kind=None):
+    directory = directory or get_data_directory()
+    if not os.path.isdir(directory):
+        return
+    suffix = f"_{kind}.json" if kind else ".json"
+    for filename in os.listdir(directory):
+        if filename.endswith(suffix):
+            yield filename, os.path.join(directory, filename)
+
+def _json_read_all_totals(kind):
+    totals = {}
+    for filename, path in _json_files(kind=kind):
+        ticker = split_name(filename)[0]
+        try:
+            with open(path, 'r') as file:
+                totals[ticker] = get_totals(ticker, json.load(file))
+        except Exception as e:
+            print(f"Error processing file {filename}: {e}, skipping.")
+    return totals
+
+def _json_tickers_older_than(seconds):
+    cutoff = time.time() - seconds
+    return {split_name(filename)[0] for filename, path in _json_files() if os.path.getmtime(path) <= cutoff}
+
+# The score index of the JSON backend is an append-only log next to hot_picks.json, one
+# [kind, ticker, totals] line per write; later lines replace earlier ones. Writers append
+# under a lock, readers parse the whole log at once and compact it when it has grown to
+# several times the number of tickers.
+COMPACT_FACTOR = 3
+
+def _json_read_score_log():
+    path = get_score_index_path()
+    if not os.path.exists(path):
+        return None, 0
+    with open(path, 'r') as file:
+        text = file.read()
+    lines = text.splitlines()
+    # Appends are not locked against readers; a last line without its newline is still
+    # being written and is left for the next read
+    if lines and not text.endswith('\n'):
+        lines.pop()
+    index = {kind: {} for kind in SCORE_KINDS}
+    for kind, ticker, totals in json.loads(f"[{','.join(line for line in lines if line)}]"):
+        index.setdefault(kind, {})[ticker] = totals
+    return index, len(lines)
+
+def _json_write_score_log(index):
+    path = get_score_index_path()
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as file:
+        for kind, totals in index.items():
+            for ticker, ticker_totals in totals.items():
+                file.write(json.dumps([kind, ticker, ticker_totals]) + '\n')
+    os.replace(temp_path, path)
+
+# Rebuilt from the documents when the log is missing
+def _json_build_score_index():
+    return {kind: _json_read_all_totals(kind) for kind in SCORE_KINDS}
+
+def _json_lock_score_log():
+    lock = open(f"{get_score_index_path()}.lock", 'w')
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    return lock
+
+def _json_read_score_index():
+    index, lines = _json_read_score_log()
+    if index is not None and lines <= COMPACT_FACTOR * sum(len(totals) for totals in index.values()) + 100:
+        return index
+    with _json_lock_score_log():
+        index, lines = _json_read_score_log()
+        if index is None:
+            index = _json_build_score_index()
+        _json_write_score_log(index)
+    return index
+
+def _json_set_score(ticker, kind, totals):
+    with _json_lock_score_log():
+        if not os.path.exists(get_score_index_path()):
+            _json_write_score_log(_json_build_score_index())
+        else:
+            with open(get_score_index_path(), 'a') as file:
+                file.write(json.dumps([kind, ticker, totals]) + '\n')
+
+# SQLite backend, one connection per thread (and per process after a fork). WAL mode lets
+# the get_tickers.py workers write while app.py and hot_picks.py read.
+
+def get_connection():
+    connection = getattr(_local, 'connection', None)
+    path = get_database_path()
+    # Reconnect in a forked worker or after DATA_PATH changed
+    if connection is not None and _local.pid == os.getpid():
+        if _local.path == path:
+            return connection
+        connection.close()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(SCHEMA)
+    _local.connection = connection
+    _local.pid = os.getpid()
+    _local.path = path
+    _sqlite_initialize(connection)
+    return connection
+
+# A new database picks up the JSON files written before the switch, one from before the
+# scores table gets it filled. Done once per database: user_version is set to
+# DATABASE_VERSION afterwards, and connections opened meanwhile wait for the write lock
+# and then find it set.
+def _sqlite_initialize(connection):
+    if connection.execute('PRAGMA user_version').fetchone()[0] >= DATABASE_VERSION:
+        return
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        if connection.execute('PRAGMA user_version').fetchone()[0] < DATABASE_VERSION:
+            if connection.execute('SELECT 1 FROM documents LIMIT 1').fetchone() is None:
+                _sqlite_import_json(connection)
+            elif connection.execute('SELECT 1 FROM scores LIMIT 1').fetchone() is None:
+                connection.execute(
+                    f"INSERT OR IGNORE INTO scores (kind, ticker, totals) SELECT kind, ticker, totals FROM documents "
+                    f"WHERE kind IN ({', '.join('?' for _ in SCORE_KINDS)})", SCORE_KINDS)
+            connection.execute(f'PRAGMA user_version = {DATABASE_VERSION}')
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+
+def _sqlite_upsert(connection, ticker, kind, document, updated, replace=True):
+    totals = get_totals(ticker, document)
+    score = totals.get('Score') if isinstance(totals, dict) else None
+    document = json.dumps(document)
+    inserted = connection.execute(
+        f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO documents "
+        "(ticker, kind, document, totals, score, updated) VALUES (?, ?, ?, ?, ?, ?)",
+        (ticker, kind, document, json.dumps(totals),
+         score if isinstance(score, (int, float)) else None, updated)).rowcount
+    if kind in SCORE_KINDS and inserted:
+        connection.execute('INSERT OR REPLACE INTO scores (kind, ticker, totals) VALUES (?, ?, ?)',
+                           (kind, ticker, json.dumps(totals)))
+    return len(document)
+
+def _sqlite_read(ticker, kind):
+    row = get_connection().execute(
+        'SELECT document FROM documents WHERE ticker = ? AND kind = ?', (ticker, kind)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def _sqlite_read_text(ticker, kind):
+    row = get_connection().execute(
+        'SELECT document, updated FROM documents WHERE ticker = ? AND kind = ?', (ticker, kind)).fetchone()
+    return (row[0].encode('utf-8'), row[1]) if row else None
+
+def _sqlite_read_totals(ticker, kind):
+    row = get_connection().execute(
+        'SELECT totals FROM documents WHERE ticker = ? AND kind = ?', (ticker, kind)).fetchone()
+    return json.loads(row[0]) if row else None
+
+# The document's {ticker: {key: ...}} value is extracted by SQLite, without parsing the
+# whole document in Python
+def _sqlite_read_field(ticker, kind, key):
+    row = get_connection().execute(
+        "SELECT json_quote(json_extract(document, '$.' || json_quote(ticker) || '.' || json_quote(?))) "
+        "FROM documents WHERE ticker = ? AND kind = ?", (key, ticker, kind)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def _sqlite_updated(ticker, kind):
+    row = get_connection().execute(
+        'SELECT updated FROM documents WHERE ticker = ? AND kind = ?', (ticker, kind)).fetchone()
+    return row[0] if row else None
+
+def _sqlite_read_all_totals(kind):
+    rows = get_connection().execute('SELECT ticker, totals FROM documents WHERE kind = ?', (kind,))
+    return {ticker: json.loads(totals) for ticker, totals in rows}
+
+# Each kind's rows are glued into one JSON object by SQLite, one json.loads per kind
+def _sqlite_read_score_index():
+    rows = get_connection().execute(
+        "SELECT kind, '{' || group_concat(json_quote(ticker) || ':' || totals, ',') || '}' "
+        "FROM scores GROUP BY kind")
+    return {kind: json.loads(totals) for kind, totals in rows}
+
+def _sqlite_tickers_older_than(seconds):
+    rows = get_connection().execute(
+        'SELECT DISTINCT ticker FROM documents WHERE updated <= ?', (time.time() - seconds,))
+    return {ticker for ticker, in rows}
+
+# Backend independent interface
+
+def use_sqlite():
+    return _app_constants.STORAGE_BACKEND == 'sqlite'
+
+def count_read(function, kind):
+    with _read_counts_lock:
+        read_counts[(function, kind)] = read_counts.get((function, kind), 0) + 1
+
+def read_document(ticker, kind):
+    count_read('read_document', kind)
+    return _sqlite_read(ticker, kind) if use_sqlite() else _json_read(ticker, kind)
+
+# (JSON bytes, updated) of a stored document as it is stored, without parsing it; None
+# when there is no document
+def read_document_bytes(ticker, kind):
+    count_read('read_document_bytes', kind)
+    if use_sqlite():
+        return _sqlite_read_text(ticker, kind)
+    path = get_json_path(ticker, kind)
+    try:
+        with open(path, 'rb') as file:
+            return file.read(), os.path.getmtime(path)
+    except FileNotFoundError:
+        return None
+
+# Path of the document's JSON file when that file is kept up to date (the 'json' backend
+# or MIRROR_JSON) and exists, else None
+def get_document_path(ticker, kind):
+    if use_sqlite() and not MIRROR_JSON:
+        return None
+    path = get_json_path(ticker, kind)
+    return path if os.path.exists(path) else None
+
+# Totals of a stored document, None when there is no document
+def read_totals(ticker, kind):
+    count_read('read_totals', kind)
+    if use_sqlite():
+        return _sqlite_read_totals(ticker, kind)
+    document = _json_read(ticker, kind)
+    return None if document is None else get_totals(ticker, document)
+
+# The ticker's key entry of a stored document (next to its totals), None when missing
+def read_field(ticker, kind, key):
+    count_read('read_field', kind)
+    if use_sqlite():
+        return _sqlite_read_field(ticker, kind, key)
+    document = _json_read(ticker, kind)
+    return None if document is None else document.get(ticker, {}).get(key)
+
+# Writes the document and, for SCORE_KINDS, its entry in the score index. Returns the size
+# of the stored document in bytes.
+def write_document(ticker, kind, document):
+    if use_sqlite():
+        connection = get_connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            size = _sqlite_upsert(connection, ticker, kind, document, time.time())
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        if MIRROR_JSON:
+            _json_write(ticker, kind, document)
+        return size
+    size = _json_write(ticker, kind, document)
+    if kind in SCORE_KINDS:
+        _json_set_score(ticker, kind, get_totals(ticker, document))
+    return size
+
+# Last write time in epoch seconds, None when there is no document
+def get_updated(ticker, kind):
+    count_read('get_updated', kind)
+    return _sqlite_updated(ticker, kind) if use_sqlite() else _json_updated(ticker, kind)
+
+def get_age_in_minutes(ticker, kind):
+    updated = get_updated(ticker, kind)
+    if updated is None:
+        return MISSING_AGE
+    return (time.time() - updated) / 60
+
+# {ticker: totals} of every document of one kind
+def read_all_totals(kind):
+    count_read('read_all_totals', kind)
+    return _sqlite_read_all_totals(kind) if use_sqlite() else _json_read_all_totals(kind)
+
+# {kind: {ticker: totals}} for every kind in SCORE_KINDS, read from the score index
+def read_score_index():
+    count_read('read_score_index', 'scores')
+    if use_sqlite():
+        index = _sqlite_read_score_index()
+    else:
+        index = _json_read_score_index()
+    return {kind: index.get(kind, {}) for kind in SCORE_KINDS}
+
+# Tickers with any document written more than seconds ago
+def tickers_older_than(seconds):
+    return _sqlite_tickers_older_than(seconds) if use_sqlite() else _json_tickers_older_than(seconds)
+
+# Copy stock_data/*.json into the database, keeping documents already stored
+def import_json(directory=None):
+    connection = get_connection()
+    connection.execute('BEGIN')
+    try:
+        count = _sqlite_import_json(connection, directory)
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    return count
+
+def _sqlite_import_json(connection, directory=None):
+    count = 0
+    for filename, path in _json_files(directory):
+        ticker, kind = split_name(filename)
+        if not kind or kind == 'Analysis':
+            continue
+        try:
+            with open(path, 'r') as file:
+                document = json.load(file)
+        except ValueError as e:
+            print(f"Error processing file {filename}: {e}, skipping.")
+            continue
+        _sqlite_upsert(connection, ticker, kind, document, os.path.getmtime(path), replace=False)
+        count += 1
+    return count
+
+# Write every stored document out in the stock_data/{ticker}_{kind}.json layout
+def export_json(directory=None):
+    count = 0
+    for ticker, kind, document, updated in get_connection().execute(
+            'SELECT ticker, kind, document, updated FROM documents'):
+        _json_write(ticker, kind, json.loads(document), directory)
+        os.utime(get_json_path(ticker, kind, directory), (updated, updated))
+        count += 1
+    return count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Move stock_data documents between the JSON files and the database.')
+    parser.add_argument('command', choices=['import', 'export'])
+    parser.add_argument('directory', nargs='?', default=None,
+                        help=f'JSON directory, defaults to {_app_constants.DATA_PATH}')
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        print(f"Imported {import_json(args.directory)} documents into {get_database_path()}.")
+    else:
+        print(f"Exported {export_json(args.directory)} documents from {get_database_path()}.")
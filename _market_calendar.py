@@ -0,0 +1,199 @@
+import numpy as np
+import pandas as pd
+from datetime import date, datetime, time, timedelta
+import _app_constants
+
+# Regular NYSE sessions from MARKET_OPEN to MARKET_CLOSE (Eastern time), without the
+# exchange holidays and closing at EARLY_CLOSE on the days before some of them. The
+# session table is built once; durations and offsets are binary searches on it.
+CALENDAR_TIMEZONE = 'America/New_York'
+FIRST_YEAR = 2000
+YEARS_AHEAD = 2  # Sessions are built through the current year plus this many
+EARLY_CLOSE = time(13, 0)
+# Unscheduled full-day closures
+SPECIAL_CLOSURES = [
+    date(2001, 9, 11), date(2001, 9, 12), date(2001, 9, 13), date(2001, 9, 14),  # September 11
+    date(2004, 6, 11),  # President Reagan's funeral
+    date(2007, 1, 2),  # President Ford's funeral
+    date(2012, 10, 29), date(2012, 10, 30),  # Hurricane Sandy
+    date(2018, 12, 5),  # President Bush's funeral
+    date(2025, 1, 9)  # President Carter's funeral
+]
+
+_sessions = None
+
+def nth_weekday(year, month, weekday, n):
+    first = date(year, month, 1)
+    return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+
+def last_weekday(year, month, weekday):
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+# Gregorian Easter Sunday (anonymous algorithm)
+def easter(year):
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    return date(year, month, (h + l - 7 * m + 114) % 31 + 1)
+
+# Saturday holidays are observed on Friday, Sunday holidays on Monday
+def observed(day):
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+def holidays(year):
+    days = [
+        nth_weekday(year, 2, 0, 3),  # Washington's Birthday
+        easter(year) - timedelta(days=2),  # Good Friday
+        last_weekday(year, 5, 0),  # Memorial Day
+        observed(date(year, 7, 4)),  # Independence Day
+        nth_weekday(year, 9, 0, 1),  # Labor Day
+        nth_weekday(year, 11, 3, 4),  # Thanksgiving
+        observed(date(year, 12, 25))  # Christmas
+    ]
+    # A Saturday New Year's Day is not observed on the Friday before
+    if date(year, 1, 1).weekday() != 5:
+        days.append(observed(date(year, 1, 1)))
+    if year >= 1998:
+        days.append(nth_weekday(year, 1, 0, 3))  # Martin Luther King Jr. Day
+    if year >= 2022:
+        days.append(observed(date(year, 6, 19)))  # Juneteenth
+    return days
+
+def early_closes(year):
+    days = [nth_weekday(year, 11, 3, 4) + timedelta(days=1)]  # Day after Thanksgiving
+    if date(year, 7, 4).weekday() in (1, 2, 3, 4):
+        days.append(date(year, 7, 3))
+    if date(year, 12, 24).weekday() in (0, 1, 2, 3):
+        days.append(date(year, 12, 24))
+    return days
+
+def build_sessions(first_year, last_year):
+    closed = [day for year in range(first_year, last_year + 1) for day in holidays(year)] + SPECIAL_CLOSURES
+    early = [day for year in range(first_year, last_year + 1) for day in early_closes(year)]
+    days = np.arange(np.datetime64(f'{first_year}-01-01'), np.datetime64(f'{last_year + 1}-01-01'), dtype='datetime64[D]')
+    calendar = np.busdaycalendar(holidays=np.array(closed, dtype='datetime64[D]'))
+    days = days[np.is_busday(days, busdaycal=calendar)]
+    is_early = np.isin(days, np.array(early, dtype='datetime64[D]'))
+
+    midnight = pd.DatetimeIndex(days)
+    def session_times(offsets):
+        return (midnight + pd.to_timedelta(offsets, unit='s')).tz_localize(CALENDAR_TIMEZONE).as_unit('s').asi8.astype(np.float64)
+    def seconds(value):
+        return (value.hour * 60 + value.minute) * 60 + value.second
+    opens = session_times(np.full(len(days), seconds(_app_constants.MARKET_OPEN)))
+    closes = session_times(np.where(is_early, seconds(EARLY_CLOSE), seconds(_app_constants.MARKET_CLOSE)))
+    lengths = closes - opens
+    return {
+        'calendar': calendar,
+        'day': days,
+        'open': opens,
+        'close': closes,
+        # Market seconds before each session opens and after it closes
+        'before': np.concatenate([[0.0], np.cumsum(lengths)[:-1]]),
+        'after': np.cumsum(lengths)
+    }
+
+def get_sessions():
+    global _sessions
+    if _sessions is None:
+        _sessions = build_sessions(FIRST_YEAR, date.today().year + YEARS_AHEAD)
+    return _sessions
+
+# Epoch seconds of datetimes, Timestamps or strings (NaN for missing ones); naive values
+# are Eastern time
+def epoch_seconds(values):
+    values = np.atleast_1d(values)
+    try:
+        index = pd.DatetimeIndex(pd.to_datetime(values))
+    except ValueError:
+        # Mixed UTC offsets
+        index = pd.DatetimeIndex(pd.to_datetime(values, utc=True))
+    if index.tz is None:
+        # Outside market hours anyway, times in the DST changes resolve to standard time
+        index = index.tz_localize(CALENDAR_TIMEZONE, ambiguous=np.zeros(len(index), dtype=bool), nonexistent='shift_forward')
+    return np.where(index.isna(), np.nan, index.as_unit('ns').asi8 / 1e9)
+
+# Market seconds from the start of the calendar to each time (epoch seconds)
+def market_seconds_until(times):
+    sessions = get_sessions()
+    times = np.asarray(times, dtype=np.float64)
+    k = np.searchsorted(sessions['open'], times, side='right') - 1
+    session = np.clip(k, 0, None)
+    inside = np.clip(times - sessions['open'][session], 0, sessions['close'][session] - sessions['open'][session])
+    return np.where(k < 0, 0.0, sessions['before'][session] + inside)
+
+# Market seconds between start and end (epoch seconds, arrays or scalars), negative when
+# end is before start
+def market_seconds_between(start, end):
+    return market_seconds_until(end) - market_seconds_until(start)
+
+# Epoch seconds that are seconds of market time after start. A start outside a session counts
+# from the next open; landing on a close gives that close.
+def add_market_seconds(start, seconds):
+    sessions = get_sessions()
+    target = market_seconds_until(start) + np.asarray(seconds, dtype=np.float64)
+    session = np.clip(np.searchsorted(sessions['after'], target, side='left'), 0, len(sessions['after']) - 1)
+    return sessions['open'][session] + (target - sessions['before'][session])
+
+def add_market_hours(start, hours):
+    return add_market_seconds(start, np.asarray(hours, dtype=np.float64) * 3600)
+
+# Sessions counted the way len(pd.date_range(start, end, freq='B')) counts weekdays, but
+# without the holidays: the session days from start's date on whose time of day (start's)
+# is not after end. start and end are naive datetime64 arrays of wall times.
+def count_sessions(start, end):
+    start = np.asarray(start, dtype='datetime64[s]')
+    end = np.asarray(end, dtype='datetime64[s]')
+    start_day = start.astype('datetime64[D]')
+    end_day = end.astype('datetime64[D]')
+    last_day = np.where(start - start_day <= end - end_day, end_day, end_day - np.timedelta64(1, 'D'))
+    return np.maximum(np.busday_count(start_day, last_day + np.timedelta64(1, 'D'), busdaycal=get_sessions()['calendar']), 0)
+
+# Shortest, average and longest trade duration (market seconds from buy to sell, at
+# least a day) and interval (market seconds from a sell to the next buy) of the
+# trades of a chart. Open trades sell now. As the web app always did, the durations
+# leave out the first trade when there are intervals.
+def trade_metrics(trades, now=None):
+    if not trades:
+        return {
+            "shortest_trade_duration": 0,
+            "average_trade_duration": 0,
+            "longest_trade_duration": 0,
+            "shortest_trade_interval": 0,
+            "average_trade_interval": 0,
+            "longest_trade_interval": 0
+        }
+
+    # Trade timestamps as epoch seconds, ordered by buy time
+    buy_times = epoch_seconds(pd.to_datetime([trade['buy_timestamp'] for trade in trades], utc=True))
+    sell_times = epoch_seconds(pd.to_datetime([trade.get('sell_timestamp') for trade in trades], utc=True))
+    sell_times = np.where(np.isnan(sell_times), now or datetime.now().timestamp(), sell_times)
+    order = np.argsort(buy_times, kind='stable')
+    buy_times, sell_times = buy_times[order], sell_times[order]
+
+    trade_durations = np.maximum(market_seconds_between(buy_times, sell_times), 86400)
+    if len(trades) > 1:
+        trade_intervals = np.maximum(market_seconds_between(sell_times[:-1], buy_times[1:]), 0)
+        trade_durations = trade_durations[1:]
+    else:
+        trade_intervals = np.zeros(1)
+
+    return {
+        "shortest_trade_duration": float(trade_durations.min()),
+        "average_trade_duration": float(trade_durations.mean()),
+        "longest_trade_duration": float(trade_durations.max()),
+        "shortest_trade_interval": float(trade_intervals.min()),
+        "average_trade_interval": float(trade_intervals.mean()),
+        "longest_trade_interval": float(trade_intervals.max())
+    }
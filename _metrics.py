@@ -0,0 +1,132 @@
+import time
+import threading
+import contextlib
+
+# Metrics of the web app in the Prometheus text exposition format (version 0.0.4), served
+# by app.py at /metrics. Counters and histograms live in this process; values owned by
+# other modules (quote cache stats, stock_data reads) are added as collectors that are
+# read when the page is scraped.
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_metrics = []
+_collectors = []
+_lock = threading.Lock()
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with _lock:
+            values = dict(self._values)
+        return [(self.name, _format_labels(self.labels, key), value) for key, value in sorted(values.items())]
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values = {}  # labels -> [bucket counts..., sum]
+
+    def observe(self, seconds, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with _lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    values[i] += 1
+                    break
+            values[-1] += seconds
+
+    # Time a with block or, as a decorator, every call of a function
+    def time(self, **labels):
+        histogram = self
+
+        class Timer(contextlib.ContextDecorator):
+            def __enter__(self):
+                self.start_time = time.perf_counter()
+                return self
+
+            def __exit__(self, *exc):
+                histogram.observe(time.perf_counter() - self.start_time, **labels)
+                return False
+        return Timer()
+
+    def samples(self):
+        with _lock:
+            values = {key: list(value) for key, value in self._values.items()}
+        samples = []
+        for key, value in sorted(values.items()):
+            count = 0
+            for bound, bucket_count in zip(self.buckets, value):
+                count += bucket_count
+                samples.append((f'{self.name}_bucket', _format_labels(self.labels, key, {'le': _format_value(bound)}), count))
+            samples.append((f'{self.name}_sum', _format_labels(self.labels, key), value[-1]))
+            samples.append((f'{self.name}_count', _format_labels(self.labels, key), count))
+        return samples
+
+def counter(name, documentation, labels=()):
+    metric = Counter(name, documentation, labels)
+    _metrics.append(metric)
+    return metric
+
+def histogram(name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+    metric = Histogram(name, documentation, labels, buckets)
+    _metrics.append(metric)
+    return metric
+
+# collect() returns [(name, type, documentation, [(labels dict, value), ...]), ...]
+def add_collector(collect):
+    _collectors.append(collect)
+
+def render():
+    lines = []
+
+    def family(name, metric_type, documentation, samples):
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for sample_name, labels, value in samples:
+            lines.append(f'{sample_name}{labels} {_format_value(value)}')
+
+    for metric in _metrics:
+        family(metric.name, metric.type, metric.documentation, metric.samples())
+    for collect in _collectors:
+        try:
+            families = collect()
+        except Exception as e:
+            print(f"Error collecting metrics: {e}")
+            continue
+        for name, metric_type, documentation, values in families:
+            family(name, metric_type, documentation,
+                   [(name, _format_labels(labels.keys(), labels.values()), value) for labels, value in values])
+    return '\n'.join(lines) + '\n'
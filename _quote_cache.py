@@ -0,0 +1,202 @@
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+import pytz
+import yfinance as yf
+from yahooquery import Ticker
+import _app_constants
+
+CACHE_DURATION = 300  # Seconds a mark stays fresh (5 minutes)
+OPEN_ORDER_TTL = 120  # Seconds a mark of an open order's symbol stays fresh
+MAX_SYMBOLS = 2000  # Least recently used marks are dropped beyond this
+QUOTE_DEADLINE = 5  # Seconds a caller waits for a fetch before using what is cached
+REFRESH_INTERVAL = 60  # Seconds between background refreshes of the open order symbols
+
+def is_market_open(now=None):
+    now = now or datetime.now(pytz.timezone('US/Eastern'))
+    return now.weekday() < 5 and _app_constants.MARKET_OPEN <= now.time() < _app_constants.MARKET_CLOSE
+
+# Marks for many symbols from one multi-symbol quote request: the bid, or the last price
+# when there is no bid. Symbols missing from the quotes come from one 1 minute download.
+def fetch_marks(symbols):
+    marks = {}
+    quotes = Ticker(symbols, timeout=QUOTE_DEADLINE).quotes
+    if isinstance(quotes, dict):
+        for symbol, quote in quotes.items():
+            if isinstance(quote, dict) and (quote.get('bid') or quote.get('regularMarketPrice')):
+                marks[symbol] = quote.get('bid') or quote['regularMarketPrice']
+
+    missing = [symbol for symbol in symbols if symbol not in marks]
+    if missing:
+        data = yf.download(missing, period='1d', interval='1m', prepost=True, group_by='ticker',
+                           threads=True, progress=False)
+        for symbol in missing:
+            if data.columns.nlevels > 1:
+                if symbol not in data.columns.get_level_values(0):
+                    continue
+                closes = data[symbol]['Close'].dropna()
+            else:
+                closes = data['Close'].dropna()
+            if len(closes):
+                marks[symbol] = float(closes.iloc[-1])
+    return marks
+
+# Marks shared by every request of the web app. Entries expire after their symbol's TTL
+# and the least recently used ones are evicted beyond max_size. Stale symbols are fetched
+# in batches on a small executor; a symbol already being fetched joins that fetch instead
+# of starting another one. watch() keeps a set of symbols (the open orders) refreshed in
+# the background while the market is open.
+class QuoteCache:
+    def __init__(self, fetch=fetch_marks, max_size=MAX_SYMBOLS, ttl=CACHE_DURATION, workers=2):
+        self.fetch_marks = fetch
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # symbol -> (mark, fetched epoch seconds)
+        self._ttls = {}
+        self._pending = {}  # symbol -> Future of the fetch that includes it
+        self._watched = set()
+        self._refresher = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'coalesced': 0, 'fetches': 0,
+                       'fetched_symbols': 0, 'fetch_errors': 0, 'fetch_seconds': 0.0, 'background_refreshes': 0}
+
+    def get_ttl(self, symbol):
+        return self._ttls.get(symbol, self.ttl)
+
+    def set_ttl(self, symbol, ttl):
+        self._ttls[symbol] = ttl
+
+    def put(self, symbol, mark, fetched=None):
+        with self._lock:
+            self._entries[symbol] = (mark, fetched or time.time())
+            self._entries.move_to_end(symbol)
+            while len(self._entries) > self.max_size:
+                evicted, _ = self._entries.popitem(last=False)
+                self._ttls.pop(evicted, None)
+                self._stats['evictions'] += 1
+
+    # (mark, age in seconds) or None, counted as a hit or miss
+    def get(self, symbol):
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(symbol)
+            self._stats['hits'] += 1
+            return entry[0], time.time() - entry[1]
+
+    def _is_fresh(self, symbol, now, margin=0):
+        entry = self._entries.get(symbol)
+        return entry is not None and now - entry[1] < self.get_ttl(symbol) - margin
+
+    # Start fetching the symbols that are stale (or within margin seconds of it) and return
+    # the futures to wait for, including fetches already running for some of the symbols
+    def fetch(self, symbols, margin=0):
+        futures = set()
+        stale = []
+        with self._lock:
+            now = time.time()
+            for symbol in set(symbols):
+                if not symbol or self._is_fresh(symbol, now, margin):
+                    continue
+                if symbol in self._pending:
+                    futures.add(self._pending[symbol])
+                    self._stats['coalesced'] += 1
+                else:
+                    stale.append(symbol)
+            if stale:
+                stale.sort()
+                future = self._executor.submit(self._fetch, stale)
+                for symbol in stale:
+                    self._pending[symbol] = future
+                futures.add(future)
+        return futures
+
+    def _fetch(self, symbols):
+        start_time = time.time()
+        try:
+            marks = self.fetch_marks(symbols)
+            fetched = time.time()
+            for symbol, mark in marks.items():
+                self.put(symbol, mark, fetched)
+        except Exception as e:
+            marks = {}
+            print(f"Error fetching quotes: {e}")
+            with self._lock:
+                self._stats['fetch_errors'] += 1
+        finally:
+            with self._lock:
+                for symbol in symbols:
+                    self._pending.pop(symbol, None)
+                self._stats['fetches'] += 1
+                self._stats['fetched_symbols'] += len(symbols)
+                self._stats['fetch_seconds'] += time.time() - start_time
+        return marks
+
+    # Refresh the stale symbols, waiting at most deadline seconds. A fetch that runs over
+    # still fills the cache for later callers.
+    def refresh(self, symbols, deadline=QUOTE_DEADLINE, margin=0):
+        futures = self.fetch(symbols, margin)
+        if futures:
+            _, pending = wait(futures, timeout=deadline)
+            if pending:
+                print(f"Quotes took longer than {deadline} seconds, using cached marks.")
+
+    # (mark, age in seconds) of symbol, fetched first when lookup is set and it is stale.
+    # Without a cached mark the default is returned as stale, or ValueError raised.
+    def get_mark(self, symbol, default=None, lookup=True):
+        if lookup:
+            self.refresh([symbol])
+        entry = self.get(symbol)
+        if entry is not None:
+            return entry
+        if default is None:
+            raise ValueError(f"No quote for {symbol}")
+        return default, self.get_ttl(symbol)
+
+    # Keep symbols refreshed in the background during market hours, with OPEN_ORDER_TTL
+    def watch(self, symbols, interval=REFRESH_INTERVAL):
+        with self._lock:
+            for symbol in self._watched - set(symbols):
+                self._ttls.pop(symbol, None)
+            self._watched = set(symbols)
+            for symbol in self._watched:
+                self._ttls[symbol] = OPEN_ORDER_TTL
+            if self._refresher is None:
+                self._refresher = threading.Thread(target=self._refresh_loop, args=(interval,), daemon=True)
+                self._refresher.start()
+
+    def _refresh_loop(self, interval):
+        while True:
+            if is_market_open():
+                with self._lock:
+                    watched = list(self._watched)
+                # Refresh marks that would go stale before the next round
+                self.refresh(watched, deadline=interval, margin=interval)
+                with self._lock:
+                    self._stats['background_refreshes'] += 1
+            time.sleep(interval)
+
+    def stats(self):
+        with self._lock:
+            now = time.time()
+            ages = [now - fetched for _, fetched in self._entries.values()]
+            stats = dict(self._stats)
+            stats.update({
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'watched': len(self._watched),
+                'pending': len(self._pending),
+                'stale': sum(1 for symbol in self._entries if not self._is_fresh(symbol, now)),
+                'hit_ratio': stats['hits'] / max(stats['hits'] + stats['misses'], 1),
+                'average_age': sum(ages) / len(ages) if ages else 0,
+                'oldest_age': max(ages) if ages else 0
+            })
+            return stats
+
+# The cache shared by app.py and _app_functions
+quote_cache = QuoteCache()
@@ -1,16 +1,49 @@
+import os
 import requests
 import time
 import json
 import pandas as pd
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pytz
 
+SCHWAB_API_URL = 'https://api.schwabapi.com'
+MAX_CONCURRENCY = 8  # Price history requests in flight at once
+MAX_RETRIES = 4  # Retries for 429 and 5xx responses
+BACKOFF_FACTOR = 0.5  # Seconds, doubled on every retry (Retry-After is honored for 429)
+WINDOW_DAYS = 10  # Days of 5 minute candles per pricehistory request
+
+_bearer_key_cache = {}
+
+# The key file is rewritten when the token is refreshed, so it is only re-read when it changes
 def get_bearer_key(file_path='schwab_key.txt'):
+    mod_time = os.path.getmtime(file_path)
+    cached = _bearer_key_cache.get(file_path)
+    if cached and cached[0] == mod_time:
+        return cached[1]
     with open(file_path, 'r') as file:
-        return file.read().strip()
+        bearer_key = file.read().strip()
+    _bearer_key_cache[file_path] = (mod_time, bearer_key)
+    return bearer_key
+
+# One authenticated keep-alive session whose connection pool is sized for max_concurrency
+def get_session(bearer_key, max_concurrency=MAX_CONCURRENCY, retries=MAX_RETRIES, backoff_factor=BACKOFF_FACTOR):
+    session = requests.Session()
+    session.headers.update({
+        'accept': 'application/json',
+        'Authorization': f'Bearer {bearer_key}'
+    })
+    retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=['GET'], respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
 
-def get_schwab_data_chunk(ticker, bearer_key, end_date):
-    url = f'https://api.schwabapi.com/marketdata/v1/pricehistory'
+def get_schwab_data_chunk(ticker, bearer_key, end_date, session=None, base_url=SCHWAB_API_URL):
+    url = f'{base_url}/marketdata/v1/pricehistory'
     params = {
         'symbol': ticker,
         'periodType': 'day',
@@ -20,22 +53,43 @@ def get_schwab_data_chunk(ticker, bearer_key, end_date):
         'endDate': end_date,
         'needExtendedHoursData': 'true'
     }
-    headers = {
-        'accept': 'application/json',
-        'Authorization': f'Bearer {bearer_key}'
-    }
-    response = requests.get(url, headers=headers, params=params)
+    if session is None:
+        with get_session(bearer_key) as session:
+            return get_schwab_data_chunk(ticker, bearer_key, end_date, session, base_url)
+    response = session.get(url, params=params)
     if response.status_code == 200:
         return response.json()
     else:
         response.raise_for_status()
 
-def collect_30_days_of_data(ticker, bearer_key):
+# 5 minute candles from start_date (milliseconds) until now, used to top up stored bars
+def collect_data_since(ticker, bearer_key, start_date, session=None, base_url=SCHWAB_API_URL):
+    url = f'{base_url}/marketdata/v1/pricehistory'
+    params = {
+        'symbol': ticker,
+        'periodType': 'day',
+        'frequencyType': 'minute',
+        'frequency': 5,
+        'startDate': start_date,
+        'endDate': int(time.time() * 1000),
+        'needExtendedHoursData': 'true'
+    }
+    if session is None:
+        with get_session(bearer_key) as session:
+            return collect_data_since(ticker, bearer_key, start_date, session, base_url)
+    response = session.get(url, params=params)
+    response.raise_for_status()
+    return sorted(response.json().get('candles', []), key=lambda x: x['datetime'])
+
+def collect_30_days_of_data(ticker, bearer_key, session=None, base_url=SCHWAB_API_URL):
+    if session is None:
+        with get_session(bearer_key) as session:
+            return collect_30_days_of_data(ticker, bearer_key, session, base_url)
     all_candles = []
     current_end_date = int(time.time() * 1000)  # Current time in milliseconds
 
     while len(all_candles) < 30 * 24 * 60 // 5:  # Approximate number of 5-minute intervals in 30 days
-        data_chunk = get_schwab_data_chunk(ticker, bearer_key, current_end_date)
+        data_chunk = get_schwab_data_chunk(ticker, bearer_key, current_end_date, session, base_url)
         candles = data_chunk.get('candles', [])
         
         if not candles:
@@ -46,16 +100,40 @@ def collect_30_days_of_data(ticker, bearer_key):
         # Update the end date for the next request to be the oldest datetime in the returned data
         current_end_date = candles[0]['datetime'] - 1  # Move end_date back slightly to ensure no overlap
 
-    # Ensure all candles are sorted by datetime
-    all_candles = sorted(all_candles, key=lambda x: x['datetime'])
+    return last_30_days(all_candles)
 
-    # Keep only the last 30 days of data
+# Keep only the last 30 days of candles, sorted by datetime and without duplicates
+def last_30_days(candles):
+    unique_candles = {candle['datetime']: candle for candle in candles}
     thirty_days_ago = datetime.now() - timedelta(days=30)
     thirty_days_ago_timestamp = int(thirty_days_ago.timestamp() * 1000)
+    return [unique_candles[key] for key in sorted(unique_candles) if key >= thirty_days_ago_timestamp]
+
+# Collect 30 days of 5 minute candles for many tickers. The 10 day windows have fixed end
+# dates (now, 10 and 20 days ago) so every window of every ticker can be requested at
+# once, at most max_concurrency at a time over one pooled session. Overlapping candles are
+# de-duplicated. Returns {ticker: candles}, tickers whose requests failed are left out.
+def collect_30_days_of_data_many(tickers, bearer_key=None, max_concurrency=MAX_CONCURRENCY, base_url=SCHWAB_API_URL):
+    if bearer_key is None:
+        bearer_key = get_bearer_key()
+    now = int(time.time() * 1000)
+    end_dates = [now - days * 24 * 60 * 60 * 1000 for days in range(0, 30, WINDOW_DAYS)]
 
-    filtered_candles = [candle for candle in all_candles if candle['datetime'] >= thirty_days_ago_timestamp]
-    
-    return filtered_candles
+    with get_session(bearer_key, max_concurrency) as session, ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = {
+            ticker: [executor.submit(get_schwab_data_chunk, ticker, bearer_key, end_date, session, base_url) for end_date in end_dates]
+            for ticker in tickers
+        }
+        all_candles = {}
+        for ticker, ticker_futures in futures.items():
+            try:
+                candles = []
+                for future in ticker_futures:
+                    candles.extend((future.result() or {}).get('candles', []))
+                all_candles[ticker] = last_30_days(candles)
+            except Exception as e:
+                print(f"Failed to get Schwab price history for {ticker}: {e}")
+    return all_candles
 
 def candles_to_dataframe(candles):
     eastern = pytz.timezone('US/Eastern')
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import argparse
+import threading
+import contextlib
+import numpy as np
+import _app_constants
+
+# Timing spans of the data pipeline, one JSON line each in TIMINGS_FILE:
+#   {"time": ..., "pid": ..., "ticker": "AAPL", "stage": "fetch.yahoo_chart", "duration": 1.23,
+#    "bytes": 123456, "success": true}
+# Stages are named category.step with the categories fetch (provider calls), parse, compute
+# and write (stored documents); the whole of a ticker is the analyze_stock stage. Spans are
+# appended with one write to an O_APPEND file, so get_tickers.py workers and get_stock_data.py
+# processes can share the file.
+ENABLED = True
+MAX_FILE_BYTES = 50 * 1024 * 1024  # The file is rotated to TIMINGS_FILE.1 beyond this
+SLOWEST_TICKERS = 10
+
+_local = threading.local()
+_file = {'pid': None, 'fd': None}
+_file_lock = threading.Lock()
+
+def get_timings_path():
+    return os.path.join(os.path.dirname(__file__), _app_constants.TIMINGS_FILE)
+
+def _open():
+    path = get_timings_path()
+    if os.path.exists(path) and os.path.getsize(path) > MAX_FILE_BYTES:
+        os.replace(path, f"{path}.1")
+    return os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+def write_span(record):
+    line = (json.dumps(record) + '\n').encode('utf-8')
+    with _file_lock:
+        # A worker process opens its own descriptor
+        if _file['pid'] != os.getpid():
+            _file['fd'] = _open()
+            _file['pid'] = os.getpid()
+        os.write(_file['fd'], line)
+
+def current_ticker():
+    stack = getattr(_local, 'tickers', None)
+    return stack[-1] if stack else None
+
+# Time the with block as stage. The span dict can be given the bytes handled
+# (span['bytes'] = ...); success is False when the block raised. Nested spans inherit the
+# ticker of the enclosing one.
+@contextlib.contextmanager
+def span(stage, ticker=None, bytes=None):
+    ticker = ticker or current_ticker()
+    record = {'bytes': bytes}
+    if not hasattr(_local, 'tickers'):
+        _local.tickers = []
+    _local.tickers.append(ticker)
+    start_time = time.perf_counter()
+    success = False
+    try:
+        yield record
+        success = True
+    finally:
+        duration = time.perf_counter() - start_time
+        _local.tickers.pop()
+        if ENABLED:
+            try:
+                write_span({'time': round(time.time(), 3), 'pid': os.getpid(), 'ticker': ticker, 'stage': stage,
+                            'duration': round(duration, 6), 'bytes': record['bytes'], 'success': success})
+            except OSError as e:
+                print(f"Error writing timing span: {e}")
+
+# In-memory size of a DataFrame, for the bytes of fetch spans
+def frame_bytes(data):
+    return int(data.memory_usage(deep=False).sum()) if data is not None else 0
+
+def read_spans(path=None):
+    spans = []
+    with open(path or get_timings_path(), 'r') as file:
+        for line in file:
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                pass  # A line cut short by a crash
+    return spans
+
+# p50/p95 per stage and the tickers that took longest (sum of their analyze_stock spans,
+# or of all their spans when there are none)
+def summarize(spans, top=SLOWEST_TICKERS, since=None):
+    if since is not None:
+        spans = [span for span in spans if span.get('time', 0) >= since]
+    stages = {}
+    for span in spans:
+        stages.setdefault(span['stage'], []).append(span)
+    summary = {'spans': len(spans), 'stages': {}, 'slowest_tickers': []}
+    for stage, stage_spans in sorted(stages.items()):
+        durations = np.array([span['duration'] for span in stage_spans])
+        sizes = [span['bytes'] for span in stage_spans if span.get('bytes') is not None]
+        summary['stages'][stage] = {
+            'count': len(stage_spans),
+            'failures': sum(1 for span in stage_spans if not span['success']),
+            'p50': float(np.percentile(durations, 50)),
+            'p95': float(np.percentile(durations, 95)),
+            'max': float(durations.max()),
+            'total': float(durations.sum()),
+            'bytes': int(sum(sizes)) if sizes else None
+        }
+
+    totals = {}
+    tickers_with_total = {span['ticker'] for span in spans if span['stage'] == 'analyze_stock'}
+    for span in spans:
+        ticker = span.get('ticker')
+        if ticker and (span['stage'] == 'analyze_stock' or ticker not in tickers_with_total):
+            totals[ticker] = totals.get(ticker, 0) + span['duration']
+    summary['slowest_tickers'] = [
+        {'ticker': ticker, 'duration': duration}
+        for ticker, duration in sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]]
+    return summary
+
+def print_summary(summary):
+    print(f"{summary['spans']} spans")
+    print(f"{'stage':<32} {'count':>7} {'fail':>5} {'p50 s':>9} {'p95 s':>9} {'max s':>9} {'total s':>10} {'MB':>9}")
+    for stage, stats in summary['stages'].items():
+        megabytes = f"{stats['bytes'] / 1e6:.2f}" if stats['bytes'] is not None else '-'
+        print(f"{stage:<32} {stats['count']:>7} {stats['failures']:>5} {stats['p50']:>9.3f} {stats['p95']:>9.3f} "
+              f"{stats['max']:>9.3f} {stats['total']:>10.1f} {megabytes:>9}")
+    print("\nSlowest tickers")
+    for entry in summary['slowest_tickers']:
+        print(f"{entry['ticker']:<10} {entry['duration']:>9.2f} s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Summarize the get_stock_data timing spans.')
+    parser.add_argument('command', choices=['summary'])
+    parser.add_argument('file', nargs='?', default=None, help=f'Spans file, defaults to {_app_constants.TIMINGS_FILE}')
+    parser.add_argument('--top', type=int, default=SLOWEST_TICKERS, help='Number of slowest tickers to list')
+    parser.add_argument('--hours', type=float, help='Only spans from the last this many hours')
+    parser.add_argument('--json', action='store_true', help='Print the summary as JSON')
+    args = parser.parse_args()
+
+    since = time.time() - args.hours * 3600 if args.hours else None
+    summary = summarize(read_spans(args.file), args.top, since)
+    if args.json:
+        print(json.dumps(summary, indent=4))
+    else:
+        print_summary(summary)
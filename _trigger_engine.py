@@ -0,0 +1,263 @@
+import numpy as np
+from datetime import time
+
+# Same window as get_stock_data.is_trading_hours (9:30 AM to 4:00 PM, inclusive)
+TRADING_START = time(9, 30)
+TRADING_END = time(16, 0)
+
+def _time_to_microseconds(value):
+    return ((value.hour * 60 + value.minute) * 60 + value.second) * 1000000 + value.microsecond
+
+# Evaluate is_trading_hours for a whole DatetimeIndex at once
+def trading_hours_mask(index):
+    hour = np.asarray(index.hour, dtype=np.int64)
+    minute = np.asarray(index.minute, dtype=np.int64)
+    second = np.asarray(index.second, dtype=np.int64)
+    microsecond = np.asarray(index.microsecond, dtype=np.int64)
+    time_of_day = ((hour * 60 + minute) * 60 + second) * 1000000 + microsecond
+    return (time_of_day >= _time_to_microseconds(TRADING_START)) & (time_of_day <= _time_to_microseconds(TRADING_END))
+
+# Pull everything the trigger logic needs out of the DataFrame once
+def chart_arrays(data):
+    arrays = {
+        'index': data.index,
+        'open': data['Open'].to_numpy(dtype=np.float64),
+        'high': data['High'].to_numpy(dtype=np.float64),
+        'low': data['Low'].to_numpy(dtype=np.float64),
+        'close': data['Close'].to_numpy(dtype=np.float64),
+        'trading_hours': trading_hours_mask(data.index)
+    }
+    return add_rounded_prices(arrays)
+
+# round() of a numpy float is np.round, so rounding the columns up front gives the
+# same values the bar loop rounds one at a time
+def add_rounded_prices(arrays):
+    for column in ['open', 'high', 'low', 'close']:
+        arrays[f'{column}_2dp'] = np.round(arrays[column], 2)
+    arrays['labels'] = {}
+    return arrays
+
+# str() of a bar's timestamp, cached because every trigger, buy and sell formats one
+def bar_label(arrays, i):
+    label = arrays['labels'].get(i)
+    if label is None:
+        label = arrays['labels'][i] = str(arrays['index'][i])
+    return label
+
+# Bars where the high-water-mark independent part of the trigger test holds:
+# the bar's high is above the previous high and the previous open fell
+def trigger_candidates(arrays, trading_hours=True):
+    high = arrays['high']
+    open_ = arrays['open']
+    candidates = np.zeros(len(high), dtype=bool)
+    if len(high) > 2:
+        candidates[2:] = (high[2:] > high[1:-1]) & (open_[1:-1] < open_[:-2])
+    if trading_hours:
+        candidates &= arrays['trading_hours']
+    return candidates
+
+# First bar at or after start that is inside trading hours and reaches level,
+# searched in growing chunks so early sells do not scan the whole chart
+def first_sell_bar(arrays, start, level):
+    high = arrays['high']
+    session = arrays['trading_hours']
+    n = len(high)
+    step = 64
+    while start < n:
+        stop = min(n, start + step)
+        hits = np.flatnonzero(session[start:stop] & (high[start:stop] >= level))
+        if hits.size:
+            return start + int(hits[0])
+        start = stop
+        step *= 4
+    return n
+
+# Trigger dict for bar i, highest_bar is the bar of the high-water mark or -1 when it is 0
+def make_trigger(arrays, i, highest_bar):
+    low = arrays['low']
+    if highest_bar >= 0:
+        highest_price = arrays['high'][highest_bar]
+        high_timestamp = bar_label(arrays, highest_bar)
+        high_price = arrays['high_2dp'][highest_bar]
+    else:
+        highest_price = 0
+        high_timestamp = str(None)
+        high_price = 0
+    return {
+        "high_timestamp": high_timestamp,
+        "high_price": high_price,
+        "trigger_timestamp": bar_label(arrays, i),
+        "trigger_price": arrays['low_2dp'][i],
+        "percentage_drop": round(((highest_price - low[i]) / highest_price) * 100, 2),
+        "bar_high": arrays['high_2dp'][i],
+        "bar_low": arrays['low_2dp'][i],
+        "bar_open": arrays['open_2dp'][i],
+        "bar_close": arrays['close_2dp'][i]
+    }
+
+def open_trade(arrays, trades, i):
+    trades.append({
+        "buy_timestamp": bar_label(arrays, i),
+        "buy_price": arrays['low_2dp'][i]
+    })
+
+def close_trade(arrays, trades, i, last_buy_price, Threshold):
+    sell_threshold = last_buy_price + (Threshold / 100 * last_buy_price)
+    trades[-1].update({
+        "buy_timestamp": trades[-1]['buy_timestamp'],
+        "buy_price": trades[-1]['buy_price'],
+        "sell_timestamp": bar_label(arrays, i),
+        "sell_price": round(sell_threshold, 2),
+        "profit": round(sell_threshold - last_buy_price, 2)
+    })
+
+# NumPy engine for get_stock_data.identify_triggers
+def identify_triggers(data, Threshold=2, trading_hours=True, arrays=None):
+    return sweep_triggers(data, [Threshold], trading_hours, arrays)[Threshold]
+
+# Run the trigger/trade logic for every threshold in a single pass. Instead of stepping
+# every bar it jumps between candidate bars: the bars folded into the high-water mark
+# between two candidates are shared by all thresholds, so each step is one slice max
+# plus a few array operations over the per-threshold state (high-water mark and open
+# position). An open position's sell bar is found with one search when it is bought.
+# Values are rounded as numpy floats, so the output matches the pandas loop exactly.
+def sweep_triggers(data, thresholds=range(1, 21), trading_hours=True, arrays=None):
+    if arrays is None:
+        arrays = chart_arrays(data)
+    high = arrays['high']
+    low = arrays['low']
+    n = len(high)
+    thresholds = list(thresholds)
+    threshold_values = np.asarray(thresholds, dtype=np.float64)
+    triggers = [[] for _ in thresholds]
+    trades = [[] for _ in thresholds]
+
+    # NaN highs never raise the high-water mark
+    peaks = np.where(np.isnan(high), -np.inf, high)
+    # Bar of each threshold's high-water mark, -1 while it is reset to 0
+    highest_bar = np.full(len(thresholds), -1)
+    highest_price = np.zeros(len(thresholds))
+    last_buy_price = np.zeros(len(thresholds))
+    sell_bar = np.full(len(thresholds), n)
+    fold_from = 1
+
+    for i in np.flatnonzero(trigger_candidates(arrays, trading_hours)).tolist():
+        # Fold the bars since the last candidate into every high-water mark
+        if i > fold_from:
+            k = fold_from + int(np.argmax(peaks[fold_from:i]))
+            raised = peaks[k] > highest_price
+            highest_bar[raised] = k
+            highest_price[raised] = high[k]
+        fold_from = i
+
+        for j in np.flatnonzero((last_buy_price > 0) & (sell_bar <= i)).tolist():
+            close_trade(arrays, trades[j], sell_bar[j], last_buy_price[j], thresholds[j])
+            last_buy_price[j] = 0
+
+        fired = highest_price - high[i-1] > highest_price * threshold_values / 100
+        for j in np.flatnonzero(fired).tolist():
+            triggers[j].append(make_trigger(arrays, i, highest_bar[j]))
+            if last_buy_price[j] == 0:
+                open_trade(arrays, trades[j], i)
+                last_buy_price[j] = low[i]
+                if low[i] > 0:
+                    sell_bar[j] = first_sell_bar(arrays, i + 1, low[i] + (thresholds[j] / 100 * low[i]))
+                else:
+                    sell_bar[j] = n
+        highest_bar[fired] = -1
+        highest_price[fired] = 0
+
+    # Positions bought at the last candidates can still sell before the chart ends
+    for j in np.flatnonzero((last_buy_price > 0) & (sell_bar < n)).tolist():
+        close_trade(arrays, trades[j], sell_bar[j], last_buy_price[j], thresholds[j])
+
+    return {threshold: (triggers[j], trades[j]) for j, threshold in enumerate(thresholds)}
+
+# Stack the charts of many tickers into (tickers x bars) arrays. Rows are aligned by bar
+# position and padded with NaN at the end, so every ticker still sees its own bar
+# sequence and the padding can never trigger, raise a high-water mark or sell.
+def stack_charts(frames):
+    tickers = list(frames)
+    width = max([len(frames[ticker]) for ticker in tickers] + [0])
+    stacked = {
+        'tickers': tickers,
+        'index': [frames[ticker].index for ticker in tickers],
+        'length': np.zeros(len(tickers), dtype=np.int64),
+        'trading_hours': np.zeros((len(tickers), width), dtype=bool)
+    }
+    for column in ['open', 'high', 'low', 'close']:
+        stacked[column] = np.full((len(tickers), width), np.nan)
+    for row, ticker in enumerate(tickers):
+        arrays = chart_arrays(frames[ticker])
+        n = len(arrays['high'])
+        stacked['length'][row] = n
+        for column in ['open', 'high', 'low', 'close', 'trading_hours']:
+            stacked[column][row, :n] = arrays[column]
+    return stacked
+
+# The chart_arrays view of one row of a stacked batch
+def row_arrays(stacked, row):
+    n = stacked['length'][row]
+    arrays = {column: stacked[column][row, :n] for column in ['open', 'high', 'low', 'close', 'trading_hours']}
+    arrays['index'] = stacked['index'][row]
+    return add_rounded_prices(arrays)
+
+# Run the trigger/trade logic for every ticker and threshold of a stacked batch. The state
+# (high-water mark, open position and its sell level) is a (tickers x thresholds) matrix
+# that advances one bar step at a time for all tickers together; only the bars where a
+# trigger fires or a position sells drop into Python to build the result dicts.
+# Returns {ticker: {threshold: (triggers, trades)}}, the same as sweep_triggers per ticker.
+def batch_sweep_triggers(stacked, thresholds=range(1, 21), trading_hours=True):
+    tickers = stacked['tickers']
+    high = stacked['high']
+    low = stacked['low']
+    open_ = stacked['open']
+    session = stacked['trading_hours']
+    rows, width = high.shape
+    thresholds = list(thresholds)
+    threshold_values = np.asarray(thresholds, dtype=np.float64)
+    arrays = [row_arrays(stacked, row) for row in range(rows)]
+    triggers = [[[] for _ in thresholds] for _ in range(rows)]
+    trades = [[[] for _ in thresholds] for _ in range(rows)]
+
+    # Same candidate test as trigger_candidates, for the whole matrix
+    candidates = np.zeros((rows, width), dtype=bool)
+    if width > 2:
+        candidates[:, 2:] = (high[:, 2:] > high[:, 1:-1]) & (open_[:, 1:-1] < open_[:, :-2])
+    if trading_hours:
+        candidates &= session
+    highest_bar = np.full((rows, len(thresholds)), -1)
+    highest_price = np.zeros((rows, len(thresholds)))
+    last_buy_price = np.zeros((rows, len(thresholds)))
+    sell_level = np.full((rows, len(thresholds)), np.nan)
+
+    for i in range(2, width):
+        previous_high = high[:, i-1:i]
+        raised = previous_high > highest_price
+        highest_bar[raised] = i - 1
+        highest_price = np.where(raised, previous_high, highest_price)
+
+        selling = (last_buy_price > 0) & session[:, i:i+1] & (high[:, i:i+1] >= sell_level)
+        if selling.any():
+            for row, j in zip(*np.nonzero(selling)):
+                close_trade(arrays[row], trades[row][j], i, last_buy_price[row, j], thresholds[j])
+            last_buy_price[selling] = 0
+            sell_level[selling] = np.nan
+
+        if not candidates[:, i].any():
+            continue
+        fired = candidates[:, i:i+1] & (highest_price - previous_high > highest_price * threshold_values / 100)
+        if not fired.any():
+            continue
+        for row, j in zip(*np.nonzero(fired)):
+            triggers[row][j].append(make_trigger(arrays[row], i, highest_bar[row, j]))
+            if last_buy_price[row, j] == 0:
+                open_trade(arrays[row], trades[row][j], i)
+                last_buy_price[row, j] = low[row, i]
+                if low[row, i] > 0:
+                    sell_level[row, j] = low[row, i] + (thresholds[j] / 100 * low[row, i])
+        highest_bar[fired] = -1
+        highest_price[fired] = 0
+
+    return {ticker: {threshold: (triggers[row][j], trades[row][j]) for j, threshold in enumerate(thresholds)}
+            for row, ticker in enumerate(tickers)}
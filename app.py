@@ -2,54 +2,175 @@ import csv
 import os
 import time
 from collections import defaultdict
-from flask import Flask, render_template, jsonify, request, Response
-import yfinance as yf
+from flask import Flask, render_template, jsonify, request, Response, g, send_file
+from werkzeug.security import safe_join
 import json
-from datetime import datetime, timedelta
+import gzip
+import hashlib
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, wait
+import pandas as pd
 import _app_functions
 import _app_constants
+import _data_store
+import _metrics
+import _analysis_jobs
+import _analysis_prompt
+from _quote_cache import quote_cache
 from openai import OpenAI
 from yahooquery import Ticker
-import subprocess
-from collections import OrderedDict
+import threading
+import hot_picks
 
 
 VERSION = "1.1.1 ~ August 12, 2024"
 
 # Configuration
 HISTORY_FILE = "history.json"  # File to store historical data
-HOT_PICKS_FILE = "hot_picks.json"
-CACHE_DURATION = 300  # Cache duration in seconds (5 minutes)
+HOT_PICKS_FILE = hot_picks.HOT_PICKS_FILE
 
 app = Flask(__name__)
-price_cache = {}
+# Last hot picks and ranks, see get_hot_picks
+hot_picks_cache = {"mtime": None, "stale": True, "hot_picks": None, "ranks": None}
+hot_picks_lock = threading.Lock()
+# Parsed TradeActivity CSVs by path, see load_trade_orders
+trade_orders_cache = {}
+trade_orders_lock = threading.Lock()
+# Gzipped stock_data Details bodies, see stock_data()
+gzip_cache = OrderedDict()
+gzip_cache_lock = threading.Lock()
+GZIP_MIN_BYTES = 16384  # Details documents at least this large are gzipped for browsers that accept it
+GZIP_CACHE_SIZE = 256
+# Totals of stored documents by (ticker, kind) for the report and /api/details, see get_cached_totals
+details_cache = OrderedDict()
+details_cache_lock = threading.Lock()
+DETAILS_CACHE_SECONDS = 60
+DETAILS_CACHE_SIZE = 8192
+DETAILS_KINDS = ('Chart_1Mo_5Mi', 'Overall_Trend', 'Chart_6Mo_1Hr', 'Details', 'SEC_Info')
+DETAILS_MAX_SYMBOLS = 1000
+TRADE_COLUMNS = ['Symbol', 'Qty', 'Side', 'PRICE', 'Mark', 'Status', 'Time Placed']
+FINGERPRINT_BYTES = 4096
+MOVING_AVERAGE_DAYS = (20, 50, 100, 200)  # Moving averages given to the analysis, the last is the history fetched
+ANALYSIS_FETCH_DEADLINE = 20  # Seconds fetch_stock_data waits for the yahooquery and news requests
 
 client = OpenAI(api_key=_app_functions.load_api_key('openai_key.txt'))
 
+# Metrics served at /metrics, see _metrics
+REQUEST_SECONDS = _metrics.histogram('stock_tracker_request_duration_seconds', 'Time to answer a request, by route', ('route', 'method', 'status'))
+PARSE_TRADE_DATA_SECONDS = _metrics.histogram('stock_tracker_parse_trade_data_seconds', 'Time spent in parse_trade_data')
+HOT_PICKS_SECONDS = _metrics.histogram('stock_tracker_hot_picks_seconds', 'Time spent ranking hot picks (hot_picks.get_hot_picks)')
+HOT_PICKS_REQUESTS = _metrics.counter('stock_tracker_hot_picks_requests_total', 'Hot picks lookups by how they were answered', ('result',))
+OPENAI_SECONDS = _metrics.histogram('stock_tracker_openai_request_duration_seconds', 'OpenAI chat completion latency', ('status',))
+PROMPT_TOKENS = _metrics.histogram('stock_tracker_analysis_prompt_tokens', 'Estimated tokens of the analysis prompts sent to OpenAI',
+                                   buckets=(1000, 2000, 4000, 6000, 8000, 12000, 16000, 32000))
+ANALYSIS_REPORTS = _metrics.counter('stock_tracker_analysis_reports_total', 'Analysis reports by whether OpenAI was asked', ('result',))
+ANALYSIS_FETCH_SECONDS = _metrics.histogram('stock_tracker_analysis_fetch_seconds', 'Time fetching the yahooquery data of an analysis')
+
+# (metric name, type, help) of the quote_cache.stats() values
+QUOTE_CACHE_METRICS = {
+    'hits': ('hits_total', 'counter', 'Marks served from the quote cache'),
+    'misses': ('misses_total', 'counter', 'Marks asked for that were not cached'),
+    'evictions': ('evictions_total', 'counter', 'Least recently used marks dropped'),
+    'coalesced': ('coalesced_total', 'counter', 'Symbols that joined a fetch already running'),
+    'fetches': ('fetches_total', 'counter', 'Batched quote requests'),
+    'fetched_symbols': ('fetched_symbols_total', 'counter', 'Symbols requested in quote requests'),
+    'fetch_errors': ('fetch_errors_total', 'counter', 'Quote requests that failed'),
+    'fetch_seconds': ('fetch_seconds_total', 'counter', 'Time spent in quote requests'),
+    'background_refreshes': ('background_refreshes_total', 'counter', 'Background refreshes of the open order marks'),
+    'size': ('size', 'gauge', 'Cached marks'),
+    'max_size': ('max_size', 'gauge', 'Cached marks kept at most'),
+    'watched': ('watched', 'gauge', 'Open order symbols refreshed in the background'),
+    'pending': ('pending', 'gauge', 'Symbols being fetched'),
+    'stale': ('stale', 'gauge', 'Cached marks older than their TTL'),
+    'hit_ratio': ('hit_ratio', 'gauge', 'Hits over hits and misses'),
+    'average_age': ('average_age_seconds', 'gauge', 'Average age of the cached marks'),
+    'oldest_age': ('oldest_age_seconds', 'gauge', 'Age of the oldest cached mark')
+}
+
+def collect_quote_cache():
+    stats = quote_cache.stats()
+    return [(f'stock_tracker_quote_cache_{name}', metric_type, documentation, [({}, stats[key])])
+            for key, (name, metric_type, documentation) in QUOTE_CACHE_METRICS.items()]
+
+def collect_stock_data_reads():
+    reads = dict(_data_store.read_counts)
+    return [('stock_tracker_stock_data_reads_total', 'counter', 'stock_data reads by function and document kind',
+             [({'function': function, 'kind': kind}, count) for (function, kind), count in sorted(reads.items())])]
+
+_metrics.add_collector(collect_quote_cache)
+_metrics.add_collector(collect_stock_data_reads)
+
+@app.before_request
+def start_request_timer():
+    g.request_start_time = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    if 'request_start_time' in g:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_start_time, route=route, method=request.method, status=response.status_code)
+    return response
+
+# Mean close of the last days calendar days, as Yahoo's "<days>d" history ranges count them
+def moving_average(history, days):
+    dates = pd.to_datetime([str(day)[:10] for day in history.index.get_level_values('date')])
+    closes = history["close"][dates > pd.Timestamp(date.today() - timedelta(days=days))]
+    return closes.mean() if not closes.empty else None
+
+# The data of an analysis. One 200 day history gives the current price and every moving
+# average; it and the other yahooquery and news requests run at once, and whatever has not
+# arrived after ANALYSIS_FETCH_DEADLINE seconds is left out (None).
 def fetch_stock_data(ticker):
     stock = Ticker(ticker)
-    data = {
-        "current_price": stock.history(period="1d")["close"].iloc[-1],
-        "financials": stock.financial_data,
-        "earnings": stock.earnings,
-        "recommendations": stock.recommendations,
-        "analyst_ratings": stock.recommendation_trend,
-        "news": _app_functions.fetch_news_from_rss(ticker),
-        "cashflow": stock.cash_flow,
-        "balance_sheet": stock.balance_sheet,
-        "income_statement": stock.income_statement,
-        "summary_detail": stock.summary_detail,
-        "summary_profile": stock.summary_profile,
-        "moving_averages": {
-            "20_day": stock.history(period="20d")["close"].mean() if not stock.history(period="20d").empty else None,
-            "50_day": stock.history(period="50d")["close"].mean() if not stock.history(period="50d").empty else None,
-            "100_day": stock.history(period="100d")["close"].mean() if not stock.history(period="100d").empty else None,
-            "200_day": stock.history(period="200d")["close"].mean() if not stock.history(period="200d").empty else None
-        }
+    fetches = {
+        "history": lambda: stock.history(period=f"{MOVING_AVERAGE_DAYS[-1]}d"),
+        "financials": lambda: stock.financial_data,
+        "earnings": lambda: stock.earnings,
+        "recommendations": lambda: stock.recommendations,
+        "analyst_ratings": lambda: stock.recommendation_trend,
+        "news": lambda: _app_functions.fetch_news_from_rss(ticker),
+        "cashflow": lambda: stock.cash_flow,
+        "balance_sheet": lambda: stock.balance_sheet,
+        "income_statement": lambda: stock.income_statement,
+        "summary_detail": lambda: stock.summary_detail,
+        "summary_profile": lambda: stock.summary_profile
     }
+    executor = ThreadPoolExecutor(max_workers=len(fetches))
+    futures = {name: executor.submit(fetch) for name, fetch in fetches.items()}
+    wait(futures.values(), timeout=ANALYSIS_FETCH_DEADLINE)
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    results = {}
+    for name, future in futures.items():
+        if not future.done():
+            print(f"Timed out fetching {name} of {ticker}")
+            results[name] = None
+        elif future.exception() is not None:
+            print(f"Error fetching {name} of {ticker}: {future.exception()}")
+            results[name] = None
+        else:
+            results[name] = future.result()
+
+    history = results.pop("history")
+    if not isinstance(history, pd.DataFrame) or history.empty:
+        raise ValueError(f"No price history for {ticker}")
+    data = {"current_price": history["close"].iloc[-1]}
+    data.update(results)
+    data["moving_averages"] = {f"{days}_day": moving_average(history, days) for days in MOVING_AVERAGE_DAYS}
     return data
 
-def review_and_analyze_stock(ticker, risk_tolerance, stock_data):
+# Report of an analysis from OpenAI (openai_client, the app's client by default). The
+# data is condensed by _analysis_prompt; a report already written for the same condensed
+# data and risk tolerance is returned without asking again.
+def review_and_analyze_stock(ticker, risk_tolerance, stock_data, openai_client=None):
+    payload = _analysis_prompt.build_payload(stock_data)
+    key = _analysis_prompt.report_key(ticker, risk_tolerance, payload)
+    report = _analysis_prompt.read_report(key)
+    if report is not None:
+        ANALYSIS_REPORTS.inc(result='cached')
+        return report
+
     prompt = (
         f"Based on current data downloaded using yahooquery, please provide a comprehensive report for stock ticker: {ticker} "
         f"including details on current performance, financials, valuation ratios, analyst ratings, and summarize all news clearly related to {ticker}. "
@@ -68,210 +189,262 @@ def review_and_analyze_stock(ticker, risk_tolerance, stock_data):
         f"4. **Valuation Ratios**: Assess P/E ratio, forward P/E, and price to sales ratio. Reasonable valuations based on industry norms favor 'Trade'. Extremely high or low valuations might favor 'Don't Trade'. Adjust for risk tolerance: for lower risk tolerance, prefer stocks with moderate valuations; for higher risk tolerance, be more open to stocks with extreme valuations.\n"
         f"5. **Risk and Volatility**: Use beta and other risk metrics to assess volatility. A beta close to 1 indicates average market risk; significantly higher beta suggests higher volatility, impacting the risk assessment based on {risk_tolerance}. Adjust for risk tolerance: for lower risk tolerance, avoid stocks with beta significantly above 1; for higher risk tolerance, be more accepting of high beta values.\n"
         f"6. **Industry Context**: Consider the industry norms and company profile information, such as the sector, industry, and business model. Ensure that the company’s performance and risks are evaluated in the context of its industry. Adjust for risk tolerance: for lower risk tolerance, prefer companies with stable industry performance; for higher risk tolerance, be more open to companies in more volatile or emerging industries.\n\n"
-        f"Here is the provided data:\n{json.dumps(stock_data, indent=2, default=str)}"
+        f"Here is the provided data (JSON, tables as columns and rows, oldest row first, sections listed under omitted were left out for length):\n{payload}"
     )
+    PROMPT_TOKENS.observe(_analysis_prompt.estimate_tokens(prompt))
 
-    response = client.chat.completions.create(model="gpt-4-turbo",
-    messages=[{"role": "user", "content": prompt}],
-    max_tokens=4096,  # Adjusted to allow for a larger response if needed
-    temperature=0.7)
-    return response.choices[0].message.content.strip()
-
-def get_current_mark(symbol,lookup = True):
-    global price_cache
-    # Check if the price is cached and still valid
-    if symbol in price_cache:
-        cached_price, timestamp = price_cache[symbol]
-        age_seconds = time.time() - timestamp
-        if age_seconds < CACHE_DURATION or not lookup:
-            return cached_price, age_seconds
+    start_time = time.perf_counter()
+    status = 'error'
     try:
-        # Fetch the current price from Yahoo Finance
-        stock = yf.Ticker(symbol)
+        response = (openai_client or client).chat.completions.create(model="gpt-4-turbo",
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=4096,  # Adjusted to allow for a larger response if needed
+        temperature=0.7)
+        status = 'ok'
+    finally:
+        OPENAI_SECONDS.observe(time.perf_counter() - start_time, status=status)
+    report = response.choices[0].message.content.strip()
+    _analysis_prompt.write_report(key, report)
+    ANALYSIS_REPORTS.inc(result='generated')
+    return report
+
+# Byte offset of every line start (and of the end) of lines
+def line_offsets(lines, offset=0):
+    offsets = [offset]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+    return offsets
+
+# Orders of the TradeActivity CSV lines (bytes, with their line endings) after the header,
+# with everything that does not depend on live prices already parsed. offset is the file
+# offset of lines[0]; each order keeps the offset of its row so parsing can resume there.
+def parse_trade_orders(lines, columns, offset):
+    symbol_idx, qty_idx, side_idx, price_idx, mark_idx, status_idx, time_placed_idx = columns
+    offsets = line_offsets(lines, offset)
+    reader = csv.reader(line.decode('utf-8', errors='replace') for line in lines)
+    starts = []
+    rows = []
+    while True:
+        start_line = reader.line_num
+        try:
+            rows.append(next(reader))
+        except StopIteration:
+            break
+        starts.append(offsets[start_line])
+
+    orders = []
+    i = 0
+    while i < len(rows):
+        row = rows[i]
+        if len(row) <= max(columns):
+            i += 1
+            continue
+
+        symbol = row[symbol_idx].strip()
+        side = row[side_idx].strip()
+        quantity = row[qty_idx].strip().replace('$', '').replace('(', '').replace(')', '').replace(',', '')
+        price = row[price_idx].strip()
+        mark = row[mark_idx].strip().replace('$', '')
+        status = row[status_idx].strip()
+        time_placed = row[time_placed_idx].strip()
+
+        if not quantity or not mark:
+            i += 1
+            continue
 
         try:
-            # Get the bid price from the stock's info
-            current_price = stock.info['bid']
-        except:
-            try:
-                current_price = stock.history(period='1d',interval='1m',prepost=True)['low'].iloc[-1]
-            except:
-                current_price = stock.history(period='1d',prepost=True)['Close'].iloc[-1]
-
-        # Check if the new price is the same as the cached price
-        if symbol in price_cache and price_cache[symbol][0] == current_price:
-            cached_price, timestamp = price_cache[symbol]
-            age_seconds = time.time() - timestamp
-            price_cache[symbol] = (current_price, time.time() + CACHE_DURATION)
-            return cached_price, CACHE_DURATION 
-
-        # Cache the price if different
-        price_cache[symbol] = (current_price, time.time())
-        return current_price, 0
-
-    except Exception as e:
-        # If there is an error, return the cached price with the age
-        if symbol in price_cache:
-            cached_price, timestamp = price_cache[symbol]
-            age_seconds = time.time() - timestamp
-            return cached_price, age_seconds
-        else:
-            # If no cached price exists, raise the exception
-            raise e
+            quantity = float(quantity)
+            mark = round(float(mark), 2)
+        except ValueError:
+            i += 1
+            continue
+
+        order = {'offset': starts[i]}
+        # A working sell with a trigger price has its price on the next row
+        if status == 'WORKING' and side == 'SELL':
+            if i + 1 < len(rows) and not _app_functions.is_float(price):
+                extra_row = rows[i + 1]
+                # The price row may still be partly written, it is parsed again after the append
+                if len(extra_row) > 11 and extra_row[11] != '':
+                    price = f"{extra_row[11]} {price}"
+                i += 1
 
+        order.update({'symbol': symbol, 'side': side, 'quantity': quantity, 'price': price, 'mark': mark,
+                      'status': status, 'time_placed': time_placed, 'dollar_quantity': '$' in row[qty_idx]})
+        orders.append(order)
+        i += 1
+    return orders
+
+# First 4 KB of the file and the 4 KB before offset, to tell an appended file from a new one
+def read_fingerprint(file, offset):
+    file.seek(0)
+    head = file.read(min(offset, FINGERPRINT_BYTES))
+    start = max(offset - FINGERPRINT_BYTES, 0)
+    file.seek(start)
+    return head + file.read(offset - start)
+
+# Parsed orders of a TradeActivity CSV, cached by path, mtime and size. When the file only
+# grew, parsing resumes at the last order's row (the rows after it, like the price row of
+# a working sell, may only just have been written) instead of starting over.
+def load_trade_orders(file_path):
+    with trade_orders_lock:
+        stat = os.stat(file_path)
+        cached = trade_orders_cache.get(file_path)
+        if cached and cached['size'] == stat.st_size and cached['mtime'] == stat.st_mtime:
+            return cached
+
+        with open(file_path, 'rb') as file:
+            if cached and stat.st_size > cached['size'] and read_fingerprint(file, cached['resume_offset']) == cached['fingerprint']:
+                columns = cached['columns']
+                resume_offset = cached['resume_offset']
+                file.seek(resume_offset)
+                data = file.read()
+                orders = [order for order in cached['orders'] if order['offset'] < resume_offset]
+                orders += parse_trade_orders(data.splitlines(keepends=True), columns, resume_offset)
+                size = resume_offset + len(data)
+                header_end = cached['header_end']
+            else:
+                data = file.read()
+                lines = data.splitlines(keepends=True)
+                offsets = line_offsets(lines)
+                columns = None
+                # The first line is the report title
+                for line_number, line in enumerate(lines[1:], start=1):
+                    row = next(csv.reader([line.decode('utf-8', errors='replace')]), [])
+                    if all(column in row for column in TRADE_COLUMNS):
+                        header = [col.strip() for col in row]
+                        columns = [header.index(column) for column in TRADE_COLUMNS]
+                        header_end = offsets[line_number + 1]
+                        break
+                if columns is None:
+                    trade_orders_cache.pop(file_path, None)
+                    return None
+                orders = parse_trade_orders(lines[line_number + 1:], columns, header_end)
+                size = len(data)
+
+            resume_offset = orders[-1]['offset'] if orders else header_end
+            cached = trade_orders_cache[file_path] = {
+                'size': size,
+                'mtime': stat.st_mtime,
+                'columns': columns,
+                'header_end': header_end,
+                'orders': orders,
+                'resume_offset': resume_offset,
+                'fingerprint': read_fingerprint(file, resume_offset)
+            }
+        return cached
+
+@PARSE_TRADE_DATA_SECONDS.time()
 def parse_trade_data(file_path):
-    start_time = int(time.time()) 
+    trade_orders = load_trade_orders(file_path)
+    if trade_orders is None:
+        return "Could not find the header with 'Time Placed', 'Symbol', 'Qty', 'Side', 'PRICE', 'Mark', and 'Status'"
+    orders = trade_orders['orders']
+
     history = _app_functions.load_history(HISTORY_FILE)
     new_history = {}
+    trade_metrics_memo = {}
     unique_tickers = set()
  
     total_price = 0
     total_profit = 0
 
-    file_mod_time = os.path.getmtime(file_path)
-    file_timestamp = datetime.fromtimestamp(file_mod_time)
-
-    with open(file_path, newline='') as csvfile:
-        reader = csv.reader(csvfile)
-
-        if datetime.now() - file_timestamp > timedelta(minutes=5):
-            # If the file is older than 5 minutes, use live prices
-            use_live_prices = True
+    file_timestamp = datetime.fromtimestamp(trade_orders['mtime'])
+
+    if datetime.now() - file_timestamp > timedelta(minutes=5):
+        # If the file is older than 5 minutes, use live prices
+        use_live_prices = True
+    else:
+        use_live_prices = False
+
+    categorized_orders = {}
+    working_orders = []
+    all_categories = set()
+    total_order_price = defaultdict(float)
+    total_order_profit = defaultdict(float)
+
+    # Keep the open orders' marks refreshed in the background
+    quote_cache.watch({order['symbol'] for order in orders if order['status'] == 'WORKING'})
+    if use_live_prices:
+        # Fetch the marks of every order's symbol up front in one batch
+        quote_cache.refresh([order['symbol'] for order in orders])
+
+    # Only the fields that depend on the live marks are computed per request
+    for order in orders:
+        symbol = order['symbol']
+        side = order['side']
+        quantity = order['quantity']
+        price = order['price']
+        mark = order['mark']
+        status = order['status']
+        time_placed = order['time_placed']
+
+        if use_live_prices:
+            mark, age_seconds = quote_cache.get_mark(symbol, mark, lookup=False)
+            cache_color = _app_functions.calculate_color(age_seconds, quote_cache.get_ttl(symbol))
         else:
-            use_live_prices = False
-
-        for _ in range(1):
-            next(reader)
-        
-        rows = list(reader)
-        
-        header = None
-        for row in rows:
-            if 'Time Placed' in row and 'Symbol' in row and 'Qty' in row and 'Side' in row and 'PRICE' in row and 'Mark' in row and 'Status' in row:
-                header = row
-                break
-
-        if header is None:
-            return "Could not find the header with 'Time Placed', 'Symbol', 'Qty', 'Side', 'PRICE', 'Mark', and 'Status'"
-
-        header = [col.strip() for col in header]
-        
-        symbol_idx = header.index('Symbol')
-        qty_idx = header.index('Qty')
-        side_idx = header.index('Side')
-        price_idx = header.index('PRICE')
-        mark_idx = header.index('Mark')
-        status_idx = header.index('Status')
-        time_placed_idx = header.index('Time Placed')
-
-        categorized_orders = {}
-        working_orders = []
-        all_categories = set()
-        total_order_price = defaultdict(float)
-        total_order_profit = defaultdict(float)
-
-        i = rows.index(header) + 1
-        while i < len(rows):
-            row = rows[i]
-            if len(row) <= max(symbol_idx, qty_idx, side_idx, price_idx, mark_idx, status_idx, time_placed_idx):
-                i += 1
-                continue
-
-            symbol = row[symbol_idx].strip()
-            side = row[side_idx].strip()
-            quantity = row[qty_idx].strip().replace('$', '').replace('(', '').replace(')', '').replace(',', '')
-            price = row[price_idx].strip()
-            mark = row[mark_idx].strip().replace('$', '')
-            status = row[status_idx].strip()
-            time_placed = row[time_placed_idx].strip()
-
-            if not quantity or not mark:
-                i += 1
-                continue
-
-            try:
-                quantity = float(quantity)
-                mark = round(float(mark), 2)
-            except ValueError:
-                i += 1
-                continue
-
-            if use_live_prices:
-                if int(time.time()) - 5 < start_time:
-                    lookup = True 
-                else:
-                    lookup = False 
-                mark, age_seconds = get_current_mark(symbol,lookup)
-                cache_color = _app_functions.calculate_color(age_seconds,CACHE_DURATION)
+            cache_color = '#00FF00'  # Green for fresh data within 5 minutes
+
+        if status == 'WORKING' and side == 'SELL':
+            trade_metrics = _app_functions.get_trade_metrics(symbol, trade_metrics_memo)
+            target_price_differential = round(float(price.split(' ')[0]) - mark if ' ' in price else float(price) - mark, 2)
+            key = f"{symbol}-{quantity}-{time_placed}"
+            last_differential = history.get(key, {}).get('differential', 0)
+            listed_date = int(history.get(key, {}).get('listed', time.time()))
+            completion_time = _app_functions.calculate_estimated_completion_time(trade_metrics,listed_date)
+            color = 'lightgrey' if key not in history else ('green' if target_price_differential < last_differential else 'red' if target_price_differential > last_differential else history[key].get('color', 'lightgrey'))
+
+            trg_value = float(price.split('+')[1].replace('%', '').replace('$', '')) if 'TRG+' in price else 0
+            shares = abs(quantity)
+            float_price = float(price.split(' ')[0])
+            if '%' in price:
+                profit = float_price - (float_price / (1 + (trg_value / 100))) 
             else:
-                cache_color = '#00FF00'  # Green for fresh data within 5 minutes
-
-            if status == 'WORKING' and side == 'SELL':
-                if i + 1 < len(rows) and not _app_functions.is_float(price):
-                    extra_row = rows[i + 1]
-                    if extra_row[11] != '':
-                        price = f"{extra_row[11]} {price}"
-                    i += 1
-                trade_metrics = _app_functions.calculate_trade_metrics(symbol)
-                target_price_differential = round(float(price.split(' ')[0]) - mark if ' ' in price else float(price) - mark, 2)
-                key = f"{symbol}-{quantity}-{time_placed}"
-                last_differential = history.get(key, {}).get('differential', 0)
-                listed_date = int(history.get(key, {}).get('listed', time.time()))
-                completion_time = _app_functions.calculate_estimated_completion_time(trade_metrics,listed_date)
-                color = 'lightgrey' if key not in history else ('green' if target_price_differential < last_differential else 'red' if target_price_differential > last_differential else history[key].get('color', 'lightgrey'))
-
-                trg_value = float(price.split('+')[1].replace('%', '').replace('$', '')) if 'TRG+' in price else 0
-                shares = abs(quantity)
-                float_price = float(price.split(' ')[0])
-                if '%' in price:
-                    profit = float_price - (float_price / (1 + (trg_value / 100))) 
-                else:
-                    profit = trg_value
-                total_price += float_price * shares
-                order_profit = shares * profit
-                total_profit += order_profit
-                bid_price = round(float_price - profit, 2)
-                order_cost = round(bid_price * shares, 2)
-                working_orders.append([symbol, quantity, f"Share Cost: ${bid_price:.2f}<br>Target Price: ${price}<br>Order Cost: ${order_cost:.2f}<br>Order Profit: ${order_profit:.2f}<br>ETC: {completion_time}", f"${mark:.2f}", f"${target_price_differential:.2f}", f"${last_differential:.2f}", color, cache_color])
-                if key not in history or history[key].get('mark', mark) != mark:
-                    new_history[key] = {'differential': target_price_differential, 'color': color, 'mark': mark, 'listed': listed_date}
-                else:
-                    new_history[key] = history[key]
-
+                profit = trg_value
+            total_price += float_price * shares
+            order_profit = shares * profit
+            total_profit += order_profit
+            bid_price = round(float_price - profit, 2)
+            order_cost = round(bid_price * shares, 2)
+            working_orders.append([symbol, quantity, f"Share Cost: ${bid_price:.2f}<br>Target Price: ${price}<br>Order Cost: ${order_cost:.2f}<br>Order Profit: ${order_profit:.2f}<br>ETC: {completion_time}", f"${mark:.2f}", f"${target_price_differential:.2f}", f"${last_differential:.2f}", color, cache_color])
+            if key not in history or history[key].get('mark', mark) != mark:
+                new_history[key] = {'differential': target_price_differential, 'color': color, 'mark': mark, 'listed': listed_date}
+            else:
+                new_history[key] = history[key]
+
+        last_digit = None
+        if side == 'BUY' and quantity >= 0:
+            last_digit = int(str(quantity)[-1]) if str(quantity)[-1].isdigit() else None
+        elif side == 'SELL' and quantity >= 0:
+            last_digit = int(str(quantity)[-1]) if str(quantity)[-1].isdigit() else None
+        if not order['dollar_quantity']:
             last_digit = None
-            if side == 'BUY' and quantity >= 0:
-                last_digit = int(str(quantity)[-1]) if str(quantity)[-1].isdigit() else None
-            elif side == 'SELL' and quantity >= 0:
-                last_digit = int(str(quantity)[-1]) if str(quantity)[-1].isdigit() else None
-            if '$' not in row[qty_idx]:
-                last_digit = None
-            if last_digit is not None:
-                all_categories.add(last_digit)
-                if symbol not in categorized_orders:
-                    categorized_orders[symbol] = {'BUY': defaultdict(lambda: {'count': 0, 'price': None}), 'SELL': defaultdict(lambda: {'count': 0, 'prices': set(), 'profit': None})}
+        if last_digit is not None:
+            all_categories.add(last_digit)
+            if symbol not in categorized_orders:
+                categorized_orders[symbol] = {'BUY': defaultdict(lambda: {'count': 0, 'price': None}), 'SELL': defaultdict(lambda: {'count': 0, 'prices': set(), 'profit': None})}
+            
+            if side == 'BUY':
+                shares = int(quantity // mark)
+                total_cost = shares * mark
+                categorized_orders[symbol]['BUY'][last_digit]['count'] += 1
+                if not categorized_orders[symbol]['BUY'][last_digit]['price']:
+                    categorized_orders[symbol]['BUY'][last_digit]['price'] = total_cost
+                    total_order_price[last_digit] += total_cost
+            elif side == 'SELL':
+                shares = int(quantity // mark)
+                if 'TRG+' in price:
+                    trg_value = float(price.split('+')[1].replace('%', '').replace('$', ''))
+                    if '%' in price:
+                        profit = shares * mark * (trg_value / 100)
+                    else:
+                        profit = shares * trg_value
+                    if not categorized_orders[symbol]['SELL'][last_digit]['profit']:
+                        categorized_orders[symbol]['SELL'][last_digit]['profit'] = profit
+                        total_order_profit[last_digit] += profit
                 
-                if side == 'BUY':
-                    shares = int(quantity // mark)
-                    total_cost = shares * mark
-                    categorized_orders[symbol]['BUY'][last_digit]['count'] += 1
-                    if not categorized_orders[symbol]['BUY'][last_digit]['price']:
-                        categorized_orders[symbol]['BUY'][last_digit]['price'] = total_cost
-                        total_order_price[last_digit] += total_cost
-                elif side == 'SELL':
-                    shares = int(quantity // mark)
-                    if 'TRG+' in price:
-                        trg_value = float(price.split('+')[1].replace('%', '').replace('$', ''))
-                        if '%' in price:
-                            profit = shares * mark * (trg_value / 100)
-                        else:
-                            profit = shares * trg_value
-                        if not categorized_orders[symbol]['SELL'][last_digit]['profit']:
-                            categorized_orders[symbol]['SELL'][last_digit]['profit'] = profit
-                            total_order_profit[last_digit] += profit
-                    
-                    categorized_orders[symbol]['SELL'][last_digit]['count'] += 1
-                    categorized_orders[symbol]['SELL'][last_digit]['prices'].add(price)
-            i += 1
+                categorized_orders[symbol]['SELL'][last_digit]['count'] += 1
+                categorized_orders[symbol]['SELL'][last_digit]['prices'].add(price)
 
     _app_functions.save_history(new_history,HISTORY_FILE)
     working_orders.sort(key=lambda x: float(x[4].replace('$','')))
@@ -316,19 +489,151 @@ def parse_trade_data(file_path):
     
     return headers, Report, working_orders
 
+# hot_picks.json and ranks.json content. They are ranked again in this process when the
+# CSV is newer than hot_picks.json or an analysis changed a trade status, reloaded when
+# hot_picks.json changed on disk (hot_picks.py run by get_tickers.py) and otherwise
+# served from memory.
+def get_hot_picks(csv_file_path):
+    with hot_picks_lock:
+        hot_picks_mtime = os.path.getmtime(HOT_PICKS_FILE) if os.path.exists(HOT_PICKS_FILE) else None
+        if hot_picks_mtime is None or os.path.getmtime(csv_file_path) > hot_picks_mtime or hot_picks_cache["stale"]:
+            with open(hot_picks.UNIQUE_TICKERS_FILE, "r") as file:
+                unique_tickers = json.load(file)
+            with HOT_PICKS_SECONDS.time():
+                picks, ranks = hot_picks.get_hot_picks(unique_tickers)
+            hot_picks_mtime = os.path.getmtime(HOT_PICKS_FILE)
+            HOT_PICKS_REQUESTS.inc(result='ranked')
+        elif hot_picks_mtime != hot_picks_cache["mtime"]:
+            with open(HOT_PICKS_FILE, "r") as file:
+                picks = json.load(file)
+            with open(hot_picks.RANKS_FILE, "r") as file:
+                ranks = json.load(file)
+            HOT_PICKS_REQUESTS.inc(result='reloaded')
+        else:
+            HOT_PICKS_REQUESTS.inc(result='cached')
+            return hot_picks_cache["hot_picks"], hot_picks_cache["ranks"]
+        hot_picks_cache.update({"mtime": hot_picks_mtime, "stale": False, "hot_picks": picks, "ranks": ranks})
+        return picks, ranks
+
+# Gzipped stock_data bodies by (ticker, kind, updated)
+def gzip_document(ticker, kind, updated, body):
+    key = (ticker, kind, updated)
+    with gzip_cache_lock:
+        compressed = gzip_cache.get(key)
+        if compressed is not None:
+            gzip_cache.move_to_end(key)
+            return compressed
+    compressed = gzip.compress(body, compresslevel=6)
+    with gzip_cache_lock:
+        gzip_cache[key] = compressed
+        while len(gzip_cache) > GZIP_CACHE_SIZE:
+            gzip_cache.popitem(last=False)
+    return compressed
+
+# Totals of a stored document (None when there is none), read again after DETAILS_CACHE_SECONDS.
+# index() fills the cache for the hot picks it renders, so the report's /api/details
+# requests that follow are answered from memory.
+def get_cached_totals(ticker, kind):
+    key = (ticker, kind)
+    now = time.time()
+    with details_cache_lock:
+        entry = details_cache.get(key)
+        if entry is not None and entry[0] > now:
+            details_cache.move_to_end(key)
+            return entry[1]
+    totals = _data_store.read_totals(ticker, kind)
+    with details_cache_lock:
+        details_cache[key] = (now + DETAILS_CACHE_SECONDS, totals)
+        details_cache.move_to_end(key)
+        while len(details_cache) > DETAILS_CACHE_SIZE:
+            details_cache.popitem(last=False)
+    return totals
+
+# {symbol: {kind: totals or null}} for comma separated symbols and kinds (DETAILS_KINDS,
+# the score kinds by default) in one response
+@app.route('/api/details')
+def api_details():
+    symbols = list(dict.fromkeys(symbol.strip() for symbol in request.args.get('symbols', '').split(',') if symbol.strip()))
+    kinds = [kind.strip() for kind in request.args.get('kinds', ','.join(_data_store.SCORE_KINDS)).split(',') if kind.strip()]
+    if not symbols:
+        return jsonify({"error": "symbols parameter is required"}), 400
+    if len(symbols) > DETAILS_MAX_SYMBOLS:
+        return jsonify({"error": f"At most {DETAILS_MAX_SYMBOLS} symbols per request"}), 400
+    unknown_kinds = [kind for kind in kinds if kind not in DETAILS_KINDS]
+    if unknown_kinds:
+        return jsonify({"error": f"Unknown kinds: {', '.join(unknown_kinds)}"}), 400
+
+    details = {symbol: {kind: get_cached_totals(symbol, kind) for kind in kinds} for symbol in symbols}
+    # Using Response to keep the stored key order
+    return Response(json.dumps(details), mimetype='application/json')
+
+# Stored documents are sent as stored, without parsing them: the JSON file itself when the
+# backend keeps one, otherwise the database text. Responses carry an ETag and Last-Modified
+# from the document's update time and are answered with 304 when the browser has them.
 @app.route('/stock_data/<path:filename>')
 def stock_data(filename):
-    file_path = os.path.join('stock_data', f'{filename}.json')
-    if not os.path.exists(file_path):
+    ticker, kind = _data_store.split_name(filename)
+    updated = _data_store.get_updated(ticker, kind) if kind and safe_join(_data_store.get_data_directory(), f"{ticker}_{kind}.json") else None
+    if updated is None:
         return jsonify({"error": "File not found"}), 404
 
-    with open(file_path, 'r') as file:
-        data = json.load(file, object_pairs_hook=OrderedDict)  # Preserve order
-    
-    # Using Response to ensure the JSON is dumped with OrderedDict
-    response = Response(json.dumps(data, indent=2), mimetype='application/json')
+    etag = hashlib.md5(f"{ticker}/{kind}/{updated}".encode('utf-8')).hexdigest()
+    last_modified = datetime.fromtimestamp(updated, timezone.utc).replace(microsecond=0)
+    if request.if_none_match.contains_weak(etag) or (
+            not request.if_none_match and request.if_modified_since and last_modified <= request.if_modified_since):
+        response = Response(status=304)
+    else:
+        compress = kind == 'Details' and 'gzip' in request.accept_encodings
+        path = _data_store.get_document_path(ticker, kind)
+        if path and not (compress and os.path.getsize(path) >= GZIP_MIN_BYTES):
+            response = send_file(path, mimetype='application/json', conditional=False, etag=False, last_modified=last_modified)
+        else:
+            document = _data_store.read_document_bytes(ticker, kind)
+            if document is None:
+                return jsonify({"error": "File not found"}), 404
+            body = document[0]
+            response = Response(body, mimetype='application/json')
+            if compress and len(body) >= GZIP_MIN_BYTES:
+                response.set_data(gzip_document(ticker, kind, updated, body))
+                response.headers['Content-Encoding'] = 'gzip'
+    if kind == 'Details':
+        response.vary.add('Accept-Encoding')
+    # Weak, the same ETag is given to the gzipped and plain bodies
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
     return response
 
+def get_analysis_path(ticker):
+    return f'./stock_data/{ticker}_Analysis.json'
+
+# Job of the analysis queue: fetch the data, ask OpenAI and write the analysis cache. The
+# hot picks are ranked again when the trade status of the ticker changed.
+def run_analysis(ticker, risk_tolerance):
+    cache_file_path = get_analysis_path(ticker)
+    current_trade_status = True
+    if os.path.exists(cache_file_path):
+        with open(cache_file_path, 'r') as cache_file:
+            current_trade_status = "Don't Trade" not in cache_file.read()
+
+    with ANALYSIS_FETCH_SECONDS.time():
+        stock_data = fetch_stock_data(ticker)
+    analysis = review_and_analyze_stock(ticker, risk_tolerance, stock_data)
+
+    # Write the analysis to the cache file
+    os.makedirs(os.path.dirname(cache_file_path), exist_ok=True)
+    with open(cache_file_path, 'w') as cache_file:
+        cache_file.write(analysis)
+
+    if ("Don't Trade" in analysis and current_trade_status) or \
+        ("Don't Trade" not in analysis and not current_trade_status):
+        hot_picks_cache["stale"] = True
+    return analysis
+
+analysis_jobs = _analysis_jobs.AnalysisJobs(run_analysis)
+
+# The cached analysis when it is newer than 24 hours, otherwise a job of the analysis queue
+# (202) to poll at /analyze_stock/jobs/<job_id>
 @app.route('/analyze_stock', methods=['GET'])
 def analyze_stock():
     ticker = request.args.get('ticker')
@@ -337,38 +642,42 @@ def analyze_stock():
     if not ticker:
         return jsonify({"error": "Ticker parameter is required"}), 400
 
-    cache_file_path = f'./stock_data/{ticker}_Analysis.json'
-    current_trade_status = True
-    # Check if the cache file exists and is newer than 6 hours
+    cache_file_path = get_analysis_path(ticker)
+    # Check if the cache file exists and is newer than 24 hours
     if os.path.exists(cache_file_path):
-        # Read the cached file and return its content with a timestamp
-        with open(cache_file_path, 'r') as cache_file:
-            cached_response = cache_file.read()
-        if "Don't Trade" in cached_response:
-            current_trade_status = False
         file_mod_time = datetime.fromtimestamp(os.path.getmtime(cache_file_path))
         if datetime.now() - file_mod_time < timedelta(hours=24):
+            # Read the cached file and return its content with a timestamp
+            with open(cache_file_path, 'r') as cache_file:
+                cached_response = cache_file.read()
             timestamp = file_mod_time.strftime('%Y-%m-%d %H:%M:%S')
-            return jsonify({"analysis": cached_response, "timestamp": timestamp})
+            return jsonify({"status": "done", "analysis": cached_response, "timestamp": timestamp})
 
-    try:
-        stock_data = fetch_stock_data(ticker)
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        analysis = review_and_analyze_stock(ticker, risk_tolerance, stock_data)
-        
-        # Write the analysis to the cache file
-        os.makedirs(os.path.dirname(cache_file_path), exist_ok=True)
-        with open(cache_file_path, 'w') as cache_file:
-            cache_file.write(analysis)
-        
-        if ("Don't Trade" in analysis and current_trade_status) or \
-            ("Don't Trade" not in analysis and not current_trade_status):
-            subprocess.run(["python3", "hot_picks.py"])
-
-        return jsonify({"analysis": analysis, "timestamp": current_time})
-    except Exception as e:
-        return jsonify({"analysis": str(e), "timestamp": current_time}), 500
+    job = analysis_jobs.submit(ticker, risk_tolerance)
+    return jsonify(job), 202
+
+@app.route('/analyze_stock/jobs/<job_id>', methods=['GET'])
+def analyze_stock_job(job_id):
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+def collect_analysis_jobs():
+    stats = analysis_jobs.stats()
+    return [
+        ('stock_tracker_analysis_jobs_total', 'counter', 'Analysis jobs by how they ended or were answered',
+         [({'result': result}, stats[result]) for result in ('submitted', 'deduplicated', 'completed', 'failed')]),
+        ('stock_tracker_analysis_jobs', 'gauge', 'Analysis jobs waiting or running',
+         [({'status': status}, stats[status]) for status in ('queued', 'running')])
+    ]
 
+_metrics.add_collector(collect_analysis_jobs)
+
+
+@app.route('/metrics')
+def metrics():
+    return Response(_metrics.render(), content_type=_metrics.CONTENT_TYPE)
 
 @app.route('/')
 def index():
@@ -376,28 +685,20 @@ def index():
     if not csv_file_path:
         return "No CSV files found matching the pattern."
 
-    # Compare the timestamps and run the script if csv_file_path is newer
-    if not os.path.exists(HOT_PICKS_FILE) or os.path.getmtime(csv_file_path) > os.path.getmtime(HOT_PICKS_FILE):
-        subprocess.run(["python3", "hot_picks.py"])
-
     headers, Report, working_orders = parse_trade_data(csv_file_path)
     filename = os.path.basename(csv_file_path)
 
-    # Load hot_picks.json
-    with open("hot_picks.json", "r") as file:
-        hot_picks = json.load(file)
-    #Load rank.json
-    with open("ranks.json", "r") as file:
-        ranks = json.load(file)
+    # Hot picks for the tickers parse_trade_data just wrote to unique_tickers.json
+    picks, ranks = get_hot_picks(csv_file_path)
 
     # Load the details for each symbol in hot_picks
     def load_symbol_details(symbol, ranks):
         details = {}
         try:
-            with open(f'stock_data/{symbol}_Chart_1Mo_5Mi.json', 'r') as f:
-                details['1Mo_5Mi'] = json.load(f)[symbol]["totals"]
-            with open(f'stock_data/{symbol}_Overall_Trend.json', 'r') as f:
-                details['Overall_Trend'] = json.load(f)[symbol]["totals"]
+            details['1Mo_5Mi'] = get_cached_totals(symbol, 'Chart_1Mo_5Mi')
+            details['Overall_Trend'] = get_cached_totals(symbol, 'Overall_Trend')
+            if details['1Mo_5Mi'] is None or details['Overall_Trend'] is None:
+                raise FileNotFoundError(f"No stored totals for {symbol}")
             if symbol in ranks:
                 details['Rank'] = ranks[symbol]["totals"]
             else:
@@ -416,11 +717,11 @@ def index():
             details['trade_status'] = {}
         return details
     
-    buy_details = {symbol: load_symbol_details(symbol, ranks) for symbol in hot_picks['buy_symbols']}
-    sell_details = {symbol: load_symbol_details(symbol, ranks) for symbol in hot_picks['sell_symbols']}
-    hold_details = {symbol: load_symbol_details(symbol, ranks) for symbol in hot_picks['hold_symbols']}
+    buy_details = {symbol: load_symbol_details(symbol, ranks) for symbol in picks['buy_symbols']}
+    sell_details = {symbol: load_symbol_details(symbol, ranks) for symbol in picks['sell_symbols']}
+    hold_details = {symbol: load_symbol_details(symbol, ranks) for symbol in picks['hold_symbols']}
 
-    return render_template('Report.html', headers=headers, Report=Report, working_orders=working_orders, filename=filename, hot_picks=hot_picks, buy_details=buy_details, sell_details=sell_details, hold_details=hold_details, version=VERSION)
+    return render_template('Report.html', headers=headers, Report=Report, working_orders=working_orders, filename=filename, hot_picks=picks, buy_details=buy_details, sell_details=sell_details, hold_details=hold_details, version=VERSION)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,551 @@
+#!python3
+# Benchmarks of the analysis and report hot paths on deterministic synthetic data. Runs
+# offline: the charts, the stock_data store, the TradeActivity CSV and the quotes are all
+# generated, in a temporary directory that is removed afterwards.
+#
+#   python3 benchmark.py                      # all benchmarks, default sizes
+#   python3 benchmark.py --quick              # small sizes, for a smoke test
+#   python3 benchmark.py --only sweep --only parse_trade_data
+#   python3 benchmark.py --compare old.json   # also print the change against an earlier run
+#   python3 benchmark.py --check-engines      # numpy and pandas trigger engines agree
+#   python3 benchmark.py --check-schwab       # Schwab client against a local stand-in server
+import os
+import io
+import csv
+import sys
+import json
+import time
+import random
+import shutil
+import types
+import platform
+import argparse
+import tempfile
+import contextlib
+import statistics
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import _app_constants
+import _market_calendar
+import _timing
+import _app_functions
+import _analysis_prompt
+import _schwab_api
+import get_stock_data
+import hot_picks
+from _quote_cache import QuoteCache
+# app.py creates its OpenAI client on import, no requests are made with it
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+import app
+
+OUTPUT_FILE = 'benchmark_results.json'
+SEED = 0
+REPEAT = 3
+# Sizes of every benchmark: bars, trades, tickers, CSV symbols or statement periods
+SIZES = {
+    'identify_triggers': [2000, 10000, 50000],
+    'identify_triggers_pandas': [2000, 10000],
+    'sweep': [2000, 10000],
+    'calculate_totals': [100, 1000, 10000],
+    'calculate_trade_metrics': [100, 1000, 5000],
+    'get_Scores': [500, 2000, 8000],
+    'filter_scores': [500, 2000, 8000],
+    'parse_trade_data': [50, 200, 1000],
+    'parse_trade_data_cached': [50, 200, 1000],
+    'analysis_prompt': [5, 20, 80]
+}
+QUICK_SIZES = {name: sizes[:1] for name, sizes in SIZES.items()}
+CHART_BARS = 400  # Bars of the 5 minute charts of the synthetic stock_data tickers
+CHART_VARIANTS = 50  # Distinct charts shared by the synthetic stock_data tickers
+ROWS_PER_SYMBOL = 6  # TradeActivity orders per CSV symbol
+STATEMENT_FIELDS = 60  # Columns of the synthetic cash flow, balance sheet and income statements
+NEWS_ITEMS = 20
+
+# Synthetic data
+
+def make_symbols(count):
+    return [f"T{i:05d}" for i in range(count)]
+
+# Random walk OHLCV bars at freq, only on weekdays between 4:00 AM and 8:00 PM Eastern
+# (Yahoo's prepost hours) for intraday frequencies
+def make_bars(count, seed=SEED, freq='5min', start='2024-01-02 04:00'):
+    rng = np.random.default_rng(seed)
+    intraday = pd.Timedelta(freq) < pd.Timedelta('1D')
+    index = pd.DatetimeIndex([])
+    span = count
+    while len(index) < count:
+        span *= 2
+        index = pd.date_range(start, periods=span, freq=freq, tz='America/New_York')
+        index = index[index.weekday < 5]
+        if intraday:
+            index = index[(index.hour >= 4) & (index.hour < 20)]
+    index = index[:count]
+
+    close = 50 * np.exp(np.cumsum(rng.normal(0.0001, 0.004, count)))
+    open_ = np.concatenate([[close[0]], close[:-1]]) * (1 + rng.normal(0, 0.001, count))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.002, count)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.002, count)))
+    volume = rng.integers(1000, 100000, count)
+    return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume}, index=index)
+
+def make_monthly_bars(years, seed=SEED):
+    return get_stock_data.resample_monthly(make_bars(years * 261, seed, freq='1D', start='2000-01-03'))
+
+# Trades in the chart JSON layout, the last one still open
+def make_trades(count, seed=SEED):
+    rng = random.Random(seed)
+    bars = pd.date_range('2023-01-03 09:30', periods=count * 40, freq='30min', tz='America/New_York')
+    bars = bars[(bars.weekday < 5) & (bars.hour >= 9) & (bars.hour < 16)]
+    trades = []
+    position = 0
+    for i in range(count):
+        position = min(position + rng.randrange(1, 8), len(bars) - 2)
+        trade = {"buy_price": 50.0, "buy_timestamp": str(bars[position])}
+        if i < count - 1:
+            position = min(position + rng.randrange(1, 20), len(bars) - 1)
+            trade.update({"sell_price": 51.0, "sell_timestamp": str(bars[position]), "profit": 2.0})
+        trades.append(trade)
+    return trades
+
+# The Overall_Trend totals analyze_stock would write for a monthly chart
+def make_overall_trend(monthly, rng):
+    monthly = monthly * rng.uniform(0.5, 2)
+    start_price = round(float(monthly[['High', 'Low', 'Open', 'Close']].iloc[0].mean()), 2)
+    end_price = round(float(monthly[['High', 'Low', 'Open', 'Close']].iloc[-1].mean()), 2) * rng.uniform(0.5, 2)
+    return {
+        "CIK": str(rng.randrange(1000, 999999)),
+        "Earnings_Date": "None",
+        "Start_Date": monthly.index.min().strftime('%Y-%m-%d'),
+        "First_Month_Average": start_price,
+        "Current_Month_Average": round(end_price, 2),
+        "Overall_Trend": "Upward" if end_price > start_price else "Downward",
+        "Highest_High": round(float(monthly['High'].max()), 2),
+        "Recommendation": rng.choice(["Strong Buy", "Buy", "Hold"]),
+        "MA_Analysis": {"Trade_Status": rng.choice(["Trade", "Do Not Trade"])},
+        "Risk": rng.randrange(1, 10),
+        "Score": round(rng.uniform(0, 100), 2)
+    }
+
+# A stock_data store of count tickers: a backtested 5 minute chart (from the real
+# select_best_threshold/json_file_query path) and Overall_Trend totals for each one.
+# The tickers share CHART_VARIANTS charts, so large stores are quick to build.
+def make_stock_data(count, seed=SEED):
+    rng = random.Random(seed)
+    monthly = make_monthly_bars(10, seed)
+    charts = []
+    for i in range(min(count, CHART_VARIANTS)):
+        best_triggers, best_trades, best_totals, _ = get_stock_data.select_best_threshold(
+            get_stock_data.sweep_triggers(make_bars(CHART_BARS, seed + i)), '1Mo', '5Mi')
+        charts.append((best_triggers, best_trades, best_totals, _market_calendar.trade_metrics(best_trades)))
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i, ticker in enumerate(make_symbols(count)):
+            best_triggers, best_trades, best_totals, trade_metrics = charts[i % len(charts)]
+            best_totals = dict(best_totals, Score=round(rng.uniform(0, 50), 2))
+            get_stock_data.json_file_query(ticker, best_triggers, best_trades, best_totals, f"{ticker}_Chart_1Mo_5Mi.json", trade_metrics)
+            get_stock_data.json_file_query(ticker, [], [], make_overall_trend(monthly, rng), f"{ticker}_Overall_Trend.json")
+
+# A TradeActivity CSV (the Schwab/thinkorswim export) with working buys and trigger sells
+def make_trade_activity(path, symbols, seed=SEED):
+    rng = random.Random(seed)
+    header = ['Notes', 'Time Placed', 'Spread', 'Side', 'Qty', 'Pos Effect', 'Symbol', 'Exp', 'Strike', 'Type', 'PRICE', 'TIF', 'Mark', 'Status']
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["Today's Trade Activity for 000000000 (Individual) on 1/2/24 09:30:00"])
+        writer.writerow([])
+        writer.writerow(['Working Orders'])
+        writer.writerow(header)
+        for symbol in symbols:
+            mark = round(rng.uniform(5, 300), 2)
+            for row in range(ROWS_PER_SYMBOL):
+                shares = 100 * rng.randrange(1, 4)
+                placed = f"1/{row + 2}/24 09:3{row}:00"
+                if row % 2 == 0:
+                    writer.writerow(['', placed, 'STOCK', 'BUY', f"+{shares}", 'TO OPEN', symbol, '', '', 'STOCK', f"{mark:.2f}", 'GTC', f"{mark:.2f}", 'WORKING'])
+                else:
+                    writer.writerow(['', placed, 'STOCK', 'SELL', f"-{shares}", 'TO CLOSE', symbol, '', '', 'STOCK', 'TRG+2.00%', 'GTC', f"{mark:.2f}", 'WORKING'])
+                    writer.writerow(['', '', '', '', '', '', '', '', '', '', '', f"{mark * 1.02:.2f}", '', ''])
+    # Older than 5 minutes, so parse_trade_data goes through the quote cache
+    old = time.time() - 600
+    os.utime(path, (old, old))
+
+# fetch_stock_data's result in yahooquery's shapes, with periods rows in every statement
+def make_analysis_data(periods, seed=SEED):
+    rng = np.random.default_rng(seed)
+    words = ['revenue', 'growth', 'market', 'shares', 'guidance', 'quarter', 'analysts', 'demand', 'margin', 'outlook']
+
+    def text(count):
+        return ' '.join(rng.choice(words, count))
+
+    def statement():
+        dates = pd.date_range(end='2024-12-31', periods=periods, freq='QE')
+        table = pd.DataFrame(rng.normal(1e9, 3e8, (periods, STATEMENT_FIELDS)),
+                             columns=[f"Field{i}" for i in range(STATEMENT_FIELDS)], index=pd.Index(['TEST'] * periods, name='symbol'))
+        table.insert(0, 'asOfDate', dates)
+        table.insert(1, 'periodType', '3M')
+        table.insert(2, 'currencyCode', 'USD')
+        return table
+
+    closes = 50 * np.exp(np.cumsum(rng.normal(0, 0.01, 200)))
+    return {
+        "current_price": closes[-1],
+        "financials": {'TEST': {f"metric{i}": float(rng.normal(10, 5)) for i in range(30)}},
+        "earnings": {'TEST': {'financialsChart': {'quarterly': [{'date': f"{q}Q2024", 'revenue': float(rng.normal(1e9, 1e8)), 'earnings': float(rng.normal(1e8, 1e7))} for q in range(1, 5)]}}},
+        "recommendations": {'TEST': {'recommendedSymbols': [{'symbol': f"R{i}", 'score': float(rng.random())} for i in range(5)]}},
+        "analyst_ratings": pd.DataFrame({'period': ['0m', '-1m', '-2m', '-3m'], 'strongBuy': rng.integers(0, 10, 4), 'buy': rng.integers(0, 20, 4),
+                                         'hold': rng.integers(0, 20, 4), 'sell': rng.integers(0, 5, 4), 'strongSell': rng.integers(0, 3, 4)}),
+        "news": [{'title': text(12), 'link': f"https://example.com/{i}", 'published': 'Tue, 02 Jan 2024 14:00:00 +0000', 'summary': text(120)}
+                 for i in range(NEWS_ITEMS)],
+        "cashflow": statement(),
+        "balance_sheet": statement(),
+        "income_statement": statement(),
+        "summary_detail": {'TEST': {f"detail{i}": float(rng.normal(100, 30)) for i in range(40)}},
+        "summary_profile": {'TEST': {'sector': 'Technology', 'industry': 'Software', 'longBusinessSummary': text(300)}},
+        "moving_averages": {f"{days}_day": float(closes[-days:].mean()) for days in (20, 50, 100, 200)}
+    }
+
+# OpenAI client that answers at once and keeps the last prompt
+class StubOpenAI:
+    def __init__(self):
+        self.prompt = None
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def create(self, model, messages, **kwargs):
+        self.prompt = messages[-1]['content']
+        message = types.SimpleNamespace(content="Benchmark report\ntrade_status: Trade")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+# Benchmark workspace: a temporary directory holding stock_data, the score index and the
+# files the ranking and report write to the working directory
+@contextlib.contextmanager
+def workspace():
+    previous = os.getcwd(), _app_constants.DATA_PATH, _app_constants.SCORE_INDEX_FILE
+    with tempfile.TemporaryDirectory(prefix='stock_tracker_bench_') as directory:
+        _app_constants.DATA_PATH = os.path.join(directory, 'stock_data')
+        _app_constants.SCORE_INDEX_FILE = os.path.join(directory, 'score_index.jsonl')
+        os.makedirs(_app_constants.DATA_PATH)
+        os.chdir(directory)
+        try:
+            yield directory
+        finally:
+            os.chdir(previous[0])
+            _app_constants.DATA_PATH, _app_constants.SCORE_INDEX_FILE = previous[1:]
+
+# Trigger engine check
+
+# Synthetic 5 minute charts that exercise the edge cases of the trigger engines: bars
+# outside trading hours (make_bars covers 4:00 AM to 8:00 PM), rows of NaN like Yahoo
+# returns for missing bars, and a chart whose last bar sells the open trade
+def make_engine_cases(seed=SEED):
+    bars = make_bars(2000, seed)
+    with_nan = bars.copy()
+    rng = np.random.default_rng(seed)
+    with_nan.iloc[rng.choice(np.arange(2, len(bars)), 60, replace=False)] = np.nan
+    with_nan.iloc[-1] = np.nan
+    cases = {'extended_hours': bars, 'nan_bars': with_nan}
+
+    # End the chart in trading hours on the bar after an open buy and raise its high over
+    # the sell price of that buy
+    data = bars[[get_stock_data.is_trading_hours(timestamp) for timestamp in bars.index]]
+    for threshold in get_stock_data.THRESHOLDS:
+        for end in range(len(data) - 1, 2, -1):
+            trades = get_stock_data.identify_triggers_pandas(data.iloc[:end], threshold)[1]
+            if trades and 'sell_timestamp' not in trades[-1]:
+                last_sell = data.iloc[:end + 1].copy()
+                last_sell.iloc[-1, last_sell.columns.get_loc('High')] = trades[-1]['buy_price'] * (1 + threshold / 100) * 1.01
+                cases[f'sell_on_last_bar_{threshold}'] = last_sell
+                break
+        if any(name.startswith('sell_on_last_bar') for name in cases):
+            break
+    return cases
+
+# Compare the numpy (single and sweep) and pandas trigger engines on the synthetic charts,
+# with and without the trading hours filter. Returns the number of disagreements.
+def check_trigger_engines(seed=SEED):
+    failures = 0
+    for name, data in make_engine_cases(seed).items():
+        for trading_hours in (True, False):
+            mismatches = get_stock_data.compare_trigger_engines(data, trading_hours=trading_hours)
+            failures += len(mismatches)
+            status = f"disagree for thresholds: {mismatches}" if mismatches else "match for all thresholds"
+            print(f"{name:<26} trading_hours={trading_hours!s:<5} {len(data):>5} bars: engines {status}")
+        if name.startswith('sell_on_last_bar'):
+            threshold = int(name.rsplit('_', 1)[1])
+            trades = get_stock_data.identify_triggers_pandas(data, threshold)[1]
+            if not any(trade.get('sell_timestamp') == str(data.index[-1]) for trade in trades):
+                print(f"{name}: the last bar did not sell the open trade")
+                failures += 1
+    return failures
+
+# Schwab client check
+
+DAY_MS = 24 * 60 * 60 * 1000
+SCHWAB_HISTORY_DAYS = 35  # Days of candles the stand-in server has, the client keeps 30
+
+# Stand-in for the Schwab /marketdata/v1/pricehistory endpoint. Every window holds a day
+# more than the 10 the client asks for, so consecutive windows overlap, and the first
+# request of every symbol is answered with 429 to make the client retry.
+class PriceHistoryHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        with server.lock:
+            server.requests += 1
+            throttle = params.get('symbol') not in server.throttled
+            server.throttled.add(params.get('symbol'))
+        if url.path != '/marketdata/v1/pricehistory' or self.headers.get('Authorization') != 'Bearer check':
+            return self.reply(404, {})
+        if throttle:
+            with server.lock:
+                server.throttles += 1
+            return self.reply(429, {'errors': ['Too many requests']}, {'Retry-After': '0'})
+        end = int(params['endDate'])
+        start = int(params['startDate']) if 'startDate' in params else end - 11 * DAY_MS
+        start = max(start, server.now - SCHWAB_HISTORY_DAYS * DAY_MS)
+        step = 5 * 60 * 1000
+        candles = [{'datetime': at, 'open': 10.0, 'high': 10.5, 'low': 9.5, 'close': 10.0, 'volume': 100}
+                   for at in range(start - start % step + step, end + 1, step)]
+        self.reply(200, {'symbol': params['symbol'], 'candles': candles, 'empty': not candles})
+
+    def reply(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+@contextlib.contextmanager
+def schwab_stand_in():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PriceHistoryHandler)
+    server.lock = threading.Lock()
+    server.requests = server.throttles = 0
+    server.throttled = set()
+    server.now = int(time.time() * 1000)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server, f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+# Problems with candles returned for 30 days: duplicates, order, or outside the window
+def candle_problems(candles, now):
+    times = [candle['datetime'] for candle in candles]
+    if not times:
+        return ['no candles']
+    problems = []
+    if len(set(times)) != len(times):
+        problems.append(f"{len(times) - len(set(times))} duplicate candles")
+    if times != sorted(times):
+        problems.append('candles out of order')
+    if times[0] < now - 30 * DAY_MS - 60 * 1000:
+        problems.append('candles older than 30 days')
+    return problems
+
+# Run the Schwab price history client against the stand-in server: the single and many
+# ticker 30 day collections and the top-up since a date. Returns the number of problems.
+def check_schwab_client():
+    failures = 0
+    with schwab_stand_in() as (server, base_url):
+        results = {
+            'collect_30_days_of_data': _schwab_api.collect_30_days_of_data('AAA', 'check', base_url=base_url),
+            'collect_data_since': _schwab_api.collect_data_since('BBB', 'check', server.now - 2 * DAY_MS, base_url=base_url)
+        }
+        for ticker, candles in _schwab_api.collect_30_days_of_data_many(['CCC', 'DDD'], 'check', base_url=base_url).items():
+            results[f'collect_30_days_of_data_many {ticker}'] = candles
+        if len(results) != 4:
+            print(f"collect_30_days_of_data_many returned {len(results) - 2} of 2 tickers")
+            failures += 1
+        for name, candles in results.items():
+            problems = candle_problems(candles, server.now)
+            failures += len(problems)
+            print(f"{name:<36} {len(candles):>5} candles: {', '.join(problems) or 'ok'}")
+        print(f"{server.requests} requests, {server.throttles} answered with 429 and retried")
+        if server.throttles != 4:
+            print('Expected one 429 per ticker')
+            failures += 1
+    return failures
+
+# Timing
+
+# Run function repeat times (setup first each time, untimed) and summarize the seconds
+def measure(function, repeat, setup=None):
+    seconds = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start_time = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+        seconds.append(time.perf_counter() - start_time)
+    return {
+        'repeat': repeat,
+        'min': min(seconds),
+        'median': statistics.median(seconds),
+        'mean': statistics.mean(seconds),
+        'max': max(seconds)
+    }
+
+def bench_identify_triggers(size, repeat, engine='numpy'):
+    data = make_bars(size)
+    return measure(lambda: get_stock_data.identify_triggers(data, 2, True, engine=engine), repeat)
+
+def bench_identify_triggers_pandas(size, repeat):
+    return bench_identify_triggers(size, repeat, engine='pandas')
+
+# The threshold sweep and best threshold selection of analyze_chart
+def bench_sweep(size, repeat):
+    data = make_bars(size)
+    return measure(lambda: get_stock_data.select_best_threshold(get_stock_data.sweep_triggers(data), '1Mo', '5Mi'), repeat)
+
+def bench_calculate_totals(size, repeat):
+    trades = make_trades(size)
+    return measure(lambda: get_stock_data.calculate_totals(trades, size * 3, 2), repeat)
+
+def bench_calculate_trade_metrics(size, repeat):
+    with workspace():
+        with contextlib.redirect_stdout(io.StringIO()):
+            get_stock_data.json_file_query('BENCH', [], make_trades(size), {'Score': 1}, 'BENCH_Chart_1Mo_5Mi.json')
+        return measure(lambda: _app_functions.calculate_trade_metrics('BENCH'), repeat)
+
+def bench_get_Scores(size, repeat):
+    with workspace():
+        make_stock_data(size)
+        return measure(hot_picks.get_Scores, repeat)
+
+def bench_filter_scores(size, repeat):
+    with workspace():
+        make_stock_data(size)
+        held = make_symbols(size)[::10]
+        with contextlib.redirect_stdout(io.StringIO()):
+            scores = hot_picks.get_Scores()
+        return measure(lambda: [hot_picks.filter_scores(scores, held, 999999, trade_type) for trade_type in ('buy', 'hold', 'sell')], repeat)
+
+# Marks for the quote cache without the network
+def offline_marks(symbols):
+    return {symbol: 100 + sum(map(ord, symbol)) % 100 for symbol in symbols}
+
+def bench_parse_trade_data(size, repeat, cached=False):
+    with workspace() as directory:
+        symbols = make_symbols(size)
+        make_stock_data(size)
+        path = os.path.join(directory, 'Bench-TradeActivity.csv')
+        make_trade_activity(path, symbols)
+
+        def reset():
+            # Fresh parse of the CSV, trade metrics and marks every round
+            if os.path.exists(app.HISTORY_FILE):
+                os.remove(app.HISTORY_FILE)
+            app.trade_orders_cache.clear()
+            app.quote_cache = QuoteCache(fetch=offline_marks)
+        reset()
+        if cached:
+            with contextlib.redirect_stdout(io.StringIO()):
+                app.parse_trade_data(path)
+        return measure(lambda: app.parse_trade_data(path), repeat, None if cached else reset)
+
+# Repeated requests with the CSV already parsed and the marks cached
+def bench_parse_trade_data_cached(size, repeat):
+    return bench_parse_trade_data(size, repeat, cached=True)
+
+# Building the prompt of an AI report and asking a stubbed client, with the report cache
+# emptied every round. The prompt size is reported next to the size of the uncondensed data.
+def bench_analysis_prompt(size, repeat):
+    with workspace():
+        stock_data = make_analysis_data(size)
+        stub = StubOpenAI()
+
+        def reset():
+            shutil.rmtree(os.path.join(_app_constants.DATA_PATH, _analysis_prompt.REPORTS_DIRECTORY), ignore_errors=True)
+        result = measure(lambda: app.review_and_analyze_stock('TEST', 5, stock_data, openai_client=stub), repeat, reset)
+        result['prompt_tokens'] = _analysis_prompt.estimate_tokens(stub.prompt)
+        result['uncondensed_tokens'] = _analysis_prompt.estimate_tokens(json.dumps(stock_data, indent=2, default=str))
+        return result
+
+BENCHMARKS = {
+    'identify_triggers': bench_identify_triggers,
+    'identify_triggers_pandas': bench_identify_triggers_pandas,
+    'sweep': bench_sweep,
+    'calculate_totals': bench_calculate_totals,
+    'calculate_trade_metrics': bench_calculate_trade_metrics,
+    'get_Scores': bench_get_Scores,
+    'filter_scores': bench_filter_scores,
+    'parse_trade_data': bench_parse_trade_data,
+    'parse_trade_data_cached': bench_parse_trade_data_cached,
+    'analysis_prompt': bench_analysis_prompt
+}
+
+def run(names, sizes, repeat):
+    results = []
+    for name in names:
+        for size in sizes[name]:
+            result = {'name': name, 'size': size}
+            result.update(BENCHMARKS[name](size, repeat))
+            results.append(result)
+            print(f"{name:<26} {size:>7} {result['median'] * 1000:>12.2f} ms")
+    return results
+
+def environment():
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'storage_backend': _app_constants.STORAGE_BACKEND,
+        'seed': SEED
+    }
+
+# Print the median of every result next to the same benchmark and size in an earlier run
+def compare(results, previous_file):
+    with open(previous_file, 'r') as file:
+        previous = {(result['name'], result['size']): result for result in json.load(file)['results']}
+    print(f"\n{'benchmark':<26} {'size':>7} {'before ms':>12} {'after ms':>12} {'speedup':>8}")
+    for result in results:
+        before = previous.get((result['name'], result['size']))
+        if before:
+            print(f"{result['name']:<26} {result['size']:>7} {before['median'] * 1000:>12.2f} "
+                  f"{result['median'] * 1000:>12.2f} {before['median'] / max(result['median'], 1e-9):>7.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the analysis and report hot paths on synthetic data.')
+    parser.add_argument('--only', action='append', choices=list(BENCHMARKS), help='Benchmark to run, can be repeated (default: all)')
+    parser.add_argument('--quick', action='store_true', help='Only the smallest size of every benchmark')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help=f'Timed runs per benchmark and size (default: {REPEAT})')
+    parser.add_argument('--backend', choices=['sqlite', 'json'], default=_app_constants.STORAGE_BACKEND, help='stock_data storage backend')
+    parser.add_argument('--output', default=OUTPUT_FILE, help=f'JSON results file (default: {OUTPUT_FILE})')
+    parser.add_argument('--compare', help='Results file of an earlier run to compare with')
+    parser.add_argument('--check-engines', action='store_true', help='Only compare the numpy and pandas trigger engines on synthetic charts, exits with 1 when they disagree')
+    parser.add_argument('--check-schwab', action='store_true', help='Only run the Schwab price history client against a local stand-in server, exits with 1 on problems')
+    args = parser.parse_args()
+
+    if args.check_engines or args.check_schwab:
+        failures = check_trigger_engines() if args.check_engines else 0
+        failures += check_schwab_client() if args.check_schwab else 0
+        return 1 if failures else 0
+
+    _app_constants.STORAGE_BACKEND = args.backend
+    # Keep the synthetic runs out of the pipeline's timing spans
+    _timing.ENABLED = False
+    output = os.path.abspath(args.output)
+    results = run(args.only or list(BENCHMARKS), QUICK_SIZES if args.quick else SIZES, args.repeat)
+
+    with open(output, 'w') as file:
+        json.dump({'environment': environment(), 'results': results}, file, indent=4)
+    print(f"Results written to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,45 +9,200 @@ import json
 from datetime import time, datetime, timedelta
 import pytz
 import warnings
+import traceback
 import _schwab_api
 import _sec_api
-import _file_functions
+import _data_store
+import _trigger_engine
+import _bar_store
+import _market_calendar
+import _timing
 
 warnings.filterwarnings("ignore")
 
+# Engine used by identify_triggers: 'numpy' (_trigger_engine) or 'pandas' (bar by bar loop)
+TRIGGER_ENGINE = 'numpy'
+# Drop-from-high thresholds (percent) tried by analyze_chart
+THRESHOLDS = range(1, 21)
+# Tickers per multi-ticker download / stacked batch in analyze_charts_batch
+BATCH_SIZE = 200
+# Serve charts from the local bar store (_bar_store) and only fetch the newest bars
+USE_BAR_STORE = True
+# Period fetched when a bar store is created, intraday history is limited on Yahoo
+STORE_PERIODS = {'1m': '7d', '2m': '60d', '5m': '60d', '15m': '60d', '30m': '60d', '60m': '730d', '90m': '60d', '1h': '730d'}
+# quoteSummary modules kept in the Details documents, the ones the scoring reads
+DETAIL_MODULES = ['financialData', 'summaryDetail', 'defaultKeyStatistics', 'assetProfile', 'calendarEvents']
+DETAILS_MAX_AGE = 2880  # Minutes before a Details document is fetched again
+DETAILS_WORKERS = 8  # Concurrent yahooquery requests of a details batch
+
 if os.path.exists('etf_list.json'):
     with open('etf_list.json', 'r') as file:
         etf_list = json.load(file)
 
 
-def get_serializable_attributes(ticker):
-    serializable_attrs = {}
-    try:
-        for attr in dir(ticker):
-            if not attr.startswith('_'):
-                try:
-                    value = getattr(ticker, attr)
-                    # Attempt to serialize the value to JSON
-                    json.dumps(value)
-                    serializable_attrs[attr] = value
-                except (TypeError, ValueError):
-                    pass  # Skip non-serializable attributes
-    except:
-        pass
-    return serializable_attrs
+# {ticker: {module: data}} of the DETAIL_MODULES of many tickers from one yahooquery call,
+# its requests run DETAILS_WORKERS at a time. Tickers Yahoo has no data for are left out.
+def fetch_stock_details(tickers):
+    with _timing.span('fetch.yahooquery_details', tickers[0] if len(tickers) == 1 else None):
+        modules = Ticker(tickers, asynchronous=len(tickers) > 1, max_workers=DETAILS_WORKERS).get_modules(DETAIL_MODULES)
+    if not isinstance(modules, dict):
+        return {}
+    return {ticker: modules[ticker] for ticker in tickers if isinstance(modules.get(ticker), dict)}
 
 def get_stock_details(ticker_symbol):
-    ticker = Ticker(ticker_symbol)
-    serializable_attrs = get_serializable_attributes(ticker)
-    return serializable_attrs["all_modules"][ticker_symbol]
+    details = fetch_stock_details([ticker_symbol])
+    if ticker_symbol not in details:
+        raise ValueError(f"No details for {ticker_symbol}")
+    return details[ticker_symbol]
+
+# Write the Details documents of the tickers whose ones are older than DETAILS_MAX_AGE,
+# BATCH_SIZE tickers per fetch. Returns the tickers written.
+def refresh_details(tickers):
+    stale = [ticker for ticker in tickers if _data_store.get_age_in_minutes(ticker, 'Details') > DETAILS_MAX_AGE]
+    written = []
+    for start in range(0, len(stale), BATCH_SIZE):
+        batch = stale[start:start + BATCH_SIZE]
+        try:
+            details = fetch_stock_details(batch)
+        except Exception as e:
+            print(f"Error fetching details of {len(batch)} tickers: {e}")
+            continue
+        for ticker, modules in details.items():
+            json_file_query(ticker, [], [], modules, f"{ticker}_Details.json")
+            written.append(ticker)
+    print(f"Refreshed details of {len(written)} of {len(stale)} stale tickers.")
+    return written
 
 # Fetch data including pre-market and after-hours
 def fetch_yahoo_chart(yf_ticker_obj, period, interval):
-    data = yf_ticker_obj.history(period=period, interval=interval, prepost=True)
-    return data
+    if not USE_BAR_STORE:
+        with _timing.span(f'fetch.yahoo_chart_{interval}', yf_ticker_obj.ticker) as span:
+            data = yf_ticker_obj.history(period=period, interval=interval, prepost=True)
+            span['bytes'] = _timing.frame_bytes(data)
+        return data
+
+    def fetch(start):
+        with _timing.span(f'fetch.yahoo_chart_{interval}', yf_ticker_obj.ticker) as span:
+            if start is None:
+                data = yf_ticker_obj.history(period=STORE_PERIODS.get(interval, 'max'), interval=interval, prepost=True)
+            else:
+                data = yf_ticker_obj.history(start=start, interval=interval, prepost=True)
+            span['bytes'] = _timing.frame_bytes(data)
+        return data
+
+    data = _bar_store.load_bars(yf_ticker_obj.ticker, interval, fetch)
+    return _bar_store.slice_period(data, period)
 
-def estimate_inflows_outflows(yf_ticker_obj):
-    data = fetch_yahoo_chart(yf_ticker_obj, '1mo', '1d')
+# Last 30 days of 5 minute Schwab candles
+def fetch_schwab_chart(ticker):
+    bearer_key = _schwab_api.get_bearer_key()
+
+    def fetch(start):
+        with _timing.span('fetch.schwab_chart', ticker):
+            if start is None:
+                candles = _schwab_api.collect_30_days_of_data(ticker, bearer_key)
+            else:
+                candles = _schwab_api.collect_data_since(ticker, bearer_key, int(start.timestamp() * 1000))
+        with _timing.span('parse.schwab_candles', ticker) as span:
+            data = _schwab_api.candles_to_dataframe(candles)
+            span['bytes'] = _timing.frame_bytes(data)
+        return data
+
+    if not USE_BAR_STORE:
+        return fetch(None)
+    data = _bar_store.load_bars(ticker, 'schwab_5m', fetch)
+    return data[data.index >= pd.Timestamp.now(tz=_bar_store.BAR_TIMEZONE) - pd.Timedelta(days=30)]
+
+# Fetch the same chart for many tickers in one request, returns {ticker: DataFrame}. With
+# start the bars from start on are fetched instead of period.
+def fetch_yahoo_charts(tickers, period, interval, start=None):
+    span = {'start': start} if start is not None else {'period': period}
+    data = yf.download(tickers, **span, interval=interval, prepost=True, auto_adjust=True,
+                       group_by='ticker', threads=True, progress=False)
+    frames = {}
+    for ticker in tickers:
+        if isinstance(data.columns, pd.MultiIndex):
+            if ticker not in data.columns.get_level_values(0):
+                continue
+            frame = data[ticker]
+        else:
+            frame = data
+        frame = frame.dropna(how='all')
+        # Multi-ticker downloads can come back in UTC, trading hours are checked in Eastern time
+        if frame.index.tz is not None:
+            frame.index = frame.index.tz_convert('America/New_York')
+        frames[ticker] = frame
+    return frames
+
+# One daily history per ticker, every window analyze_stock needs is derived from it:
+# the 1 month flow window, the 1 year moving average window and the monthly trend series
+def fetch_daily_bundle(yf_ticker_obj):
+    return make_daily_bundle(fetch_yahoo_chart(yf_ticker_obj, 'max', '1d'))
+
+def make_daily_bundle(daily):
+    return {
+        'flow': _bar_store.slice_period(daily, '1mo').copy(),
+        'trend': _bar_store.slice_period(daily, '1y').copy(),
+        'monthly': resample_monthly(daily)
+    }
+
+# Daily bundles of many tickers from multi-ticker downloads. With the bar store, tickers with
+# stored daily bars download from the oldest second to last stored bar among them (see
+# _bar_store.load_bars) and their stores are updated as fetch_yahoo_chart would; the others
+# download their whole history. Tickers without any bars are left out.
+def fetch_daily_bundles(tickers):
+    if not USE_BAR_STORE:
+        frames = fetch_yahoo_charts(tickers, 'max', '1d')
+        return {ticker: make_daily_bundle(frame) for ticker, frame in frames.items() if not frame.empty}
+
+    starts = {}
+    for ticker in tickers:
+        stored = _bar_store.read_bars(ticker, '1d')
+        if stored is None or len(stored) < 2:
+            starts[ticker] = None
+        elif (datetime.now().timestamp() - os.path.getmtime(_bar_store.get_store_path(ticker, '1d'))) / 60 >= _bar_store.REFRESH_MINUTES:
+            starts[ticker] = pd.Timestamp(int(stored['time'][-2]), tz='UTC').tz_convert(_bar_store.BAR_TIMEZONE)
+    frames = {}
+    new = [ticker for ticker in tickers if ticker in starts and starts[ticker] is None]
+    if new:
+        frames.update(fetch_yahoo_charts(new, 'max', '1d'))
+    known = [ticker for ticker in tickers if starts.get(ticker) is not None]
+    if known:
+        frames.update(fetch_yahoo_charts(known, 'max', '1d', start=min(starts[ticker] for ticker in known)))
+    for ticker, frame in frames.items():
+        # Daily downloads come back without a timezone
+        if frame.index.tz is None:
+            frame.index = frame.index.tz_localize(_bar_store.BAR_TIMEZONE)
+
+    bundles = {}
+    for ticker in tickers:
+        def fetch(start, ticker=ticker):
+            if start is None and starts.get(ticker) is not None:
+                # The stored history was adjusted (split, dividend), fetch all of it again
+                return yf.Ticker(ticker).history(period='max', interval='1d', prepost=True)
+            frame = frames.get(ticker)
+            if frame is None or start is None:
+                return frame
+            return frame[frame.index >= start]
+        daily = _bar_store.load_bars(ticker, '1d', fetch)
+        if not daily.empty:
+            bundles[ticker] = make_daily_bundle(daily)
+    return bundles
+
+# Monthly bars labelled with the first day of the month, like Yahoo's '1mo' interval
+def resample_monthly(daily):
+    monthly = daily.resample('MS').agg({
+        'Open': 'first',
+        'High': 'max',
+        'Low': 'min',
+        'Close': 'last',
+        'Volume': 'sum'
+    })
+    return monthly.dropna(subset=['Close'])
+
+def estimate_inflows_outflows(yf_ticker_obj, data=None):
+    if data is None:
+        data = fetch_yahoo_chart(yf_ticker_obj, '1mo', '1d')
 
     if 'Close' in data.columns and 'Volume' in data.columns:
         data['price_change'] = data['Close'].diff()
@@ -61,7 +216,7 @@ def estimate_inflows_outflows(yf_ticker_obj):
     else:
         return 0, 0, 0
 
-def make_recommendation(yf_ticker_obj, short_period=10):
+def make_recommendation(yf_ticker_obj, short_period=10, bundle=None):
     def calculate_slope(ma_series, start, end):
         """
         Calculate the slope of the moving average series between two points.
@@ -76,10 +231,11 @@ def make_recommendation(yf_ticker_obj, short_period=10):
         slope = diff / period
         return slope
 
-    total_inflows, total_outflows, net_inflows_outflows = estimate_inflows_outflows(yf_ticker_obj)
+    with _timing.span('compute.inflows_outflows'):
+        total_inflows, total_outflows, net_inflows_outflows = estimate_inflows_outflows(yf_ticker_obj, bundle['flow'] if bundle else None)
     try:
         # Fetch additional data for trend analysis
-        data = fetch_yahoo_chart(yf_ticker_obj, '1y', '1d')
+        data = bundle['trend'] if bundle else fetch_yahoo_chart(yf_ticker_obj, '1y', '1d')
         data['MA50'] = data['Close'].rolling(window=50).mean()
         data['MA200'] = data['Close'].rolling(window=200).mean()
         MA_Trend = data['MA50'].iloc[-1] - data['MA200'].iloc[-1]
@@ -141,7 +297,13 @@ def is_trading_hours(timestamp):
     return time(9, 30) <= timestamp.time() <= time(16, 0)
 
 # Function to identify trigger points and track trades
-def identify_triggers(data, Threshold=2, trading_hours=True):
+def identify_triggers(data, Threshold=2, trading_hours=True, engine=None):
+    if (engine or TRIGGER_ENGINE) == 'numpy':
+        return _trigger_engine.identify_triggers(data, Threshold, trading_hours)
+    return identify_triggers_pandas(data, Threshold, trading_hours)
+
+# Reference implementation, walks every bar of the DataFrame
+def identify_triggers_pandas(data, Threshold=2, trading_hours=True):
     highest_price = 0
     highest_timestamp = None
     triggers = []
@@ -201,21 +363,30 @@ def identify_triggers(data, Threshold=2, trading_hours=True):
 
     return triggers, trades
 
+# Run both engines over the same data and return the thresholds where they disagree
+def compare_trigger_engines(data, thresholds=THRESHOLDS, trading_hours=True):
+    mismatches = []
+    sweep = _trigger_engine.sweep_triggers(data, thresholds, trading_hours)
+    for threshold in thresholds:
+        expected = json.dumps(identify_triggers_pandas(data, threshold, trading_hours), default=str)
+        single = json.dumps(identify_triggers(data, threshold, trading_hours, engine='numpy'), default=str)
+        if expected != single or expected != json.dumps(sweep[threshold], default=str):
+            mismatches.append(threshold)
+    return mismatches
+
 # Calculate the number of trading days the money is tied up and the 365-day gain
 def calculate_totals(trades, total_triggers, Threshold):
-    total_days = 0
     total_profit = 0
     total_sell_orders = 0
     now = datetime.now()
 
-    for trade in trades:
-        buy_timestamp = pd.to_datetime(trade['buy_timestamp']).tz_localize(None)
-        sell_timestamp = pd.to_datetime(trade['sell_timestamp']).tz_localize(None) if 'sell_timestamp' in trade else now
-
-        # Calculate the number of trading days between buy and sell timestamps
-        days_held = len(pd.date_range(start=buy_timestamp, end=sell_timestamp, freq='B'))
-        total_days += days_held
+    # Buy and sell wall times (open trades sell now) and the trading days between them
+    # for all trades at once, see _market_calendar.count_sessions
+    buy_times = np.array([trade['buy_timestamp'][:19] for trade in trades], dtype='datetime64[s]')
+    sell_times = np.array([trade['sell_timestamp'][:19] if 'sell_timestamp' in trade else now.strftime('%Y-%m-%d %H:%M:%S') for trade in trades], dtype='datetime64[s]')
+    total_days = int(_market_calendar.count_sessions(buy_times, sell_times).sum())
 
+    for trade in trades:
         if 'profit' in trade:
             total_profit += trade['profit']
             total_sell_orders += 1
@@ -242,23 +413,12 @@ def calculate_totals(trades, total_triggers, Threshold):
 
     return total_days, Annual_Trade_Gain, buy_profit_percentage, total_sell_orders, len(trades), Score, now.astimezone(pytz.timezone('US/Eastern')).strftime("%Y-%m-%d %I:%M:%S %p %Z")
 
-# Save results to JSON
-def json_file_query(ticker, triggers, trades, totals, filename):
-
-    # Ensure the stock_data directory exists
-    directory = os.path.join(os.path.dirname(__file__), 'stock_data')
-    if not os.path.exists(directory):
-        os.makedirs(directory)
+# Save results to the stock_data store (see _data_store)
+def json_file_query(ticker, triggers, trades, totals, filename, trade_metrics=None):
+    kind = _data_store.split_name(filename)[1]
 
-    filepath = os.path.join(directory, filename)
-
-    previous_totals = {}
-    # Check if file exists and read previous totals if available
-    if os.path.exists(filepath):
-        with open(filepath, 'r') as file:
-            data = json.load(file)
-            if ticker in data and 'totals' in data[ticker]:
-                previous_totals = data[ticker]['totals']
+    # Read previous totals if available
+    previous_totals = _data_store.read_totals(ticker, kind) or {}
 
     if not triggers and not trades and not totals:
         print(f"Loading dataset from {filename}.")
@@ -277,9 +437,12 @@ def json_file_query(ticker, triggers, trades, totals, filename):
             "totals": totals
         }
     }
+    # Chart trade metrics (see _market_calendar.trade_metrics) for the web app
+    if trade_metrics is not None:
+        result[ticker]["trade_metrics"] = trade_metrics
 
-    with open(filepath, 'w') as f:
-        json.dump(result, f, indent=4)
+    with _timing.span(f'write.{kind}', ticker) as span:
+        span['bytes'] = _data_store.write_document(ticker, kind, result)
     print(f"Saving dataset to {filename}")
     return totals
 
@@ -347,14 +510,54 @@ def convert_to_yahoo_format(custom_format, format_type):
     # Convert the custom format to Yahoo's format using the selected mapping
     return mapping.get(custom_format, custom_format)
     
+# Triggers and trades for every threshold, {threshold: (triggers, trades)}
+def sweep_triggers(data, thresholds=THRESHOLDS, engine=None):
+    if (engine or TRIGGER_ENGINE) == 'numpy':
+        return _trigger_engine.sweep_triggers(data, thresholds)
+    return {threshold: identify_triggers_pandas(data, threshold) for threshold in thresholds}
+
+# Score every threshold and pick the best one, returns the best triggers, trades and
+# totals plus the totals of every threshold
+def select_best_threshold(results, period, interval):
+    best_triggers = []
+    best_trades = []
+    best_score = 0
+    best_totals = {}
+    threshold_totals = {}
+
+    for threshold, (triggers, trades) in results.items():
+        total_days, Annual_Trade_Gain, buy_profit_percentage, total_sell_orders, total_buy_orders, Score, now = calculate_totals(trades, len(triggers), threshold)
+        threshold_totals[threshold] = {
+            "Report": f"Source: Yahoo, Period: {period}, Interval: {interval}",
+            "Threshold": threshold,
+            "Triggers": len(triggers),
+            "Buy_Orders": total_buy_orders,
+            "Sell_Orders": total_sell_orders,
+            "Gained": buy_profit_percentage,
+            "Working_Days": total_days,
+            "Annual_Trade_Gain": round(Annual_Trade_Gain, 2),
+            "Score": Score,
+            "Updated": now
+        }
+
+        if (Score > best_score and total_sell_orders >= 4) or (total_sell_orders < 4 and total_sell_orders > 0 and best_score == 0):
+            best_score = Score
+            best_triggers = triggers
+            best_trades = trades
+            best_totals = threshold_totals[threshold]
+
+    return best_triggers, best_trades, best_totals, threshold_totals
+
 # Analyze stock data for different periods and resolutions
 def analyze_chart(ticker,period,interval,age, yf_ticker_obj = False):
-    if _file_functions.get_file_age_in_minutes(f"{ticker}_Chart_{period}_{interval}") > age:
+    with _timing.span('analyze_chart', ticker):
+        return _analyze_chart(ticker, period, interval, age, yf_ticker_obj)
+
+def _analyze_chart(ticker, period, interval, age, yf_ticker_obj):
+    if _data_store.get_age_in_minutes(ticker, f'Chart_{period}_{interval}') > age:
         try:  
             if not yf_ticker_obj:
-                bearer_key = _schwab_api.get_bearer_key()
-                candles = _schwab_api.collect_30_days_of_data(ticker, bearer_key)
-                data = _schwab_api.candles_to_dataframe(candles)   
+                data = fetch_schwab_chart(ticker)
             else:
                 data = fetch_yahoo_chart(yf_ticker_obj, convert_to_yahoo_format(period,'period'), 
                     convert_to_yahoo_format(interval, 'interval'))        
@@ -363,35 +566,43 @@ def analyze_chart(ticker,period,interval,age, yf_ticker_obj = False):
     else:
         data = None
     if data is not None:
-        best_threshold = 0
-        best_triggers = []
-        best_trades = []
-        best_score = 0
-        best_totals = {}
-
-        for threshold in range(1, 21):
-            triggers, trades = identify_triggers(data, threshold)
-            total_days, Annual_Trade_Gain, buy_profit_percentage, total_sell_orders, total_buy_orders, Score, now = calculate_totals(trades, len(triggers), threshold)
-
-            if (Score > best_score and total_sell_orders >= 4) or (total_sell_orders < 4 and total_sell_orders > 0 and best_score == 0):
-                best_score = Score
-                best_threshold = threshold
-                best_triggers = triggers
-                best_trades = trades
-                best_totals = {
-                    "Report": f"Source: Yahoo, Period: {period}, Interval: {interval}",
-                    "Threshold": threshold,
-                    "Triggers": len(triggers),
-                    "Buy_Orders": total_buy_orders,
-                    "Sell_Orders": total_sell_orders,
-                    "Gained": buy_profit_percentage,
-                    "Working_Days": total_days,
-                    "Annual_Trade_Gain": round(Annual_Trade_Gain, 2),
-                    "Score": Score,
-                    "Updated": now
-                }
-
-        json_file_query(ticker, best_triggers, best_trades, best_totals, f"{ticker}_Chart_{period}_{interval}.json")
+        with _timing.span('compute.sweep', ticker) as span:
+            best_triggers, best_trades, best_totals, threshold_totals = select_best_threshold(sweep_triggers(data), period, interval)
+            trade_metrics = _market_calendar.trade_metrics(best_trades)
+            span['bytes'] = _timing.frame_bytes(data)
+        json_file_query(ticker, best_triggers, best_trades, best_totals, f"{ticker}_Chart_{period}_{interval}.json",
+                        trade_metrics)
+        return threshold_totals
+    return {}
+
+# Backtest the chart of many tickers together on the stacked (tickers x bars) engine and
+# write the same {ticker}_Chart_{period}_{interval}.json files as analyze_chart. The bars
+# come from multi-ticker Yahoo downloads or, with source='schwab', from the pooled Schwab
+# client (30 days of 5 minute candles).
+def analyze_charts_batch(tickers, period='1Mo', interval='5Mi', age=60, source='yahoo'):
+    stale = [ticker for ticker in tickers if _data_store.get_age_in_minutes(ticker, f'Chart_{period}_{interval}') > age]
+    threshold_totals = {}
+    for start in range(0, len(stale), BATCH_SIZE):
+        batch = stale[start:start + BATCH_SIZE]
+        try:
+            with _timing.span(f'fetch.{source}_chart_batch') as span:
+                if source == 'schwab':
+                    candles = _schwab_api.collect_30_days_of_data_many(batch)
+                    frames = {ticker: _schwab_api.candles_to_dataframe(candles[ticker]) for ticker in candles}
+                else:
+                    frames = fetch_yahoo_charts(batch, convert_to_yahoo_format(period, 'period'),
+                                                convert_to_yahoo_format(interval, 'interval'))
+                span['bytes'] = sum(_timing.frame_bytes(frame) for frame in frames.values())
+        except Exception as e:
+            print(f"Failed to download batch starting with {batch[0]}: {e}")
+            continue
+        with _timing.span('compute.batch_sweep'):
+            results = _trigger_engine.batch_sweep_triggers(_trigger_engine.stack_charts(frames), THRESHOLDS)
+        for ticker, ticker_results in results.items():
+            best_triggers, best_trades, best_totals, threshold_totals[ticker] = select_best_threshold(ticker_results, period, interval)
+            json_file_query(ticker, best_triggers, best_trades, best_totals, f"{ticker}_Chart_{period}_{interval}.json",
+                            _market_calendar.trade_metrics(best_trades))
+    return threshold_totals
 
 def high_to_highest_score(ratio):
     optimal_ratio = 0.5
@@ -420,161 +631,244 @@ def calculate_score(apr, total_months, curved_ratio, avg_monthly_change, pe_rati
 
 # Analyze stock data for different periods and resolutions
 def analyze_stock(ticker):
+    with _timing.span('analyze_stock', ticker):
+        _analyze_stock(ticker)
+
+def _analyze_stock(ticker):
     print(f"Scraping data for: {ticker}")
     yf_ticker_obj = yf.Ticker(ticker)
 
     analyze_chart(ticker, '1Mo', '5Mi', 60, yf_ticker_obj)
 
     # Analyze max monthly data
-    if _file_functions.get_file_age_in_minutes(f"{ticker}_Overall_Trend") > 1440:
-        sec_info = {}
-        if _file_functions.get_file_age_in_minutes(f"{ticker}_SEC_Info") > 43200:
+    if _data_store.get_age_in_minutes(ticker, 'Overall_Trend') > 1440:
+        sec_info = get_sec_info(ticker)
+        analyze_overall_trend(ticker, fetch_daily_bundle(yf_ticker_obj), sec_info)
+
+# SEC_Info totals of ticker, looked up on the SEC site when older than 30 days
+def get_sec_info(ticker):
+    sec_info = {}
+    if _data_store.get_age_in_minutes(ticker, 'SEC_Info') > 43200:
+        with _timing.span('fetch.sec_company_info', ticker):
             cik, start_date = _sec_api.get_company_info(ticker)
-            if cik:
-                sec_info = {'cik': cik, 'start_date': start_date}
-        if ticker in etf_list and not sec_info.get('cik', 'Delisted').isdigit():
-            sec_info = {'cik': 'ETF'}
-        sec_info = json_file_query(ticker, [], [], sec_info,  f"{ticker}_SEC_Info.json")
-
-        data = fetch_yahoo_chart(yf_ticker_obj, 'max', '1mo')
-        #data = data[(data['Volume'] > (data['Volume'].iloc[-1]/1000))]
-        try: 
-            details = {}
-            if _file_functions.get_file_age_in_minutes(f"{ticker}_Details") > 2880:
-                details = get_stock_details(ticker)
-            details = json_file_query(ticker, [], [], details, f"{ticker}_Details.json")
-            # Extract financial recommendation mean and convert it
-            recommendation_mean = details.get('financialData', {}).get('recommendationMean', None)
-            if recommendation_mean:
-                Recommendation = recommendation_mean_to_key(recommendation_mean)
-            else:
-                Recommendation = 'None'
-
-            # Extract financial ratios with default values if primary keys are missing
-            risk = details.get('assetProfile', {}).get('overallRisk', 5)
-            pe_ratio = round(details.get('summaryDetail', {}).get('trailingPE', 0),2)
-            forward_pe_ratio = round(details.get('summaryDetail', {}).get('forwardPE', 0),2)
-            peg_ratio = round(details.get('defaultKeyStatistics', {}).get('pegRatio', 0),2)
-            ps_ratio = round(details.get('summaryDetail', {})
-                             .get('priceToSalesTrailing12Months', 0),2)
-            earnings_date = details.get('calendarEvents', {}).get('earnings', {}).get('earningsDate', ['None'])[0]
-            
-        except Exception as e:
-            print(e) 
-            Recommendation = 'None'
-            risk = 5
-            pe_ratio = 0
-            forward_pe_ratio = 0
-            peg_ratio = 0
-            ps_ratio = 0
-            earnings_date = 'None'
-    else:
-        data = None
-    if data is not None:
-        # Calculate the start and end average prices
-        Start_Date = data.index.min().strftime('%Y-%m-%d')
-        Last_Name_Change = sec_info.get('start_date', Start_Date)
-
-        # Filter the data from Last_Name_Change date onwards
-        filtered_data = data.loc[Last_Name_Change:]
-
-        # Calculate Start_Price using the filtered data
-        if not filtered_data.empty:
-            start_row = filtered_data.iloc[0]
-            Start_Price = round((start_row['High'] + start_row['Low'] + start_row['Open'] + start_row['Close']) / 4, 2)
-        else:
-            Start_Price = round((data['High'].iloc[0] + data['Low'].iloc[0] + data['Open'].iloc[0] + data['Close'].iloc[0]) /4, 2)
-        End_Price = round((data['High'].iloc[-1] + data['Low'].iloc[-1] + data['Open'].iloc[-1] + data['Close'].iloc[-1]) /4, 2)
-        Overall_Trend = "Upward" if End_Price > Start_Price else "Downward"
-
-
-        # Calculate monthly percentage changes
-        monthly_changes = data['High'].pct_change().dropna() * 100
-
-        # Calculate the average monthly percentage change
-        Average_Monthly_Change = monthly_changes.mean()
-
-        # Calculate the total months
-        total_months = len(monthly_changes)
-
-        # Annualize the average monthly change
-        Average_APR = Average_Monthly_Change * 12
-
-        # Calculate the total number of days
-        total_days = (data.index[-1] - data.index[0]).days
-
-        # Calculate the total number of months
-        total_months = total_days / 30.44  # Average number of days per month
-
-        # Calculate the daily growth rate
-        daily_growth_rate = (End_Price / max(Start_Price,1)) ** (1 / max(total_days,1)) - 1
-
-        # Calculate the annual APR based on daily compounding
-        Average_APR = round(((1 + daily_growth_rate) ** 365 - 1) * 100, 2)
-
-        # Find the highest high
-        Highest_High = data['High'].max()
-
-        # Compare the current month's high to the highest high
-        Current_High = data['High'].iloc[-1]
-        High_To_Highest_Ratio = Current_High / Highest_High if Highest_High != 0 else 0
-
-          # Define the curved function for high_to_highest_ratio
-        def high_to_highest_curve(ratio, optimal_ratio=0.75):
-            return 1 - ((ratio - optimal_ratio) ** 2) / (4 * optimal_ratio ** 2)
-
-        # Apply the curved function to high_to_highest_ratio
-        curved_ratio = high_to_highest_curve(High_To_Highest_Ratio)
-
-        inflow, outflow, netflow, recommendation_mean, MA_Trend, ma_result = make_recommendation(yf_ticker_obj)
-
-        # Calculate the score
-        print(Average_APR, total_months, curved_ratio, Average_Monthly_Change, 
-                                pe_ratio, forward_pe_ratio, peg_ratio, ps_ratio, risk)
-        Score = calculate_score(Average_APR, total_months, curved_ratio, Average_Monthly_Change, 
-                                pe_ratio, forward_pe_ratio, peg_ratio, ps_ratio, risk)
-
-        if Recommendation == 'None':
+        if cik:
+            sec_info = {'cik': cik, 'start_date': start_date}
+    if ticker in etf_list and not sec_info.get('cik', 'Delisted').isdigit():
+        sec_info = {'cik': 'ETF'}
+    return json_file_query(ticker, [], [], sec_info,  f"{ticker}_SEC_Info.json")
+
+# Write the Overall_Trend document of ticker from its daily bundle (see fetch_daily_bundle),
+# its SEC_Info totals and its Details document
+def analyze_overall_trend(ticker, bundle, sec_info):
+    data = bundle['monthly']
+    #data = data[(data['Volume'] > (data['Volume'].iloc[-1]/1000))]
+    try: 
+        details = {}
+        if _data_store.get_age_in_minutes(ticker, 'Details') > DETAILS_MAX_AGE:
+            details = get_stock_details(ticker)
+        details = json_file_query(ticker, [], [], details, f"{ticker}_Details.json")
+        # Extract financial recommendation mean and convert it
+        recommendation_mean = details.get('financialData', {}).get('recommendationMean', None)
+        if recommendation_mean:
             Recommendation = recommendation_mean_to_key(recommendation_mean)
+        else:
+            Recommendation = 'None'
 
-        # Save the results to JSON (mock function)
-        json_file_query(ticker, [], [], {
-            "CIK": sec_info.get('cik','Delisted'),
-            'Earnings_Date': earnings_date,
-            "Start_Date": Start_Date,
-            "Last_Name_Change": Last_Name_Change,
-            "First_Month_Average": Start_Price,
-            "Current_Month_Average": End_Price,
-            "Overall_Trend": Overall_Trend,
-            "Average_Monthly_Change": round(Average_Monthly_Change, 2),
-            "Average_APR": Average_APR,
-            "Highest_High": round(Highest_High, 2),
-            "Current_High": round(Current_High, 2),
-            "High_To_Highest_Ratio": round(High_To_Highest_Ratio, 2),
-            "Trailing_PE_Ratio": pe_ratio,
-            "Forward_PE_Ratio": forward_pe_ratio,
-            "PEG_Ratio": peg_ratio,
-            "PS_Ratio": ps_ratio,
-            "Recommendation": Recommendation, 
-            "Month_Inflow": inflow,
-            "Month_Outflow": outflow,
-            "Month_Net": netflow,
-            "50_200_MA": round(MA_Trend, 2),
-            "MA_Analysis": ma_result,
-            "Risk": risk,
-            "Score": round(Score, 2),
-            "Updated": datetime.now(pytz.timezone('US/Eastern')).strftime("%Y-%m-%d %I:%M:%S %p %Z")
-        }, f"{ticker}_Overall_Trend.json")
-
-
-
-
+        # Extract financial ratios with default values if primary keys are missing
+        risk = details.get('assetProfile', {}).get('overallRisk', 5)
+        pe_ratio = round(details.get('summaryDetail', {}).get('trailingPE', 0),2)
+        forward_pe_ratio = round(details.get('summaryDetail', {}).get('forwardPE', 0),2)
+        peg_ratio = round(details.get('defaultKeyStatistics', {}).get('pegRatio', 0),2)
+        ps_ratio = round(details.get('summaryDetail', {})
+                         .get('priceToSalesTrailing12Months', 0),2)
+        earnings_date = details.get('calendarEvents', {}).get('earnings', {}).get('earningsDate', ['None'])[0]
+        
+    except Exception as e:
+        print(e) 
+        Recommendation = 'None'
+        risk = 5
+        pe_ratio = 0
+        forward_pe_ratio = 0
+        peg_ratio = 0
+        ps_ratio = 0
+        earnings_date = 'None'
+
+    # Calculate the start and end average prices
+    Start_Date = data.index.min().strftime('%Y-%m-%d')
+    Last_Name_Change = sec_info.get('start_date', Start_Date)
+
+    # Filter the data from Last_Name_Change date onwards
+    filtered_data = data.loc[Last_Name_Change:]
+
+    # Calculate Start_Price using the filtered data
+    if not filtered_data.empty:
+        start_row = filtered_data.iloc[0]
+        Start_Price = round((start_row['High'] + start_row['Low'] + start_row['Open'] + start_row['Close']) / 4, 2)
+    else:
+        Start_Price = round((data['High'].iloc[0] + data['Low'].iloc[0] + data['Open'].iloc[0] + data['Close'].iloc[0]) /4, 2)
+    End_Price = round((data['High'].iloc[-1] + data['Low'].iloc[-1] + data['Open'].iloc[-1] + data['Close'].iloc[-1]) /4, 2)
+    Overall_Trend = "Upward" if End_Price > Start_Price else "Downward"
+
+
+    # Calculate monthly percentage changes
+    monthly_changes = data['High'].pct_change().dropna() * 100
+
+    # Calculate the average monthly percentage change
+    Average_Monthly_Change = monthly_changes.mean()
+
+    # Calculate the total months
+    total_months = len(monthly_changes)
+
+    # Annualize the average monthly change
+    Average_APR = Average_Monthly_Change * 12
+
+    # Calculate the total number of days
+    total_days = (data.index[-1] - data.index[0]).days
+
+    # Calculate the total number of months
+    total_months = total_days / 30.44  # Average number of days per month
+
+    # Calculate the daily growth rate
+    daily_growth_rate = (End_Price / max(Start_Price,1)) ** (1 / max(total_days,1)) - 1
+
+    # Calculate the annual APR based on daily compounding
+    Average_APR = round(((1 + daily_growth_rate) ** 365 - 1) * 100, 2)
+
+    # Find the highest high
+    Highest_High = data['High'].max()
+
+    # Compare the current month's high to the highest high
+    Current_High = data['High'].iloc[-1]
+    High_To_Highest_Ratio = Current_High / Highest_High if Highest_High != 0 else 0
+
+      # Define the curved function for high_to_highest_ratio
+    def high_to_highest_curve(ratio, optimal_ratio=0.75):
+        return 1 - ((ratio - optimal_ratio) ** 2) / (4 * optimal_ratio ** 2)
+
+    # Apply the curved function to high_to_highest_ratio
+    curved_ratio = high_to_highest_curve(High_To_Highest_Ratio)
+
+    with _timing.span('compute.recommendation', ticker):
+        inflow, outflow, netflow, recommendation_mean, MA_Trend, ma_result = make_recommendation(None, bundle=bundle)
+
+    # Calculate the score
+    print(Average_APR, total_months, curved_ratio, Average_Monthly_Change, 
+                            pe_ratio, forward_pe_ratio, peg_ratio, ps_ratio, risk)
+    Score = calculate_score(Average_APR, total_months, curved_ratio, Average_Monthly_Change, 
+                            pe_ratio, forward_pe_ratio, peg_ratio, ps_ratio, risk)
+
+    if Recommendation == 'None':
+        Recommendation = recommendation_mean_to_key(recommendation_mean)
+
+    # Save the results to JSON (mock function)
+    json_file_query(ticker, [], [], {
+        "CIK": sec_info.get('cik','Delisted'),
+        'Earnings_Date': earnings_date,
+        "Start_Date": Start_Date,
+        "Last_Name_Change": Last_Name_Change,
+        "First_Month_Average": Start_Price,
+        "Current_Month_Average": End_Price,
+        "Overall_Trend": Overall_Trend,
+        "Average_Monthly_Change": round(Average_Monthly_Change, 2),
+        "Average_APR": Average_APR,
+        "Highest_High": round(Highest_High, 2),
+        "Current_High": round(Current_High, 2),
+        "High_To_Highest_Ratio": round(High_To_Highest_Ratio, 2),
+        "Trailing_PE_Ratio": pe_ratio,
+        "Forward_PE_Ratio": forward_pe_ratio,
+        "PEG_Ratio": peg_ratio,
+        "PS_Ratio": ps_ratio,
+        "Recommendation": Recommendation, 
+        "Month_Inflow": inflow,
+        "Month_Outflow": outflow,
+        "Month_Net": netflow,
+        "50_200_MA": round(MA_Trend, 2),
+        "MA_Analysis": ma_result,
+        "Risk": risk,
+        "Score": round(Score, 2),
+        "Updated": datetime.now(pytz.timezone('US/Eastern')).strftime("%Y-%m-%d %I:%M:%S %p %Z")
+    }, f"{ticker}_Overall_Trend.json")
+
+# Refresh the Overall_Trend documents older than age minutes of many tickers together: their
+# details come from refresh_details and their daily histories from fetch_daily_bundles,
+# BATCH_SIZE tickers at a time, then each one gets the trend, APR, High_To_Highest and moving
+# average analysis of analyze_overall_trend. Returns the tickers that failed.
+def analyze_overall_trend_batch(tickers, age=1440):
+    stale = [ticker for ticker in tickers if _data_store.get_age_in_minutes(ticker, 'Overall_Trend') > age]
+    refresh_details(stale)
+    failed = []
+    for start in range(0, len(stale), BATCH_SIZE):
+        batch = stale[start:start + BATCH_SIZE]
+        try:
+            with _timing.span('fetch.yahoo_daily_batch') as span:
+                bundles = fetch_daily_bundles(batch)
+                span['bytes'] = sum(_timing.frame_bytes(bundle['monthly']) for bundle in bundles.values())
+        except Exception as e:
+            print(f"Failed to download daily batch starting with {batch[0]}: {e}")
+            failed.extend(batch)
+            continue
+        for ticker in batch:
+            if ticker not in bundles:
+                print(f"No daily history for {ticker}.")
+                failed.append(ticker)
+                continue
+            try:
+                with _timing.span('analyze_overall_trend', ticker):
+                    analyze_overall_trend(ticker, bundles[ticker], get_sec_info(ticker))
+            except Exception:
+                print(f"Error analyzing the trend of {ticker}:\n{traceback.format_exc()}")
+                failed.append(ticker)
+    print(f"Refreshed the trend of {len(stale) - len(failed)} of {len(stale)} stale tickers.")
+    return failed
+
+# Worker pool entry point for get_tickers.py. Errors are returned instead of raised so one
+# bad ticker does not take down the pool; tickers refreshed by another run in the meantime
+# (Overall_Trend newer than skip_if_newer_than minutes) are skipped.
+def analyze_stock_job(ticker, skip_if_newer_than=None):
+    start_time = datetime.now()
+    if skip_if_newer_than is not None and _data_store.get_age_in_minutes(ticker, 'Overall_Trend') < skip_if_newer_than:
+        print(f"Skipping {ticker}, file is newer than {skip_if_newer_than} minutes.")
+        return ticker, None, 0.0
+    try:
+        analyze_stock(ticker)
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    return ticker, error, (datetime.now() - start_time).total_seconds()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description=
                                      'Analyze stock data for different periods and resolutions.')
-    parser.add_argument('ticker', type=str, help='Stock ticker symbol')
+    parser.add_argument('tickers', type=str, nargs='+', help='Stock ticker symbol(s)')
+    parser.add_argument('--engine', choices=['numpy', 'pandas'], default=TRIGGER_ENGINE,
+                        help='Engine used to identify triggers')
+    parser.add_argument('--check-engines', action='store_true',
+                        help='Compare the numpy (single and sweep) and pandas trigger engines on the live 1Mo/5Mi chart instead of analyzing '
+                             '(benchmark.py --check-engines does the same offline on synthetic charts)')
+    parser.add_argument('--batch', action='store_true',
+                        help='Backtest the 1Mo/5Mi chart and refresh the Overall_Trend of all tickers together instead of analyzing them one by one')
+    parser.add_argument('--source', choices=['yahoo', 'schwab'], default='yahoo',
+                        help='Where --batch gets the 5 minute bars from')
+    parser.add_argument('--details', action='store_true',
+                        help='Only refresh the stale Details documents of the tickers, in batches')
     args = parser.parse_args()
-
-    analyze_stock(args.ticker.upper())
+    TRIGGER_ENGINE = args.engine
+    tickers = [ticker.upper() for ticker in args.tickers]
+
+    if args.check_engines:
+        for ticker in tickers:
+            data = fetch_yahoo_chart(yf.Ticker(ticker), '1mo', '5m')
+            mismatches = compare_trigger_engines(data)
+            if mismatches:
+                print(f"{ticker}: engines disagree for thresholds: {mismatches}")
+            else:
+                print(f"{ticker}: engines match on {len(data)} bars for all thresholds.")
+    elif args.details:
+        refresh_details(tickers)
+    elif args.batch:
+        analyze_charts_batch(tickers, source=args.source)
+        analyze_overall_trend_batch(tickers)
+    else:
+        for ticker in tickers:
+            analyze_stock(ticker)
 
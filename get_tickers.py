@@ -7,60 +7,15 @@ import subprocess
 import json
 import os
 import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from yahoo_fin import stock_info as si
 import requests
 from bs4 import BeautifulSoup
 import _etfdb_api
 import _file_functions
-
-# Fetch top gainers
-try:
-    top_gainers = si.get_day_gainers()
-    top_gainers_tickers = top_gainers['Symbol'].tolist()
-    print(f"Found {len(top_gainers_tickers)} tickers in Yahoo top gainers.")
-except:
-    print("Failed to get Yahoo top gainers.")
-
-# Fetch most active stocks
-try:
-    most_active = si.get_day_most_active()
-    most_active_tickers = most_active['Symbol'].tolist()
-    print(f"Found {len(most_active_tickers)} tickers in most Yahoo active stocks.")
-except:
-    print("Failed to get Yahoo most active.")
-    most_active_tickers = []
-
-try:
-    url = "https://api.stocktwits.com/api/2/trending/symbols.json"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
-
-    response = requests.get(url, headers=headers)
-    data = response.json()
-    trending_tickers = [symbol['symbol'] for symbol in data['symbols']]
-    print(f"Found {len(trending_tickers)} tickers in Stocktwits trending stocks.")
-except Exception as e:
-    print(f"Failed to get Stocktwits trending tickers: {e}")
-
-# Load unique tickers from the unique_tickers.json file
-with open('unique_tickers.json', 'r') as file:
-    unique_tickers = json.load(file)
-print(f"Found {len(unique_tickers)} tickers in unique_tickers.json.")
-
-# Load hot pick tickers from the hot_picks.json file
-with open('hot_picks.json', 'r') as file:
-    hot_picks = json.load(file)
-# Initialize an empty list to hold all tickers
-hot_pick_tickers = []
-
-# Iterate over all keys in the JSON data
-for key in hot_picks:
-    # Extend the all_tickers list with the values from each key
-    hot_pick_tickers.extend(hot_picks[key])
-
-print(f"Found {len(hot_pick_tickers)} tickers in hot_picks.json.")
-
+import _data_store
+import _timing
 
 # Scrape tickers from ETF Database
 def scrape_tickers_from_page(url):
@@ -104,58 +59,146 @@ def scrape_all_tickers(base_url, pages=5):
 
     return all_tickers
 
-if _file_functions.get_file_age_in_minutes('etf_list', '') > 43200:
-    # Base URL for the leveraged equity ETFs (without the page parameter)
-    base_url = 'https://etfdb.com/etfs/leveraged/equity/#etfs&sort_name=ytd_percent_return&sort_order=desc'
+# Analyze tickers in this process on a pool of workers, get_stock_data (and pandas/yfinance)
+# is imported once instead of once per ticker
+def run_pool(tickers, pool, workers):
+    import get_stock_data
+    executor_class = ProcessPoolExecutor if pool == 'process' else ThreadPoolExecutor
+    start_time = time.time()
+    failed = 0
+    with executor_class(max_workers=workers) as executor:
+        futures = [executor.submit(get_stock_data.analyze_stock_job, ticker, 60) for ticker in tickers]
+        for future in as_completed(futures):
+            ticker, error, seconds = future.result()
+            if error:
+                failed += 1
+                print(f"Error analyzing {ticker} after {seconds:.1f}s:\n{error}")
+    elapsed = max(time.time() - start_time, 0.001)
+    print(f"Processed {len(tickers)} tickers in {elapsed:.1f}s with {workers} {pool} workers "
+          f"({len(tickers) / elapsed:.2f} tickers/s, {failed} failed).")
+
+def main():
+    parser = argparse.ArgumentParser(description='Collect tickers and refresh their stock data.')
+    parser.add_argument('--pool', choices=['process', 'thread', 'batch'],
+                        help='Analyze tickers in this process on a worker pool, or all together with multi-ticker downloads (batch), '
+                             'instead of one get_stock_data.py run per ticker')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4,
+                        help='Number of pool workers')
+    args = parser.parse_args()
+
+    # Fetch top gainers
     try:
-        etf_tickers = scrape_all_tickers(base_url)
-        with open('etf_list.json', 'w') as json_file:
-            json.dump(etf_tickers, json_file)
-        print(f"Saved {len(etf_tickers)} tickers for leveraged equity ETFs.")
+        with _timing.span('fetch.yahoo_day_gainers'):
+            top_gainers = si.get_day_gainers()
+        top_gainers_tickers = top_gainers['Symbol'].tolist()
+        print(f"Found {len(top_gainers_tickers)} tickers in Yahoo top gainers.")
     except:
-        print('Failed to download new list of leveraged ETFs')
-
-with open('etf_list.json', 'r') as file:
-    etf_tickers = json.load(file)
-print(f"Loaded {len(etf_tickers)} tickers in leveraged equity ETFs.")
-
-# Directory where the stock data JSON files are stored
-stock_data_dir = './stock_data'
-
-# Get tickers from files stoke_data path that are over 1 hour old
-old_tickers = set()
-for filename in os.listdir(stock_data_dir):
-    if filename.endswith(".json"):
-        filepath = os.path.join(stock_data_dir, filename)
-        file_age = time.time() - os.path.getmtime(filepath)
-        if file_age >= 3600:
-            ticker = filename.split('_')[0]
-            old_tickers.add(ticker)
-old_tickers = list(old_tickers)
-print(f"Found {len(old_tickers)} tickers from stock_data files.")
-
-# Combine and deduplicate the tickers
-all_tickers = list(set(hot_pick_tickers + top_gainers_tickers + most_active_tickers + trending_tickers + unique_tickers + etf_tickers + old_tickers))
-filtered_tickers = [ticker for ticker in all_tickers if ticker.isalpha()]
-
-print(f"Total unique tickers found: {len(filtered_tickers)}")
-
-# Path to your get_stock_data.py script
-script_path = './get_stock_data.py'
-
-# Loop through each ticker and call get_stock_data.py
-random.shuffle(filtered_tickers)
-for ticker in filtered_tickers:
-    json_file_path = os.path.join(stock_data_dir, f"{ticker}_Overall_Trend.json")
-
-    # Check if the file exists and is newer than 1 Hr 
-    if os.path.exists(json_file_path):
-        file_age = time.time() - os.path.getmtime(json_file_path)
-        if file_age < 3600:
-            print(f"Skipping {ticker}, file is newer than 1 hour.")
-            continue
-
-    # Call the get_stock_data.py script
-    subprocess.run(['python3', script_path, ticker])
-
-subprocess.run(['python3', './hot_picks.py', ''])
+        print("Failed to get Yahoo top gainers.")
+
+    # Fetch most active stocks
+    try:
+        with _timing.span('fetch.yahoo_most_active'):
+            most_active = si.get_day_most_active()
+        most_active_tickers = most_active['Symbol'].tolist()
+        print(f"Found {len(most_active_tickers)} tickers in most Yahoo active stocks.")
+    except:
+        print("Failed to get Yahoo most active.")
+        most_active_tickers = []
+
+    try:
+        url = "https://api.stocktwits.com/api/2/trending/symbols.json"
+        headers = {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+        }
+
+        with _timing.span('fetch.stocktwits_trending') as span:
+            response = requests.get(url, headers=headers)
+            span['bytes'] = len(response.content)
+        data = response.json()
+        trending_tickers = [symbol['symbol'] for symbol in data['symbols']]
+        print(f"Found {len(trending_tickers)} tickers in Stocktwits trending stocks.")
+    except Exception as e:
+        print(f"Failed to get Stocktwits trending tickers: {e}")
+
+    # Load unique tickers from the unique_tickers.json file
+    with open('unique_tickers.json', 'r') as file:
+        unique_tickers = json.load(file)
+    print(f"Found {len(unique_tickers)} tickers in unique_tickers.json.")
+
+    # Load hot pick tickers from the hot_picks.json file
+    with open('hot_picks.json', 'r') as file:
+        hot_picks = json.load(file)
+    # Initialize an empty list to hold all tickers
+    hot_pick_tickers = []
+
+    # Iterate over all keys in the JSON data
+    for key in hot_picks:
+        # Extend the all_tickers list with the values from each key
+        hot_pick_tickers.extend(hot_picks[key])
+
+    print(f"Found {len(hot_pick_tickers)} tickers in hot_picks.json.")
+
+
+    if _file_functions.get_file_age_in_minutes('etf_list', '') > 43200:
+        # Base URL for the leveraged equity ETFs (without the page parameter)
+        base_url = 'https://etfdb.com/etfs/leveraged/equity/#etfs&sort_name=ytd_percent_return&sort_order=desc'
+        try:
+            with _timing.span('fetch.etfdb_leveraged'):
+                etf_tickers = scrape_all_tickers(base_url)
+            with open('etf_list.json', 'w') as json_file:
+                json.dump(etf_tickers, json_file)
+            print(f"Saved {len(etf_tickers)} tickers for leveraged equity ETFs.")
+        except:
+            print('Failed to download new list of leveraged ETFs')
+
+    with open('etf_list.json', 'r') as file:
+        etf_tickers = json.load(file)
+    print(f"Loaded {len(etf_tickers)} tickers in leveraged equity ETFs.")
+
+    # Get tickers from stock_data documents that are over 1 hour old
+    with _timing.span('compute.stale_tickers'):
+        old_tickers = list(_data_store.tickers_older_than(3600))
+    print(f"Found {len(old_tickers)} tickers from stock_data files.")
+
+    # Combine and deduplicate the tickers
+    all_tickers = list(set(hot_pick_tickers + top_gainers_tickers + most_active_tickers + trending_tickers + unique_tickers + etf_tickers + old_tickers))
+    filtered_tickers = [ticker for ticker in all_tickers if ticker.isalpha()]
+
+    print(f"Total unique tickers found: {len(filtered_tickers)}")
+
+    # Path to your get_stock_data.py script
+    script_path = './get_stock_data.py'
+
+    # Loop through each ticker and call get_stock_data.py
+    random.shuffle(filtered_tickers)
+    # Imported only now, get_stock_data reads etf_list.json when it loads and has to see
+    # the list refreshed above
+    import get_stock_data
+    if args.pool == 'batch':
+        # analyze_overall_trend_batch refreshes the details of the stale tickers itself
+        get_stock_data.analyze_charts_batch(filtered_tickers)
+        get_stock_data.analyze_overall_trend_batch(filtered_tickers)
+    elif args.pool:
+        # Details of every stale ticker in a few batched requests, the pool's analyses then
+        # find them fresh instead of fetching them one by one
+        try:
+            get_stock_data.refresh_details(filtered_tickers)
+        except Exception as e:
+            print(f"Failed to refresh details: {e}")
+        run_pool(filtered_tickers, args.pool, args.workers)
+    else:
+        for ticker in filtered_tickers:
+            # Check if the Overall_Trend document exists and is newer than 1 Hr 
+            if _data_store.get_age_in_minutes(ticker, 'Overall_Trend') < 60:
+                print(f"Skipping {ticker}, file is newer than 1 hour.")
+                continue
+
+            # Call the get_stock_data.py script, it writes its own analyze_stock spans
+            with _timing.span('get_stock_data_process', ticker):
+                subprocess.run(['python3', script_path, ticker])
+
+    with _timing.span('hot_picks_process'):
+        subprocess.run(['python3', './hot_picks.py', ''])
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,15 @@
 #!python3
-import os
 import json
 import math
 import _app_functions
+import _data_store
 import _app_constants
 from datetime import datetime
 
+HOT_PICKS_FILE = "hot_picks.json"
+RANKS_FILE = "ranks.json"
+UNIQUE_TICKERS_FILE = "unique_tickers.json"
+
 def worst_trading_rank(unique_tickers, scores):
     rank = 0
     for ticker in unique_tickers:
@@ -14,41 +18,34 @@ def worst_trading_rank(unique_tickers, scores):
             rank = ticker_rank
     return 999999 #rank
 
-def get_Scores(directory):
+# Totals with a Score of every ticker, {"Overall_Trend": {ticker: totals}, "1Mo_5Mi": {...}}
+def load_scores():
     scores = {
         "Overall_Trend": {},
         "1Mo_5Mi": {}
     }
 
-    for filename in os.listdir(directory):
-        if filename.endswith("_Overall_Trend.json"):
-            score_type = "Overall_Trend"
-        elif filename.endswith("Chart_1Mo_5Mi.json"):
-            score_type = "1Mo_5Mi"
-        else:
-            continue
-
-        filepath = os.path.join(directory, filename)
-        with open(filepath, 'r') as f:
-            try:
-                ticker = filename.split('_')[0]
-                data = json.load(f)
-                if "Score" in data[ticker]["totals"]:
-                    scores[score_type][ticker] = data[ticker]["totals"]
-                    print(ticker,filename)
-            except Exception as e:
-                print(f"Error processing file {filename}: {e}, skipping.")
-                continue
+    # Totals of every ticker come from the score index in one read
+    score_index = _data_store.read_score_index()
+    for score_type, kind in [("Overall_Trend", "Overall_Trend"), ("1Mo_5Mi", "Chart_1Mo_5Mi")]:
+        for ticker, totals in score_index[kind].items():
+            if "Score" in totals:
+                scores[score_type][ticker] = totals
+    return scores
 
+# Rank the tickers in scores (sets scores["Overall_Trend"][ticker]["Rank"]) and return
+# the ranks.json content, ordered by rank
+def rank_scores(scores):
     # Create lists of tickers sorted by their score values
     Overall_Trend_Orders = sorted(scores["Overall_Trend"], key=lambda ticker: scores["Overall_Trend"][ticker]["Score"], reverse=True)
     Mo_5Mi_Orders = sorted(scores["1Mo_5Mi"], key=lambda ticker: scores["1Mo_5Mi"][ticker]["Score"], reverse=True)
+    Mo_5Mi_Ranks = {ticker: i + 1 for i, ticker in enumerate(Mo_5Mi_Orders)}
     
     # Calculate the rank for each ticker in the Overall_Trend_Orders list
     ranks = {}
     for i, ticker in enumerate(Overall_Trend_Orders):
         overall_rank = i + 1
-        mo_5mi_rank = Mo_5Mi_Orders.index(ticker) + 1 if ticker in Mo_5Mi_Orders else len(Mo_5Mi_Orders) + 1
+        mo_5mi_rank = Mo_5Mi_Ranks.get(ticker, len(Mo_5Mi_Orders) + 1)
         total_rank = overall_rank + mo_5mi_rank
         scores["Overall_Trend"][ticker]["Rank"] = total_rank
         ranks[ticker] = {
@@ -67,15 +64,20 @@ def get_Scores(directory):
         rank_info["totals"]["Rank"] = actual_rank
 
     # Convert sorted_ranks back to dictionary for output
-    sorted_ranks_dict = {ticker: rank_info for ticker, rank_info in sorted_ranks}
-    # Write the ranks to ranks.json
-    with open('ranks.json', 'w') as outfile:
-            json.dump(sorted_ranks_dict, outfile, indent=4)
-    
+    return {ticker: rank_info for ticker, rank_info in sorted_ranks}
+
+def create_ranks_json(ranks):
+    with open(RANKS_FILE, 'w') as outfile:
+            json.dump(ranks, outfile, indent=4)
+
+def get_Scores():
+    scores = load_scores()
+    create_ranks_json(rank_scores(scores))
     return scores
 
 def filter_scores(scores, unique_tickers, rank, trade_type='buy'):
     symbols = []
+    held_tickers = set(unique_tickers)
 
     if trade_type == 'sell':
         for ticker in unique_tickers:
@@ -84,15 +86,14 @@ def filter_scores(scores, unique_tickers, rank, trade_type='buy'):
         symbols = [ticker for ticker, _ in sorted_tickers]
         return symbols
     for ticker in scores["Overall_Trend"].keys():
-        if trade_type == 'buy' and ticker in unique_tickers:
+        if trade_type == 'buy' and ticker in held_tickers:
             continue
-        if trade_type == 'hold' and ticker not in unique_tickers:
+        if trade_type == 'hold' and ticker not in held_tickers:
             continue
         Overall_Rank = scores["Overall_Trend"].get(ticker, {}).get("Rank", 0)
         Overall_Trend = scores["Overall_Trend"].get(ticker, {}).get("Overall_Trend", "Downward")
         Sell_Orders = scores["1Mo_5Mi"].get(ticker, {}).get("Sell_Orders", 0)
         Recommendation = scores["Overall_Trend"].get(ticker, {}).get("Recommendation", "None")
-        ai_trade_status = _app_functions.ai_trade_status(ticker)
         ma__trade_status = scores["Overall_Trend"].get(ticker, {}).get('MA_Analysis', {}).get('Trade_Status', 'Do Not Trade')
         
         earnings_date = scores["Overall_Trend"].get(ticker, {}).get('Earnings_Date', 'None')
@@ -113,8 +114,9 @@ def filter_scores(scores, unique_tickers, rank, trade_type='buy'):
                 pass
 
         cik = scores["Overall_Trend"].get(ticker, {}).get("CIK", None)
-        if ((cik.isdigit() or cik == 'ETF') and ai_trade_status and ma__trade_status == 'Trade' and "Buy" in Recommendation and not earnings_soon and Overall_Trend == "Upward" and Overall_Rank <= rank and 
-            (trade_type != 'buy' or (trade_type == 'buy' and Sell_Orders > 4))):
+        # The AI status reads files, so it is checked last
+        if ((cik.isdigit() or cik == 'ETF') and ma__trade_status == 'Trade' and "Buy" in Recommendation and not earnings_soon and Overall_Trend == "Upward" and Overall_Rank <= rank and 
+            (trade_type != 'buy' or (trade_type == 'buy' and Sell_Orders > 4)) and _app_functions.ai_trade_status(ticker)):
             symbols.append((ticker, scores["1Mo_5Mi"].get(ticker, {})))
 
     sorted_tickers = sorted(symbols, key=lambda x: x[1].get("Score", 0), reverse=True)
@@ -128,25 +130,35 @@ def create_hot_picks_json(sell_symbols, buy_symbols, hold_symbols):
         "hold_symbols": hold_symbols
     }
 
-    with open("hot_picks.json", "w") as file:
+    with open(HOT_PICKS_FILE, "w") as file:
         json.dump(hot_picks, file, indent=4)
+    return hot_picks
 
-def main():
-    directory = 'stock_data'
-    scores = get_Scores(directory)
+# Ranking API for app.py and main(): returns (hot_picks, ranks) as they are written to
+# hot_picks.json and ranks.json for the tickers held in unique_tickers
+def get_hot_picks(unique_tickers, write_files=True):
+    scores = load_scores()
+    ranks = rank_scores(scores)
     print('Getting Hot Picks')
 
-    with open('unique_tickers.json', 'r') as file:
-        unique_tickers = json.load(file)
-
     rank = worst_trading_rank(unique_tickers, scores)
     buy_symbols = filter_scores(scores, unique_tickers, rank, 'buy')
     hold_symbols = filter_scores(scores, unique_tickers, rank, 'hold')
-    sell_symbols_unsorted = [ticker for ticker in unique_tickers if ticker not in hold_symbols]
+    hold_set = set(hold_symbols)
+    sell_symbols_unsorted = [ticker for ticker in unique_tickers if ticker not in hold_set]
     sell_symbols = filter_scores(scores, sell_symbols_unsorted, rank, 'sell') 
 
-    # Create Hot Picks JSON file
-    create_hot_picks_json(sell_symbols, buy_symbols, hold_symbols)
+    if write_files:
+        create_ranks_json(ranks)
+        # Create Hot Picks JSON file
+        return create_hot_picks_json(sell_symbols, buy_symbols, hold_symbols), ranks
+    return {"sell_symbols": sell_symbols, "buy_symbols": buy_symbols, "hold_symbols": hold_symbols}, ranks
+
+def main():
+    with open(UNIQUE_TICKERS_FILE, 'r') as file:
+        unique_tickers = json.load(file)
+
+    get_hot_picks(unique_tickers)
 
 if __name__ == "__main__":
     main()